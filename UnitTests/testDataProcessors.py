@@ -8,6 +8,7 @@ from sqdtoolz.HAL.Processors.CPU.CPU_Integrate import*
 from sqdtoolz.HAL.Processors.CPU.CPU_Max import*
 from sqdtoolz.HAL.Processors.CPU.CPU_ConstantArithmetic import*
 from sqdtoolz.HAL.Processors.CPU.CPU_ChannelArithmetic import*
+from sqdtoolz.HAL.Decisions.DEC_SVM import DEC_SVM
 TEST_CPU = True
 
 try:
@@ -41,6 +42,8 @@ import unittest
 
 import operator #for ConstantArithmetic
 import scipy.fft
+import scipy.signal
+import scipy.ndimage
 class TestCPU(unittest.TestCase):
     ERR_TOL = 5e-7
 
@@ -246,6 +249,86 @@ class TestCPU(unittest.TestCase):
 
         self.cleanup()
 
+    def test_FIR(self):
+        self.initialise()
+        data_size = 1001
+        raw_data = [np.random.rand(4, 3, data_size), np.random.rand(4, 3, data_size)]
+        def run_proc(fir_stage):
+            new_proc = ProcessorCPU('cpu_test', self.lab)
+            new_proc.reset_pipeline()
+            new_proc.add_stage(fir_stage)
+            new_proc.push_data({
+                'parameters' : ['repetition', 'segment', 'sample'],
+                'data' : { 'ch1' : raw_data[0].copy(), 'ch2' : raw_data[1].copy() },
+                'misc' : {'SampleRates' : [1,1]}
+            })
+            return new_proc.get_all_data()
+        #
+        for taps in [8, 41, 2048, None]:
+            fir_specs = [{'Type' : 'low', 'Taps' : taps, 'fc' : 0.01, 'Win' : 'hamming'}, {'Type' : 'high', 'Taps' : taps, 'fc' : 0.1, 'Win' : ('kaiser', 4.0)}]
+            num_taps = data_size if taps == None else taps
+            for mode in ['reflect', 'same', 'valid']:
+                #Compare the direct and FFT-based convolution
+                leDataDirect = run_proc(CPU_FIR(fir_specs, mode, 'direct'))
+                leDataFFT = run_proc(CPU_FIR(fir_specs, mode, 'fft'))
+                for ch_ind, cur_ch in enumerate(['ch1', 'ch2']):
+                    assert leDataFFT['data'][cur_ch].shape == leDataDirect['data'][cur_ch].shape, "CPU FIR gives different shapes across the convolution methods."
+                    if leDataFFT['data'][cur_ch].size == 0:
+                        assert num_taps > data_size, "CPU FIR gives an empty output."
+                        continue
+                    assert self.arr_equality(leDataFFT['data'][cur_ch], leDataDirect['data'][cur_ch]), "CPU FIR gives different results across the convolution methods."
+                    #Check against the actual convolutions
+                    fir_coeffs = CPU_FIR.design_fir(1, fir_specs[ch_ind]['Type'], num_taps, fir_specs[ch_ind]['Win'], 0.01*(1+9*ch_ind))
+                    if mode == 'reflect':
+                        expected = scipy.ndimage.convolve1d(raw_data[ch_ind], fir_coeffs)
+                    elif mode == 'same':
+                        expected = scipy.ndimage.convolve1d(raw_data[ch_ind], fir_coeffs, mode='constant')
+                    else:
+                        expected = np.array([[np.convolve(raw_data[ch_ind][r,s], fir_coeffs, mode='valid') for s in range(3)] for r in range(4)])
+                    assert self.arr_equality(leDataFFT['data'][cur_ch], expected), f"CPU FIR gives incorrect results in the '{mode}' mode."
+        #
+        #Check that the filter designs are shared across the stages
+        fir_specs = [{'Type' : 'low', 'Taps' : 40, 'fc' : 0.01, 'Win' : 'hamming'}]*2
+        assert CPU_FIR.design_fir(1, 'low', 40, 'hamming', 0.01) is CPU_FIR.design_fir(1, 'low', 40, 'hamming', 0.01), "CPU FIR does not cache the filter designs."
+        #
+        new_stage = CPU_FIR.fromConfigDict(CPU_FIR(fir_specs, 'valid', 'fft')._get_current_config())
+        assert new_stage._get_current_config() == CPU_FIR(fir_specs, 'valid', 'fft')._get_current_config(), "CPU FIR did not reload its configuration."
+        self.cleanup()
+
+    def test_DDCFIRDecimate(self):
+        self.initialise()
+        data_size = 1001
+        num_reps = 6
+        num_segs = 3
+        raw_data = [np.random.rand(num_reps, num_segs, data_size), np.random.rand(num_reps, num_segs, data_size)]
+        def run_proc(stages):
+            new_proc = ProcessorCPU('cpu_test', self.lab)
+            new_proc.reset_pipeline()
+            for cur_stage in stages:
+                new_proc.add_stage(cur_stage)
+            new_proc.push_data({
+                'parameters' : ['repetition', 'segment', 'sample'],
+                'data' : { 'ch1' : raw_data[0].copy(), 'ch2' : raw_data[1].copy() },
+                'misc' : {'SampleRates' : [1,1]}
+            })
+            return new_proc.get_all_data()
+        #
+        #Check that the fused stage gives the same result as the unfused pipeline (including filters longer than the signal)
+        for ddc_freqs, taps, deci_fac in [([0.14, 0.1], 40, 10), ([0.14, None], 41, 7), ([0.1, 0.2], 2048, 3), ([0.2, 0.3], 16, 1)]:
+            fir_specs = [{'Type' : 'low', 'Taps' : taps, 'fc' : 0.01*(m+1), 'Win' : 'hamming'} for m in range(4)]
+            unfused = run_proc([CPU_DDC(ddc_freqs), CPU_FIR(fir_specs), CPU_Decimation('sample', deci_fac)])
+            fused = run_proc([CPU_DDCFIRDecimate(ddc_freqs, fir_specs, deci_fac)])
+            assert list(fused['data'].keys()) == list(unfused['data'].keys()), "CPU DDCFIRDecimate gives different channels to the unfused pipeline."
+            for cur_ch in unfused['data']:
+                assert self.arr_equality(fused['data'][cur_ch], unfused['data'][cur_ch]), "CPU DDCFIRDecimate does not yield the same result as the unfused pipeline."
+            assert fused['misc']['SampleRates'] == unfused['misc']['SampleRates'], "CPU DDCFIRDecimate does not give the correct sample rates."
+        #
+        #Check the configuration round-trip
+        cur_stage = CPU_DDCFIRDecimate([0.14, 0.1], [{'Type' : 'low', 'Taps' : 40, 'fc' : 0.01, 'Win' : 'hamming'}]*4, 10)
+        new_stage = CPU_DDCFIRDecimate.fromConfigDict(cur_stage._get_current_config())
+        assert new_stage._get_current_config() == cur_stage._get_current_config(), "CPU DDCFIRDecimate did not reload its configuration."
+        self.cleanup()
+
     def test_Mean(self):
         self.initialise()
         data_size = 1024#*1024*4
@@ -333,6 +416,71 @@ class TestCPU(unittest.TestCase):
         assert np.abs(expected_ans - fin_data['data']['ch1']) < 1e-16, "CPU Mean does not yield expected result."
         self.cleanup()
 
+    def test_RunningStats(self):
+        self.initialise()
+        data_size = 64
+        num_reps = 45
+        num_segs = 3
+        raw_data = [np.random.rand(num_reps, num_segs, data_size)+5, np.random.rand(num_reps, num_segs, data_size)]
+        def push_blocks(proc):
+            for r in range(0, num_reps, 7):
+                proc.push_data({
+                    'parameters' : ['repetition', 'segment', 'sample'],
+                    'data' : { 'ch1' : raw_data[0][r:r+7], 'ch2' : raw_data[1][r:r+7] },
+                    'misc' : {'SampleRates' : [1,1]}
+                })
+            return proc.get_all_data()
+        #
+        new_proc = ProcessorCPU('cpu_test', self.lab)
+        for num_workers in [0, 3]:
+            new_proc.NumWorkers = num_workers
+            #Test the running mean in the main pipeline (followed by another stage)
+            new_proc.reset_pipeline()
+            new_proc.add_stage(CPU_RunningMean('repetition'))
+            new_proc.add_stage(CPU_Mean('sample'))
+            for m in range(2):
+                leData = push_blocks(new_proc)
+                assert leData['parameters'] == ['segment'], "CPU RunningMean did not remove the averaged parameter."
+                assert leData['misc']['Count'] == num_reps, "CPU RunningMean did not count the correct number of repetitions."
+                for ch_ind, cur_ch in enumerate(['ch1', 'ch2']):
+                    assert self.arr_equality(leData['data'][cur_ch], np.mean(raw_data[ch_ind], axis=(0,2))), "CPU RunningMean does not give the correct mean."
+            #Test the running mean and variance
+            new_proc.reset_pipeline()
+            new_proc.add_stage(CPU_RunningMeanVariance('repetition'))
+            leData = push_blocks(new_proc)
+            assert leData['parameters'] == ['segment', 'sample'], "CPU RunningMeanVariance did not remove the averaged parameter."
+            assert list(leData['data'].keys()) == ['ch1_repetition_Mean', 'ch1_repetition_Var', 'ch2_repetition_Mean', 'ch2_repetition_Var'], "CPU RunningMeanVariance did not give the correct channels."
+            for ch_ind, cur_ch in enumerate(['ch1', 'ch2']):
+                assert self.arr_equality(leData['data'][f'{cur_ch}_repetition_Mean'], np.mean(raw_data[ch_ind], axis=0)), "CPU RunningMeanVariance does not give the correct mean."
+                assert self.arr_equality(leData['data'][f'{cur_ch}_repetition_Var'], np.var(raw_data[ch_ind], axis=0)), "CPU RunningMeanVariance does not give the correct variance."
+        new_proc.NumWorkers = 0
+        #
+        #Test as an end-stage
+        new_proc.reset_pipeline()
+        new_proc.add_stage_end(CPU_RunningMeanVariance('repetition'))
+        leData = push_blocks(new_proc)
+        assert self.arr_equality(leData['data']['ch2_repetition_Var'], np.var(raw_data[1], axis=0)), "CPU RunningMeanVariance does not give the correct variance as an end-stage."
+        #
+        #Test complex channels (e.g. after a DDC) - the variance must be real as in np.var
+        raw_data = [(np.random.rand(num_reps, num_segs, data_size)-0.5)*3 + 1j*np.random.rand(num_reps, num_segs, data_size), np.random.rand(num_reps, num_segs, data_size)*(1+2j)]
+        for cur_stage in [new_proc.add_stage, new_proc.add_stage_end]:
+            new_proc.reset_pipeline()
+            cur_stage(CPU_RunningMeanVariance('repetition'))
+            leData = push_blocks(new_proc)
+            for ch_ind, cur_ch in enumerate(['ch1', 'ch2']):
+                assert self.arr_equality(leData['data'][f'{cur_ch}_repetition_Mean'], np.mean(raw_data[ch_ind], axis=0)), "CPU RunningMeanVariance does not give the correct mean on complex data."
+                assert not np.iscomplexobj(leData['data'][f'{cur_ch}_repetition_Var']), "CPU RunningMeanVariance gave a complex variance on complex data."
+                assert self.arr_equality(leData['data'][f'{cur_ch}_repetition_Var'], np.var(raw_data[ch_ind], axis=0)), "CPU RunningMeanVariance does not give the correct variance on complex data."
+        #
+        #Check that it cannot be used across other parameters
+        new_proc.reset_pipeline()
+        new_proc.add_stage(CPU_RunningMean('segment'))
+        self.assertRaises(AssertionError, push_blocks, new_proc)
+        #
+        new_proc2 = ProcessorCPU.fromConfigDict({**new_proc._get_current_config(), 'Name' : 'cpu_test2'}, self.lab)
+        assert isinstance(new_proc2.pipeline[0], CPU_RunningMean) and new_proc2.pipeline[0]._param_name == 'segment', "CPU RunningMean did not reload its configuration."
+        self.cleanup()
+
     def test_MeanBlock(self):
         self.initialise()
 
@@ -1164,6 +1312,112 @@ class TestCPU(unittest.TestCase):
 
         self.cleanup()
 
+    def test_PSD(self):
+        self.initialise()
+        data_size = 4096
+        num_reps = 24
+        sample_rate = 2e3
+        raw_data = [np.random.normal(size=(num_reps, 2, data_size)), np.random.normal(size=(num_reps, 2, data_size))]
+        def push_blocks(proc, num_chs):
+            for r in range(0, num_reps, 5):
+                proc.push_data({
+                    'parameters' : ['repetition', 'segment', 'sample'],
+                    'data' : { f'ch{m+1}' : raw_data[m][r:r+5] for m in range(num_chs) },
+                    'misc' : {'SampleRates' : [sample_rate]*num_chs}
+                })
+            return proc.get_all_data()
+        #
+        new_proc = ProcessorCPU('cpu_test', self.lab)
+        for num_chs in [1, 2]:
+            signal = raw_data[0] if num_chs == 1 else raw_data[0] + 1j*raw_data[1]
+            for overlap, window, scaling in [(0.5, 'hann', 'density'), (0, 'boxcar', 'spectrum'), (0.75, 'hamming', 'density')]:
+                #Compare against the Welch estimate in scipy (with no detrending)
+                freqs, psd = scipy.signal.welch(signal, sample_rate, window, 256, int(overlap*256), detrend=False, return_onesided=(num_chs==1), scaling=scaling)
+                new_proc.reset_pipeline()
+                new_proc.add_stage(CPU_PSD(256, overlap, window, scaling=scaling))
+                leData = push_blocks(new_proc, num_chs)
+                assert list(leData['data'].keys()) == ['psd'], "CPU PSD did not give the correct output channels."
+                assert leData['parameters'] == ['repetition', 'segment', 'fft_frequency'], "CPU PSD did not give the correct parameters."
+                assert self.arr_equality(leData['parameter_values']['fft_frequency'], freqs), "CPU PSD did not give the correct frequencies."
+                assert self.arr_equality_pct(leData['data']['psd'], psd), "CPU PSD does not match the Welch estimate."
+                #Check the PSD averaged across repetitions (in the main pipeline and streamed)
+                new_proc.reset_pipeline()
+                new_proc.add_stage(CPU_PSD(256, overlap, window, average_reps=True, scaling=scaling))
+                new_proc.NumWorkers = 2
+                leData = push_blocks(new_proc, num_chs)
+                new_proc.NumWorkers = 0
+                assert leData['parameters'] == ['segment', 'fft_frequency'], "CPU PSD did not average across the repetitions."
+                assert leData['misc']['Count'] == num_reps, "CPU PSD did not count the correct number of repetitions."
+                assert self.arr_equality_pct(leData['data']['psd'], np.mean(psd, axis=0)), "CPU PSD does not match the Welch estimate when averaging across repetitions."
+        #
+        new_proc2 = ProcessorCPU.fromConfigDict({**new_proc._get_current_config(), 'Name' : 'cpu_test2'}, self.lab)
+        assert new_proc2.pipeline[0]._get_current_config() == new_proc.pipeline[0]._get_current_config(), "CPU PSD did not reload its configuration."
+        self.cleanup()
+
+    def test_kMeans(self):
+        self.initialise()
+        centroids = np.array([[0.0,0.0], [3.0,3.0], [-3.0,4.0]])
+        def get_shots(num_shots):
+            states = np.random.randint(3, size=num_shots)
+            shots = centroids[states] + np.random.normal(size=(num_shots,2))*0.3
+            return states, {
+                'parameters' : ['repetition'],
+                'data' : { 'CH1' : shots[:,0], 'CH2' : shots[:,1] },
+                'misc' : {'SampleRates' : [1,1]}
+            }
+        def check_states(states, leData):
+            #Map the fitted states onto the original states (the cluster order is arbitrary)
+            mapping = [np.bincount(leData['data']['State'][states == x], minlength=3).argmax() for x in range(3)]
+            assert len(set(mapping)) == 3, "CPU kMeans did not classify the states correctly."
+            assert np.mean(np.array(mapping)[states] == leData['data']['State']) > 0.99, "CPU kMeans did not classify the states correctly."
+        #
+        new_proc = ProcessorCPU('cpu_test', self.lab)
+        for cur_mode in ['fit', 'minibatch', 'refit']:
+            new_proc.reset_pipeline()
+            new_proc.add_stage(CPU_kMeans(3, 'repetition', cur_mode, seed=1))
+            for m in range(3):
+                states, cur_data = get_shots(5000)
+                new_proc.push_data(cur_data)
+                check_states(states, new_proc.get_all_data())
+            if cur_mode == 'fit':
+                fitted = new_proc.pipeline[0].Centroids
+                assert np.allclose(np.sort(fitted, axis=0), np.sort(centroids, axis=0), atol=0.05), "CPU kMeans did not fit the correct centroids."
+        #
+        #Check that the fitted centroids are kept in the configuration (i.e. no refitting on reloading)
+        new_proc.reset_pipeline()
+        new_proc.add_stage(CPU_kMeans(3, 'repetition', 'fit', centroids=centroids))
+        new_proc2 = ProcessorCPU.fromConfigDict({**new_proc._get_current_config(), 'Name' : 'cpu_test2'}, self.lab)
+        assert self.arr_equality(new_proc2.pipeline[0].Centroids, centroids), "CPU kMeans did not reload its centroids from the configuration."
+        states, cur_data = get_shots(1000)
+        new_proc2.push_data(cur_data)
+        assert np.mean(new_proc2.get_all_data()['data']['State'] == states) > 0.99, "CPU kMeans did not classify with the reloaded centroids."
+        self.cleanup()
+
+    def test_SVM(self):
+        self.initialise()
+        shots = np.random.rand(2, 10, 1000)*10 - 5
+        eqns = [(1,0,0), (1,1,2), (0,-1,-1)]
+        expected = sum([((a*shots[0]+b*shots[1]) > c).astype(int) << m for m, (a,b,c) in enumerate(eqns)])
+        #
+        new_proc = ProcessorCPU('cpu_test', self.lab)
+        new_proc.reset_pipeline()
+        new_proc.add_stage(CPU_SVM([1,0,0,1], [eqns, DEC_SVM(eqns[:2])], True))
+        new_proc.push_data({
+            'parameters' : ['repetition', 'segment'],
+            'data' : { 'CH1' : shots[0], 'CH2' : shots[1] },
+            'misc' : {'SampleRates' : [1,1]}
+        })
+        leData = new_proc.get_all_data()
+        assert list(leData['data'].keys()) == ['State_CH2CH1', 'State_CH1CH2'], "CPU SVM did not give the correct output channels."
+        assert np.array_equal(leData['data']['State_CH1CH2'], expected & 3), "CPU SVM did not give the correct states."
+        expected = sum([((a*shots[1]+b*shots[0]) > c).astype(int) << m for m, (a,b,c) in enumerate(eqns)])
+        assert np.array_equal(leData['data']['State_CH2CH1'], expected), "CPU SVM did not give the correct states."
+        assert leData['misc']['SampleRates'] == [1,1], "CPU SVM did not give the correct sample rates."
+        #
+        new_proc2 = ProcessorCPU.fromConfigDict({**new_proc._get_current_config(), 'Name' : 'cpu_test2'}, self.lab)
+        assert new_proc2.pipeline[0]._get_current_config() == new_proc.pipeline[0]._get_current_config(), "CPU SVM did not reload its configuration."
+        self.cleanup()
+
     def test_Duplicate(self):
         self.initialise()
 
@@ -1330,6 +1584,135 @@ class TestCPU(unittest.TestCase):
 
 
 
+    def test_Streaming(self):
+        self.initialise()
+        data_size = 1024
+        num_reps = 40
+        num_segs = 3
+        raw_data = [np.random.rand(num_reps, num_segs, data_size), np.random.rand(num_reps, num_segs, data_size)]
+        def push_blocks(proc):
+            for r in range(0, num_reps, 7):
+                proc.push_data({
+                    'parameters' : ['repetition', 'segment', 'sample'],
+                    'data' : { 'ch1' : raw_data[0][r:r+7], 'ch2' : raw_data[1][r:r+7] },
+                    'misc' : {'SampleRates' : [1,1]}
+                })
+            return proc.get_all_data()
+        #
+        new_proc = ProcessorCPU('cpu_test', self.lab)
+        new_proc.reset_pipeline()
+        new_proc.add_stage(CPU_DDC([0.14, 0.1]))
+        new_proc.add_stage(CPU_FIR([{'Type' : 'low', 'Taps' : 40, 'fc' : 0.01, 'Win' : 'hamming'}]*4))
+        new_proc.add_stage(CPU_Mean('sample'))
+        new_proc.add_stage_end(CPU_Mean('repetition'))
+        serial_data = push_blocks(new_proc)
+        #
+        new_proc.NumWorkers = 3
+        for m in range(3):
+            stream_data = push_blocks(new_proc)
+            assert list(stream_data['data'].keys()) == list(serial_data['data'].keys()), "CPU streaming processor gives different channels to the serial processor."
+            for cur_ch in serial_data['data']:
+                assert self.arr_equality(stream_data['data'][cur_ch], serial_data['data'][cur_ch]), "CPU streaming processor does not yield the same result as the serial processor."
+        #
+        #Test without an end-stage (i.e. checking the packet order is preserved)
+        new_proc.reset_pipeline()
+        new_proc.add_stage(CPU_Mean('sample'))
+        stream_data = push_blocks(new_proc)
+        assert self.arr_equality(stream_data['data']['ch1'], np.mean(raw_data[0], axis=-1)), "CPU streaming processor does not preserve the order of the data packets."
+        assert self.arr_equality(stream_data['data']['ch2'], np.mean(raw_data[1], axis=-1)), "CPU streaming processor does not preserve the order of the data packets."
+        #
+        #Check that the number of workers is saved in the configuration
+        new_proc2 = ProcessorCPU.fromConfigDict({**new_proc._get_current_config(), 'Name' : 'cpu_test2'}, self.lab)
+        assert new_proc2.NumWorkers == 3, "CPU processor did not load the number of workers from its configuration."
+        new_proc.NumWorkers = 0
+        new_proc2.NumWorkers = 0
+        self.cleanup()
+
+    def test_Preallocation(self):
+        self.initialise()
+        data_size = 64
+        num_reps = 40
+        num_segs = 3
+        raw_data = np.random.rand(num_reps, num_segs, data_size)
+        def push_blocks(proc, block_size, exp_reps):
+            proc.set_expected_repetitions(exp_reps)
+            for r in range(0, num_reps, block_size):
+                proc.push_data({
+                    'parameters' : ['repetition', 'segment', 'sample'],
+                    'data' : { 'ch1' : raw_data[r:r+block_size] },
+                    'misc' : {'SampleRates' : [1]}
+                })
+            return proc.get_all_data()
+        #
+        new_proc = ProcessorCPU('cpu_test', self.lab)
+        new_proc.reset_pipeline()
+        new_proc.add_stage(CPU_Mean('sample'))
+        for num_workers in [0, 2]:
+            new_proc.NumWorkers = num_workers
+            #Test with the exact expected repetitions, without a hint, with an overestimate and with an underestimate
+            for exp_reps in [num_reps, None, num_reps+5, num_reps-10]:
+                for block_size in [1, 8, 40]:
+                    leData = push_blocks(new_proc, block_size, exp_reps)
+                    assert leData['data']['ch1'].shape == (num_reps, num_segs), "CPU processor did not collate the correct number of repetitions."
+                    assert self.arr_equality(leData['data']['ch1'], np.mean(raw_data, axis=-1)), "CPU processor did not collate the data packets correctly."
+        new_proc.NumWorkers = 0
+        #
+        #Test with a stage that changes the number of repetitions (i.e. collapsing blocks of 4 repetitions)
+        new_proc.reset_pipeline()
+        new_proc.add_stage(CPU_MeanBlock('repetition', 4))
+        leData = push_blocks(new_proc, 8, num_reps)
+        assert leData['data']['ch1'].shape == (num_reps//4, num_segs, data_size), "CPU processor did not collate the correct number of repetitions."
+        assert self.arr_equality(leData['data']['ch1'], np.mean(raw_data.reshape(num_reps//4, 4, num_segs, data_size), axis=1)), "CPU processor did not collate the data packets correctly."
+        self.cleanup()
+
+    def test_UnsignedRawData(self):
+        self.initialise()
+        #Raw ADC samples may be pushed as integer (e.g. uint16 or int16) views of the readout buffers - arithmetic must not wrap around
+        raw_data = np.random.randint(0, 2**16, size=(10, 3, 48)).astype(np.uint16)
+        raw_data2 = np.random.randint(0, 2**16, size=(10, 3, 48)).astype(np.uint16)
+        raw_data_orig = raw_data.copy()
+        def get_pkt():
+            return {
+                'parameters' : ['repetition', 'segment', 'sample'],
+                'data' : { 'ch1' : raw_data[:], 'ch2' : raw_data2[:] },
+                'misc' : {'SampleRates' : [1,1], 'RawDataType' : 'uint16'}
+            }
+        new_proc = ProcessorCPU('cpu_test', self.lab)
+        new_proc.reset_pipeline()
+        new_proc.add_stage(CPU_ConstantArithmetic(2**15,'-',None))
+        new_proc.push_data(get_pkt())
+        fin_data = new_proc.get_all_data()
+        assert self.arr_equality(fin_data['data']['ch1'], raw_data.astype(np.int64) - 2**15), "CPU Constant-Arithmetic wraps around on unsigned data."
+        assert np.array_equal(raw_data, raw_data_orig), "CPU Constant-Arithmetic modified the pushed raw data in-place."
+        #
+        new_proc.reset_pipeline()
+        new_proc.add_stage(CPU_ChannelArithmetic([0,1],'-'))
+        new_proc.push_data(get_pkt())
+        fin_data = new_proc.get_all_data()
+        assert self.arr_equality(fin_data['data']['ch1_-_ch2'], raw_data.astype(np.int64) - raw_data2), "CPU Channel-Arithmetic wraps around on unsigned data."
+        #
+        #Signed int16 samples (e.g. from the M4i) must not overflow either
+        raw_data = np.random.randint(-2**15, 2**15, size=(10, 3, 48)).astype(np.int16)
+        raw_data2 = np.random.randint(-2**15, 2**15, size=(10, 3, 48)).astype(np.int16)
+        new_proc.reset_pipeline()
+        new_proc.add_stage(CPU_AmpPhs([0,1]))
+        new_proc.push_data(get_pkt())
+        fin_data = new_proc.get_all_data()
+        exp_amp = np.sqrt(raw_data.astype(np.float64)**2 + raw_data2.astype(np.float64)**2)
+        assert self.arr_equality(fin_data['data']['Amp_ch1ch2'], exp_amp), "CPU Amplitude-Phase overflows on int16 data."
+        #
+        #Long integrations of int16 samples must not overflow (e.g. the platform int being int32 on Windows)
+        raw_data = np.full((2, 3, 70000), 2**15-1, dtype=np.int16)
+        raw_data2 = np.random.randint(-2**15, 2**15, size=(2, 3, 70000)).astype(np.int16)
+        new_proc.reset_pipeline()
+        new_proc.add_stage(CPU_Integrate('sample'))
+        new_proc.push_data(get_pkt())
+        fin_data = new_proc.get_all_data()
+        assert fin_data['data']['ch1'].dtype == np.float64, "CPU Integrate did not sum the int16 data in float64."
+        assert self.arr_equality(fin_data['data']['ch1'], np.sum(raw_data.astype(np.float64), axis=2)), "CPU Integrate overflows on int16 data."
+        assert self.arr_equality(fin_data['data']['ch2'], np.sum(raw_data2.astype(np.float64), axis=2)), "CPU Integrate overflows on int16 data."
+        self.cleanup()
+
 class TestGPU(unittest.TestCase):
     ERR_TOL = 5e-5
 
@@ -9,11 +9,14 @@ from sqdtoolz.HAL.GENmwSource import*
 from sqdtoolz.HAL.WaveformGeneric import*
 from sqdtoolz.HAL.WaveformMapper import*
 
+from sqdtoolz.Utilities.QubitGates import TransmonGates
+
 import numpy as np
 
 import shutil
 
 import unittest
+import unittest.mock
 
 class TestHALInstantiation(unittest.TestCase):
     ENABLE_MANUAL_COMPONENTS = False
@@ -658,6 +661,137 @@ class TestHALInstantiation(unittest.TestCase):
         assert assert_found, "Function update_waveforms failed to trigger an assertion error when feeding waveforms of different size while demanding reference marker segments amongst each other."
 
         self.cleanup()
+    def test_PrepareChangeTracking(self):
+        self.initialise()
+        awg_wfm = self.lab.HAL('Wfm1')
+        hal_mw = self.lab.HAL('MW-Src')
+
+        awg_wfm.clear_segments()
+        awg_wfm.add_waveform_segment(WFS_Gaussian("init", None, 20e-9, 0.5))
+        awg_wfm.add_waveform_segment(WFS_Constant("zero", None, 44e-9, 0.0))
+        hal_mw.Frequency = 5e9
+        hal_mw.Power = 10
+        expConfig = ExperimentConfiguration('testConf', self.lab, 1.0, ['ddg', 'Wfm1', 'MW-Src'], 'dum_acq')
+
+        #Track the activations by wrapping the activate functions of the HALs
+        activated = []
+        for cur_hal in [awg_wfm, hal_mw]:
+            cur_hal.activate = (lambda x, y: lambda: (activated.append(x.Name), y()))(cur_hal, cur_hal.activate)
+        expConfig.init_instruments()
+        expConfig.prepare_instruments()
+        assert sorted(activated) == ['MW-Src', 'Wfm1'], "All HALs must be activated on the first preparation."
+        #Unchanged HALs should be skipped
+        activated.clear()
+        expConfig.prepare_instruments()
+        assert activated == [], "Unchanged HALs were activated again."
+        #Only the changed HAL should be activated
+        hal_mw.Frequency = 6e9
+        expConfig.prepare_instruments()
+        assert activated == ['MW-Src'], "Only the changed HAL should be activated."
+        activated.clear()
+        awg_wfm.get_output_channel(0).Output = False
+        expConfig.prepare_instruments()
+        assert activated == ['Wfm1'] and awg_wfm.get_output_channel(0).Output, "Changing the output of an AWG channel did not reactivate the AWG."
+        #Waveform changes are still detected (even if the AWG is not activated again)
+        activated.clear()
+        awg_wfm.get_waveform_segment('init').Amplitude = 0.25
+        expConfig.prepare_instruments()
+        assert activated == [], "The AWG was activated on changing a waveform segment."
+        assert np.max(self.lab._get_instrument('virAWG').get_programmed_waveform('CH1')) < 0.3, "Changing a waveform segment did not reprogram the AWG."
+        #Forced and post-makesafe preparation should activate all HALs
+        expConfig.prepare_instruments(force=True)
+        assert sorted(activated) == ['MW-Src', 'Wfm1'], "Forced preparation did not activate all HALs."
+        activated.clear()
+        expConfig.makesafe_instruments()
+        expConfig.prepare_instruments()
+        assert sorted(activated) == ['MW-Src', 'Wfm1'], "Preparation after makesafe_instruments did not activate all HALs."
+
+        #Check that init_instruments only pushes the changed properties
+        set_configs = []
+        hal_mw._set_current_config = (lambda y: lambda x, lab: (set_configs.append(x), y(x, lab)))(hal_mw._set_current_config)
+        expConfig.init_instruments()
+        assert set_configs == [] and hal_mw.Frequency == 5e9, "The properties of the unchanged HAL were set again."
+        hal_mw.Power = -10
+        hal_mw.Frequency = 7e9
+        expConfig.init_instruments()
+        assert set_configs == [], "Only the changed properties should be set on the HAL."
+        assert hal_mw.Power == 10 and hal_mw.Frequency == 5e9, "The changed properties were not restored."
+
+        self.cleanup()
+
+    def test_BatchedCircuits(self):
+        self.initialise()
+        hal_acq = self.lab.HAL('dum_acq')
+        awg_wfm = self.lab.HAL('Wfm1')
+        hal_ddg = self.lab.HAL('ddg')
+        hal_ddg.RepetitionTime = 3e-6
+        awg_wfm.set_valid_total_time(2.5e-6)
+        awg_wfm.set_trigger_source_all(hal_ddg.get_trigger_output('A'))
+        hal_acq.set_trigger_source(awg_wfm.get_output_channel(0).marker(0))
+        hal_acq.NumSegments = 1
+
+        expConfig = ExperimentConfiguration('testConf', self.lab, 3e-6, ['ddg', 'Wfm1'], 'dum_acq')
+        waveform_mapping = WaveformMapper()
+        waveform_mapping.add_waveform('qubit', 'Wfm1')
+        waveform_mapping.add_digital('readout', awg_wfm.get_output_channel(0).marker(0))
+        expConfig.map_waveforms(waveform_mapping)
+
+        spec_qubit = ExperimentSpecification('qubit', self.lab, 'Qubit')
+        spec_qubit['GE X-Gate Amplitude'].Value = 0.4
+        spec_qubit['GE X/2-Gate Amplitude'].Value = 0.2
+        spec_qubit['GE X/2-Gate Time'].Value = 10e-9
+        qubit_gates = TransmonGates(self.lab.WFMT('IQmod'), spec_qubit)
+
+        #Emulate a readout on every rising edge of the readout marker: I is the drive energy since the previous readout
+        #(invariant to the carrier phase as I^2+Q^2 is just the envelope squared) and Q is the number of samples from the
+        #last drive sample to the readout. Checks that the ACQ has one segment per readout pulse.
+        def fake_get_data():
+            wfms = awg_wfm.get_raw_waveforms()
+            drive_energy = wfms[0]**2 + wfms[1]**2
+            mkr = awg_wfm.get_output_channel(0).marker(0).get_raw_trigger_waveform().astype(int)
+            read_inds = np.where(np.diff(mkr) == 1)[0] + 1
+            assert read_inds.size == hal_acq.NumSegments, "The ACQ segments do not match the number of readout pulses."
+            i_vals, q_vals = [], []
+            prev_ind = 0
+            for cur_ind in read_inds:
+                drive_inds = np.where(drive_energy[prev_ind:cur_ind] > 1e-12)[0]
+                i_vals.append(np.sum(drive_energy[prev_ind:cur_ind]))
+                q_vals.append(cur_ind - prev_ind - drive_inds[-1] if drive_inds.size > 0 else -1)
+                prev_ind = cur_ind
+            return {'data': {
+                'parameters' : ['repetition', 'segment', 'sample'],
+                'data' : {
+                    'ch1' : np.array(i_vals, dtype=float).reshape(1, -1, 1),
+                    'ch2' : np.array(q_vals, dtype=float).reshape(1, -1, 1),
+                }
+            }}
+
+        circuits = [['X'], ['X/2', 'Z', 'Y/2'], ['I'], ['H', 'X', '-Y/2'], ['Y']]
+        with unittest.mock.patch.object(hal_acq, 'get_data', side_effect=fake_get_data):
+            direct_vals = [qubit_gates.run_circuit_direct(x, expConfig, 100e-9, 200e-9) for x in circuits]
+            for cur_batch in [2, 3, 5]:
+                batch_vals = qubit_gates.run_circuits_direct(circuits, expConfig, 100e-9, 200e-9, circuits_per_batch=cur_batch)
+                assert len(batch_vals) == len(circuits), "Batched circuits did not return a value for every circuit."
+                for cur_direct, cur_batched in zip(direct_vals, batch_vals):
+                    assert cur_batched[0].shape == cur_direct[0].shape, "Batched circuits did not return data in the same shape as run_circuit_direct."
+                    assert np.abs(cur_batched[0] - cur_direct[0]).max() < 1e-12, "Batched circuits did not apply the same drive as run_circuit_direct."
+                    assert np.array_equal(cur_batched[1], cur_direct[1]), "Batched circuits did not place the gates right before the readout."
+                assert hal_acq.NumSegments == 1, "NumSegments was not restored after running batched circuits."
+        assert direct_vals[2][0][0,0,0] == 0 and direct_vals[0][0][0,0,0] > 0, "The emulated readout does not register the drive."
+
+        #NumSegments must be restored even if the acquisition fails
+        hal_acq.NumSegments = 3
+        assert_found = False
+        with unittest.mock.patch.object(hal_acq, 'get_data', side_effect=RuntimeError("Acquisition failed")):
+            try:
+                qubit_gates.run_circuits_direct(circuits, expConfig, 100e-9, 200e-9, circuits_per_batch=2)
+            except RuntimeError:
+                assert_found = True
+        assert assert_found, "The failed acquisition did not raise an error."
+        assert hal_acq.NumSegments == 3, "NumSegments was not restored after a failed acquisition."
+
+        self.cleanup()
+
 class TestSaveLoad(unittest.TestCase):
     def arr_equality(self, arr1, arr2):
         if arr1.size != arr2.size:
@@ -2,6 +2,7 @@ from sqdtoolz.ExperimentConfiguration import*
 from sqdtoolz.Laboratory import*
 from sqdtoolz.Experiment import*
 from sqdtoolz.Utilities.FileIO import*
+from sqdtoolz.ExperimentSweeps import*
 
 from sqdtoolz.Drivers.dummyGENmwSource import*
 from sqdtoolz.HAL.ACQ import*
@@ -20,12 +21,15 @@ from sqdtoolz.HAL.Processors.CPU.CPU_Mean import*
 
 from pathlib import Path
 import time
+import threading
 
 import numpy as np
 import shutil
 import os.path
 
 import unittest
+import unittest.mock
+import json
 
 class TestExpFileIO(unittest.TestCase):
     def initialise(self):
@@ -85,6 +89,37 @@ class TestExpFileIO(unittest.TestCase):
         assert self.arr_equality(var_dicts['myFreq'], np.array([2]*4)), "FileIODirectory failed to parse in VARs correctly."
         assert 'testAmpl' in var_dicts, "FileIODirectory failed to parse in VARs correctly."
         assert self.arr_equality(var_dicts['testAmpl'], np.arange(0,4,1)), "FileIODirectory failed to parse in VARs correctly."
+        #
+        arr = reader.get_numpy_array()
+        assert arr.shape == (4,3) + res.get_numpy_array().shape[1:], "FileIODirectory returns the wrong array shape for uniform sampling."
+        assert self.arr_equality(arr[-1], res.get_numpy_array()), "FileIODirectory returns the wrong data for uniform sampling."
+        lazyArr = reader.get_lazy_array()
+        assert self.arr_equality(lazyArr[1:3,::2], arr[1:3,::2]), "FileIODirectory lazy array returns the wrong data."
+        assert self.arr_equality(lazyArr.sel(testAmpl=[3,0], myFreq=1), arr[[3,0],1]), "FileIODirectory lazy array returns the wrong data."
+        assert reader.get_time_stamps().shape == arr.shape[:-1], "FileIODirectory returns the wrong time-stamp array shape."
+        #The reloaded directory should use the index file
+        index_path = reader._main_dir + '/' + FileIODirectory.INDEX_FILE_NAME
+        assert os.path.isfile(index_path), "FileIODirectory did not write the index file."
+        reader2 = FileIODirectory.fromReader(res)
+        assert reader2.folders == reader.folders, "FileIODirectory returns different folders when using the index file."
+        assert self.arr_equality(reader2.get_numpy_array(), arr), "FileIODirectory returns different data when using the index file."
+        for cur_var in var_dicts:
+            assert self.arr_equality(reader2.get_var_dict_arrays()[cur_var], var_dicts[cur_var]), "FileIODirectory returns different VARs when using the index file."
+        reader2 = None
+        #Indexing another data file name in the same folders must keep the index entries of the original file name
+        data_file_name = os.path.basename(res.file_path)
+        for cur_folder in reader.folders:
+            shutil.copy(cur_folder + '/' + data_file_name, cur_folder + '/data_copy.h5')
+        reader3 = FileIODirectory(reader.folders[0] + '/data_copy.h5')
+        assert self.arr_equality(reader3.get_numpy_array(), arr), "FileIODirectory returns the wrong data for another file name."
+        reader3 = None
+        with open(index_path) as json_file:
+            index_files = json.load(json_file)['Files']
+        assert set(index_files.keys()) == set([data_file_name, 'data_copy.h5']), "FileIODirectory did not index both file names."
+        with unittest.mock.patch.object(FileIODirectory, '_read_folder_metadata', side_effect=AssertionError("The metadata was read again.")):
+            reader2 = FileIODirectory.fromReader(res)
+        assert reader2.folders == reader.folders, "FileIODirectory did not reuse the index entries after indexing another file name."
+        reader2 = None
         time.sleep(1)
         #
         res.release()
@@ -208,6 +243,31 @@ class TestExpFileIO(unittest.TestCase):
         tempRdr = None
         os.remove('testFile.h5')
 
+    def test_LazyArray(self):
+        data_array = np.random.rand(5,6,7,3)
+        param_names = ["power", "frequency", "flux"]
+        param_vals = [np.linspace(-10,0,5), np.linspace(1e9,2e9,6), np.arange(7)*0.1]
+        dep_param_names = ['rf_I', 'rf_Q', 'rf_A']
+        for cur_comp in ['gzip', None]:
+            FileIOWriter.write_file_direct('testFile.h5', data_array, param_names, param_vals, dep_param_names, compression=cur_comp)
+            tempRdr = FileIOReader('testFile.h5')
+            for use_mmap in ([False, True] if cur_comp is None else [False]):
+                lazyArr = tempRdr.get_lazy_array(use_mmap)
+                assert lazyArr.shape == data_array.shape, "Lazy array has the incorrect shape."
+                assert lazyArr.IsMemoryMapped == use_mmap, "Lazy array did not memory-map the dataset."
+                #Index-based slicing
+                for cur_key in [np.s_[...], np.s_[2], np.s_[:,3], np.s_[1:4,::2,5,1], np.s_[-1,...,0], np.s_[:,:,[6,0,0,3]], np.s_[[4,0],1:3,::3],
+                                np.s_[:,np.array([True,False,True,False,False,True])], np.s_[::-1,:,0:7:6,[2,0]], np.s_[3,4,5,2], np.s_[:,:,2:2]]:
+                    assert self.arr_equality(lazyArr[cur_key], data_array[cur_key]), f"Lazy array slicing failed on key {cur_key}."
+                assert self.arr_equality(np.asarray(lazyArr), data_array), "Lazy array failed to return the full array."
+                #Value-based slicing
+                assert self.arr_equality(lazyArr.sel(frequency=1.39e9), data_array[:,2]), "Lazy array failed to select nearest value."
+                assert self.arr_equality(lazyArr.sel(power=slice(-8,-2), dep_params='rf_Q'), data_array[1:4,:,:,1]), "Lazy array failed to select value range."
+                assert self.arr_equality(lazyArr.sel(flux=[0.6,0.1], dep_params=['rf_A','rf_I']), data_array[:,:,[6,1]][...,[2,0]]), "Lazy array failed to select list of values."
+            tempRdr.release()
+            tempRdr = None
+            os.remove('testFile.h5')
+
     def test_DataResizing(self):
         self.initialise()
         VariableInternal('test_var', self.lab, 0)
@@ -310,6 +370,114 @@ class TestExpFileIO(unittest.TestCase):
         ord2 = np.arange(100); rng.shuffle(ord2)
         _test(np.array([-10,-5,0]), np.linspace(0,101,100), ord1, ord2)
 
+    def test_PipelinedSweep(self):
+        class ExpMidProcLog(Experiment):
+            def __init__(self, name, expt_config):
+                super().__init__(name, expt_config)
+                self.mid_proc_log = []
+                self.ping_threads = []
+            def _mid_process(self):
+                cur_vals = self._retrieve_current_sweep_values()
+                self.mid_proc_log += [(self._cur_ind_coord, cur_vals['test_var1'], cur_vals['test_var2'], self._query_current_iteration_data() is not None)]
+            def _update_progress_bar(self, pct_complete):
+                self.ping_threads += [threading.current_thread() is threading.main_thread()]
+                super()._update_progress_bar(pct_complete)
+
+        self.initialise()
+        VariableInternal('test_var1', self.lab, 0)
+        VariableInternal('test_var2', self.lab, 0)
+
+        for cur_orders in [[], [ExSwpSnake(1)]]:
+            exp = ExpMidProcLog("test", self.lab.CONFIG('testConf'))
+            res = self.lab.run_single(exp, [(self.lab.VAR('test_var1'), np.arange(3)), (self.lab.VAR('test_var2'), np.arange(4))],
+                                      rec_params=[self.lab.VAR('test_var1'), self.lab.VAR('test_var2')], sweep_orders=cur_orders, pipelined=True)
+            arr = res.get_numpy_array()
+            assert not np.isnan(arr).any(), "Pipelined sweep failed to write all data points."
+            expected_ans = np.array([[[x, y] for y in range(4)] for x in range(3)])
+            assert self.arr_equality(exp.last_rec_params.get_numpy_array(), expected_ans), "Pipelined sweep recorded the wrong rec_params."
+            assert len(exp.mid_proc_log) == 12, "Pipelined sweep did not run _mid_process on every sweep point."
+            assert len(exp.ping_threads) == 12 and all(exp.ping_threads), "Pipelined sweep did not update the progress bar (and the state) on the main thread."
+            for cur_log in exp.mid_proc_log:
+                assert cur_log[1:3] == tuple(np.unravel_index(cur_log[0], (3,4))), "Pipelined sweep gave _mid_process an inconsistent sweep index."
+                assert cur_log[3], "Pipelined sweep did not give _mid_process the current data."
+            ts = res.get_time_stamps()[:,:,0,0,0].flatten()
+            assert np.all(np.diff(ts[[x[0] for x in exp.mid_proc_log]]) >= np.timedelta64(0)), "Pipelined sweep did not write the data in the sampled order."
+            exp.last_rec_params.release()
+            res.release()
+            time.sleep(1)
+
+        res = None
+        self.cleanup()
+
+    def test_QueryData(self):
+        self.initialise()
+        VariableInternal('test_var', self.lab, 0)
+        sweep_arr = [(self.lab.VAR('test_var'), np.arange(4)), (self.lab.VAR('myFreq'), np.arange(5))]
+        for cur_opts in [{'cache_packets':0}, {'cache_packets':3, 'flush_points':2}, {}]:
+            wrtr = FileIOWriter('test_save_dir/test.h5', **cur_opts)
+            full_arr = None
+            for m in range(20):
+                data_pkt = self.lab.HAL("dum_acq").get_data()['data']
+                wrtr.push_datapkt(data_pkt, sweep_arr)
+                cur_arr = np.stack([data_pkt['data']['ch1'], data_pkt['data']['ch2']], axis=-1)
+                if full_arr is None:
+                    full_arr = np.full((4,5) + cur_arr.shape, np.nan)
+                full_arr[m//5, m%5] = cur_arr
+                for cur_inds in [[m//5], [m//5, m%5], [np.arange(4), [3,1]], [[2], np.arange(5), [0], [0], np.arange(0,10,3)]]:
+                    ix_inds = [np.sort(np.ravel(x)) for x in cur_inds] + [np.arange(x) for x in full_arr.shape[len(cur_inds):]]
+                    assert np.array_equal(wrtr.query_data(cur_inds), full_arr[np.ix_(*ix_inds)], equal_nan=True), f"FileIOWriter with options {cur_opts} returned the wrong data on querying {cur_inds}."
+            wrtr.close()
+            wrtr = None
+            os.remove('test_save_dir/test.h5')
+        self.cleanup()
+
+    def test_BufferedWriter(self):
+        self.initialise()
+        VariableInternal('test_var', self.lab, 0)
+        sweep_arr = [(self.lab.VAR('test_var'), np.arange(23))]
+        rng = np.random.default_rng()
+        swp_ord = np.arange(23); rng.shuffle(swp_ord)
+        for cur_opts in [{'flush_points':5}, {'flush_points':7, 'compression':'lzf', 'chunk_packets':3}, {'flush_points':1000, 'compression':None}, {'flush_points':4, 'compression':'gzip', 'compression_level':9}]:
+            wrtr = FileIOWriter('test_save_dir/test.h5', **cur_opts)
+            data_pkts = []
+            for m in swp_ord:
+                data_pkt = self.lab.HAL("dum_acq").get_data()['data']
+                data_pkts += [(m, data_pkt)]
+                wrtr.push_datapkt(data_pkt, sweep_arr, dset_ind=m)
+                if m == swp_ord[10]:
+                    #Querying the data should flush the buffer...
+                    assert self.arr_equality(wrtr.query_data([m])[0,0,0,:,0], data_pkt['data']['ch1'][0,0,:]), "Buffered FileIOWriter did not flush the data when querying."
+            wrtr.close()
+            wrtr = None
+            #
+            leData = FileIOReader('test_save_dir/test.h5')
+            arr = leData.get_numpy_array()
+            for m, data_pkt in data_pkts:
+                assert self.arr_equality(arr[m,:,:,:,0], data_pkt['data']['ch1']), f"Buffered FileIOWriter with options {cur_opts} did not write the data correctly."
+                assert self.arr_equality(arr[m,:,:,:,1], data_pkt['data']['ch2']), f"Buffered FileIOWriter with options {cur_opts} did not write the data correctly."
+            ts = leData.get_time_stamps()
+            assert not np.isnat(ts).any(), "Buffered FileIOWriter did not write all the time-stamps."
+            leData.release()
+            leData = None
+            os.remove('test_save_dir/test.h5')
+
+        #Check that the flush interval bounds the latency for SWMR readers
+        wrtr = FileIOWriter('test_save_dir/test.h5', flush_points=1000, flush_time=0.1)
+        wrtr.push_datapkt(self.lab.HAL("dum_acq").get_data()['data'], sweep_arr)
+        leData = FileIOReader('test_save_dir/test.h5')
+        assert np.isnan(leData.get_numpy_array()[0]).all(), "Buffered FileIOWriter wrote the data before the flush interval."
+        leData.release()
+        time.sleep(0.2)
+        wrtr.push_datapkt(self.lab.HAL("dum_acq").get_data()['data'], sweep_arr)
+        leData = FileIOReader('test_save_dir/test.h5')
+        assert not np.isnan(leData.get_numpy_array()[:2]).any(), "Buffered FileIOWriter did not write the data after the flush interval."
+        leData.release()
+        leData = None
+        wrtr.close()
+        wrtr = None
+
+        self.cleanup()
+
     def test_Datalogger(self):
         self.initialise()
 
@@ -25,6 +25,7 @@ import shutil
 import os.path
 
 import unittest
+import unittest.mock
 
 class TestColdReload(unittest.TestCase):
     def initialise(self):
@@ -1001,6 +1002,65 @@ class TestExpFeatures(unittest.TestCase):
         shutil.rmtree('test_save_dir')
         self.cleanup()
 
+    def test_StateSnapshot(self):
+        self.initialise()
+
+        #Check that the last state matches the laboratory configuration
+        self.lab.update_state()
+        def load_state(file_name):
+            with open('test_save_dir/' + file_name) as json_file:
+                return json.load(json_file)
+        def cur_state(cur_dict):
+            return json.loads(json.dumps(cur_dict, cls=customJSONencoder))
+        assert load_state('_last_state.txt') == cur_state(self.lab.save_laboratory_config('')), "The last state does not match the laboratory configuration."
+        assert load_state('_last_vars.txt') == cur_state({k:v._get_current_config() for (k,v) in self.lab._variables.items()}), "The last variables do not match the laboratory variables."
+        assert load_state('_last_exp_configs.txt') == cur_state({x : self.lab.CONFIG(x).get_config() for x in ['testConf', 'testConf2']}), "The last experiment configurations are incorrect."
+        #
+        #Check that a changed object is updated while unchanged objects reuse their cached JSON
+        cur_frag = self.lab._state_snapshot._fragments[('_last_state.txt', 'HALs', 'ddg')][1]
+        self.lab.WFMT("IQmod").IQAmplitude = 3.2
+        self.lab.update_state()
+        assert load_state('_last_state.txt') == cur_state(self.lab.save_laboratory_config('')), "The last state was not updated."
+        assert self.lab._state_snapshot._fragments[('_last_state.txt', 'HALs', 'ddg')][1] is cur_frag, "An unchanged object was serialised again."
+        #
+        #Check that the requested snapshots are rate-limited
+        self.lab._state_snapshot._last_request = None
+        self.lab._state_snapshot.request_snapshot()
+        self.lab.WFMT("IQmod").IQAmplitude = 4.5
+        self.lab._state_snapshot.request_snapshot()
+        self.lab._state_snapshot.flush()
+        assert load_state('_last_state.txt')['WFMTs'][0]['IQ Amplitude'] == 3.2, "The snapshot requests were not rate-limited."
+        self.lab._state_snapshot._last_request -= self.lab._state_snapshot.MIN_INTERVAL
+        self.lab._state_snapshot.request_snapshot()
+        self.lab._state_snapshot.flush()
+        assert load_state('_last_state.txt')['WFMTs'][0]['IQ Amplitude'] == 4.5, "The requested snapshot was not written."
+        assert not os.path.exists('test_save_dir/_last_state.txt.tmp'), "The temporary snapshot file was not renamed."
+        #
+        #Check that a failed write does not stop further snapshots from being written
+        cur_write = self.lab._state_snapshot._write
+        def failed_write(cur_snapshot):
+            raise OSError("Emulated write failure")
+        self.lab._state_snapshot._write = failed_write
+        self.lab._state_snapshot._last_request = None
+        self.lab._state_snapshot.request_snapshot()
+        self.lab._state_snapshot.flush()
+        self.lab._state_snapshot._write = cur_write
+        self.lab.WFMT("IQmod").IQAmplitude = 5.1
+        self.lab._state_snapshot._last_request = None
+        self.lab._state_snapshot.request_snapshot()
+        self.lab._state_snapshot.flush()
+        assert load_state('_last_state.txt')['WFMTs'][0]['IQ Amplitude'] == 5.1, "No snapshot was written after a failed write."
+        #
+        #Check that the state is still written if the file cannot be replaced (e.g. held open by another process on Windows)
+        self.lab.WFMT("IQmod").IQAmplitude = 5.7
+        with unittest.mock.patch('os.replace', side_effect=PermissionError):
+            self.lab.update_state()
+        assert load_state('_last_state.txt')['WFMTs'][0]['IQ Amplitude'] == 5.7, "The state was not written when the file could not be replaced."
+        assert not os.path.exists('test_save_dir/_last_state.txt.tmp'), "The temporary snapshot file was not removed."
+
+        shutil.rmtree('test_save_dir')
+        self.cleanup()
+
     class miniExp(Experiment):
         def __init__(self, name, expt_config, testObj):
             super().__init__(name, expt_config)
@@ -0,0 +1,57 @@
+from sqdtoolz.Drivers.Dependencies.Spectrum.fifo_ring import*
+
+import numpy as np
+import time
+
+import unittest
+
+class TestFifoRing(unittest.TestCase):
+    def read_all(self, fifo, block_len, total_len):
+        final_arr = np.zeros(total_len, dtype=np.int16)
+        cur_ind = 0
+        for cur_block in read_fifo_blocks(fifo, block_len, total_len):
+            assert cur_block.dtype == np.int16, "The FIFO blocks must be raw int16 samples."
+            assert cur_block.size == min(block_len, total_len - cur_ind), "The FIFO block has the wrong size."
+            final_arr[cur_ind:cur_ind+cur_block.size] = cur_block
+            cur_ind += cur_block.size
+        assert cur_ind == total_len, "The FIFO readout did not yield all the requested samples."
+        return final_arr
+
+    def test_Blocks(self):
+        seg_len = 48*2
+        num_segs = 1000
+        #Small ring (8 notify chunks) so that the blocks wrap around the ring many times
+        for block_segs in [1, 7, 30, 1000]:
+            fifo = SimulatedFifo(seg_len, ring_bytes=2**16 if block_segs < 1000 else 2**18, notify_bytes=2**13)
+            arr = self.read_all(fifo, block_segs*seg_len, num_segs*seg_len)
+            assert np.array_equal(arr, fifo.get_expected_data(0, num_segs).flatten()), f"FIFO readout failed with blocks of {block_segs} segments."
+            #The blocks that do not straddle the end of the ring must be views of the DMA buffer
+            cur_block = next(read_fifo_blocks(fifo, block_segs*seg_len, num_segs*seg_len))
+            assert np.shares_memory(cur_block, fifo.buffer), "The FIFO blocks are not zero-copy views of the ring buffer."
+
+        #Ring buffer too small for the block size
+        fifo = SimulatedFifo(seg_len, ring_bytes=2**14, notify_bytes=2**13)
+        self.assertRaises(AssertionError, self.read_all, fifo, 100*seg_len, 200*seg_len)
+
+    def test_SEQskip(self):
+        seg_len = 80*2
+        num_segs = 500
+        #SEQ trigger within the first chunk and beyond the first few chunks (i.e. data held/discarded before finding the SEQ trigger)
+        for seq_offset in [0, 5, 51, 777]:
+            fifo = SimulatedFifo(seg_len, ring_bytes=2**16, notify_bytes=2**12, seq_offset=seq_offset)
+            arr = self.read_all(fifo, 13*seg_len, num_segs*seg_len)
+            assert np.array_equal(arr, fifo.get_expected_data(0, num_segs).flatten()), f"FIFO readout failed with a SEQ offset of {seq_offset} segments."
+
+    def test_Overrun(self):
+        seg_len = 64
+        fifo = SimulatedFifo(seg_len, ring_bytes=2**14, notify_bytes=2**12, data_rate=1e6)
+        arr = self.read_all(fifo, 64*seg_len, 256*seg_len)
+        assert np.array_equal(arr, fifo.get_expected_data(0, 256).flatten()), "FIFO readout failed when emulating the data rate."
+        #Slow consumer must trigger an overrun
+        def read_slowly():
+            for cur_block in read_fifo_blocks(fifo, 16*seg_len, 4096*seg_len):
+                time.sleep(0.01)
+        self.assertRaises(AssertionError, read_slowly)
+
+if __name__ == '__main__':
+    unittest.main()
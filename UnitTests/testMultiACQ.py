@@ -0,0 +1,133 @@
+from sqdtoolz.Laboratory import*
+from sqdtoolz.HAL.DDG import*
+from sqdtoolz.HAL.MultiACQ import*
+
+from qcodes import Instrument
+
+import numpy as np
+import threading
+import shutil
+
+import unittest
+import unittest.mock
+
+class MockETHFPGA(Instrument):
+    '''
+    Emulates the parts of the ETHFPGA driver used by MultiACQ. The acquisition call runs acquire_func while the data packets returned
+    by _stop are filled with the value returned by acquire_func.
+    '''
+    def __init__(self, name, stop_log, **kwargs):
+        super().__init__(name, **kwargs)
+        self.acquire_func = lambda : 0
+        self.stop_log = stop_log
+        self.stopped = threading.Event()
+
+    def _start(self, **kwargs):
+        self.stopped.clear()
+
+    def _acquire(self):
+        return self.acquire_func()
+
+    def _stop(self, final_data, **kwargs):
+        self.stop_log.append(self.name)
+        self.stopped.set()
+        return {
+            'parameters' : ['repetition', 'sample'],
+            'data' : { 'ch1_I' : np.zeros((2,3)) + final_data, 'ch1_Q' : np.zeros((2,3)) },
+            'misc' : {'SampleRates' : [1e6]*2}
+        }
+
+    def get_idn(self):
+        return {
+            "vendor": "QCoDeS",
+            "model": str(self.__class__),
+            "seral": "NA",
+            "firmware": "NA",
+        }
+
+class TestMultiACQ(unittest.TestCase):
+    def initialise(self):
+        self.lab = Laboratory('UnitTests\\UTestExperimentConfiguration.yaml', 'test_save_dir/')
+        self.lab.load_instrument('virDDG')
+        DDG("ddg", self.lab, 'virDDG')
+
+        self.stop_log = []
+        self.fpgas = [MockETHFPGA(f'mockFPGA{m}', self.stop_log) for m in range(3)]
+        for cur_fpga in self.fpgas:
+            self.lab.add_instrument(cur_fpga)
+        with unittest.mock.patch('sqdtoolz.HAL.MultiACQ.ETHFPGA', MockETHFPGA):
+            MultiACQ("multi", self.lab, [x.name for x in self.fpgas], self.lab.HAL('ddg').get_trigger_output('A'))
+
+    def cleanup(self):
+        self.lab.release_all_instruments()
+        self.lab = None
+        shutil.rmtree('test_save_dir')
+
+    def wait_for(self, event):
+        #Guard against hanging the test if the awaited card is never processed
+        assert event.wait(5), "The awaited card was not processed while the other cards were still acquiring."
+
+    def test_OutOfOrder(self):
+        self.initialise()
+        multi_acq = self.lab.HAL('multi')
+        multi_acq.Timeout = 10
+        #Card 2 finishes first, then card 0 and then card 1 - each only after the data of the previous card has been processed
+        self.fpgas[0].acquire_func = lambda : (self.wait_for(self.fpgas[2].stopped), 10)[1]
+        self.fpgas[1].acquire_func = lambda : (self.wait_for(self.fpgas[0].stopped), 11)[1]
+        self.fpgas[2].acquire_func = lambda : 12
+        leData = multi_acq.get_data()
+        assert self.stop_log == ['mockFPGA2', 'mockFPGA0', 'mockFPGA1'], "The data of the cards was not processed as soon as it arrived."
+        assert list(leData['data'].keys()) == [f'{m}_ch1_{x}' for m in range(3) for x in ['I', 'Q']], "The channels are not assembled in the order of the instruments."
+        for m in range(3):
+            assert np.all(leData['data'][f'{m}_ch1_I'] == 10+m), "The data of a card was assigned to the wrong channels."
+        assert leData['misc']['SampleRates'] == [1e6]*6, "The sample rates were not collated across all cards."
+        assert self.lab.HAL('ddg').get_trigger_output('A').TrigEnable, "The trigger was not enabled after issuing the acquisitions."
+        self.cleanup()
+
+    def test_ErrorPropagation(self):
+        self.initialise()
+        multi_acq = self.lab.HAL('multi')
+        def fail():
+            raise ValueError("Card failure")
+        self.fpgas[1].acquire_func = fail
+        self.assertRaises(ValueError, multi_acq.get_data)
+        #The next acquisition proceeds normally once the card recovers
+        self.fpgas[1].acquire_func = lambda : 1
+        leData = multi_acq.get_data()
+        assert np.all(leData['data']['1_ch1_I'] == 1), "The acquisition did not recover after a card failed."
+        self.cleanup()
+
+    def test_Timeout(self):
+        self.initialise()
+        multi_acq = self.lab.HAL('multi')
+        release = threading.Event()
+        self.fpgas[1].acquire_func = lambda : (release.wait(), 1)[1]
+        #Always release the blocked card so that a failing check cannot leave its worker thread hanging
+        try:
+            multi_acq.Timeout = 0.1
+            assert_msg = ''
+            try:
+                multi_acq.get_data()
+            except AssertionError as e:
+                assert_msg = str(e)
+            assert 'mockFPGA1' in assert_msg and 'mockFPGA0' not in assert_msg, "The timeout did not name the card that was still acquiring."
+            #The card is still running the abandoned acquisition - so a new acquisition must be refused
+            self.stop_log.clear()
+            assert_msg = ''
+            try:
+                multi_acq.get_data()
+            except AssertionError as e:
+                assert_msg = str(e)
+            assert 'still running' in assert_msg and 'mockFPGA1' in assert_msg, "A new acquisition was started on a card that is still running an abandoned acquisition."
+            assert self.stop_log == [], "Cards were acquired while another card was still running an abandoned acquisition."
+        finally:
+            release.set()
+        #Once the abandoned acquisition finishes, the cards can be acquired again
+        multi_acq.Timeout = 10
+        leData = multi_acq.get_data()
+        assert sorted(self.stop_log) == ['mockFPGA0', 'mockFPGA1', 'mockFPGA2'], "The acquisition did not recover after the abandoned acquisition finished."
+        assert np.all(leData['data']['1_ch1_I'] == 1), "The acquisition did not recover after the abandoned acquisition finished."
+        self.cleanup()
+
+if __name__ == '__main__':
+    unittest.main()
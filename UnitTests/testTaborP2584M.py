@@ -0,0 +1,156 @@
+from sqdtoolz.Drivers.Tabor_P2584M import*
+from sqdtoolz.Laboratory import*
+from sqdtoolz.HAL.Processors.ProcessorCPU import*
+
+import numpy as np
+import shutil
+
+import unittest
+import unittest.mock
+
+class TestTaborP2584M(unittest.TestCase):
+    def initialise(self):
+        self.lab = Laboratory('', 'test_save_dir/')
+        self.tabor = Tabor_P2584M('tabor', 0, 3, fake_backend=True)
+
+    def cleanup(self):
+        self.tabor.close()
+        self.tabor = None
+        self.lab.release_all_instruments()
+        self.lab = None
+        shutil.rmtree('test_save_dir')
+
+    def make_wfm_data(self, seg_amps, seg_len=1024):
+        return {
+            'waveforms' : [np.zeros(seg_len) + x for x in seg_amps],
+            'markers' : [[np.array([]), np.array([]), np.array([])] for x in seg_amps],
+            'seq_ids' : list(range(len(seg_amps)))
+        }
+
+    def program(self, chan_id, dict_wfm_data, dirty_segs=None, seq_changed=False):
+        awg = self.tabor.AWG
+        awg.prepare_waveform_memory(chan_id, [x.size for x in dict_wfm_data['waveforms']], raw_data=dict_wfm_data)
+        if dirty_segs is None:
+            awg.program_channel(chan_id, dict_wfm_data)
+        else:
+            awg.program_channel_delta(chan_id, dict_wfm_data, dirty_segs, seq_changed)
+
+    def test_DeltaProgramming(self):
+        self.initialise()
+        fake_inst = self.tabor._inst
+
+        self.program('CH1', self.make_wfm_data([0.1, 0.2, 0.3]))
+        assert fake_inst.SegmentWrites == [(1,1), (1,2), (1,3)], "The initial programming did not upload every segment."
+        assert fake_inst.TaskTableWrites == [1], "The initial programming did not write the task table."
+
+        #Changing a single segment (with the same segment lengths) should only upload that segment
+        fake_inst.SegmentWrites.clear()
+        fake_inst.TaskTableWrites.clear()
+        self.program('CH1', self.make_wfm_data([0.1, 0.25, 0.3]), [False, True, False], False)
+        assert fake_inst.SegmentWrites == [(1,2)], "Only the changed segment should be uploaded."
+        assert fake_inst.TaskTableWrites == [], "The task table was rewritten when the sequence did not change."
+
+        #Nothing to upload if nothing has changed
+        self.program('CH1', self.make_wfm_data([0.1, 0.25, 0.3]), [False, False, False], False)
+        assert fake_inst.SegmentWrites == [(1,2)] and fake_inst.TaskTableWrites == [], "Segments were uploaded when nothing changed."
+
+        #Redefining the segment lengths must reprogram everything
+        fake_inst.SegmentWrites.clear()
+        dict_wfm_data = self.make_wfm_data([0.1, 0.25, 0.3])
+        dict_wfm_data['waveforms'][2] = np.zeros(2048) + 0.3
+        self.program('CH1', dict_wfm_data, [False, False, True], False)
+        assert fake_inst.SegmentWrites == [(1,1), (1,2), (1,3)], "Redefining the memory banks did not upload every segment."
+        assert fake_inst.TaskTableWrites == [1], "Redefining the memory banks did not rewrite the task table."
+
+        self.cleanup()
+
+    def test_BlockReadout(self):
+        self.initialise()
+        acq = self.tabor.ACQ
+        acq.NumSamples = 96*4
+        acq.NumSegments = 2
+        acq.NumRepetitions = 1000
+        new_proc = ProcessorCPU('cpu_test', self.lab)
+        #Record the data packets pushed into the processor
+        pushed_pkts = []
+        orig_push_data = new_proc.push_data
+        def push_data(data_pkt):
+            pushed_pkts.append({x : data_pkt['data'][x].shape for x in data_pkt['data']})
+            orig_push_data(data_pkt)
+        new_proc.push_data = push_data
+
+        #Read in blocks of 64 repetitions (i.e. the last block is partial with 40 repetitions)
+        self.tabor._debug = True
+        self.tabor._debug_logs = ''
+        acq.blocksize(64)
+        leData = acq.get_data(data_processor=new_proc)['data']
+        self.tabor._debug = False
+        #Check that the frames of each block were selected (frames are indexed from 1 and there are 2 segments per repetition)
+        exp_blocks = [(64*m, min(64, 1000 - 64*m)) for m in range(16)]
+        frame_sels = [x.split(':DIG:DATA:FRAM ')[1].strip() for x in self.tabor._debug_logs.splitlines() if ':DIG:DATA:FRAM ' in x]
+        assert frame_sels == [f'{1 + 2*x[0]},{2*x[1]}' for x in exp_blocks], "The frames of the ACQ blocks were selected incorrectly."
+        assert pushed_pkts == [{'CH1' : (x[1], 2, 96*4), 'CH2' : (x[1], 2, 96*4)} for x in exp_blocks], "The ACQ blocks (including the last partial block) were not pushed correctly."
+        assert leData['parameters'] == ['repetition', 'segment', 'sample'], "The ACQ block readout returned the wrong parameters."
+        assert leData['misc']['RawDataType'] == 'uint16', "The ACQ block readout did not tag the raw data type."
+        #The emulated frames are offset by their frame index (modulo 256) - so check that every frame landed in the right place
+        for cur_ch in ['CH1', 'CH2']:
+            assert leData['data'][cur_ch].shape == (1000, 2, 96*4), "The ACQ block readout returned the wrong shape."
+            frame_inds = leData['data'][cur_ch][:,:,0].astype(int) - leData['data'][cur_ch][0,0,0]
+            assert np.array_equal(frame_inds, (np.arange(2000) % 256).reshape(1000, 2)), "The ACQ blocks were not read into the correct frames."
+
+        #Must match a single read of all repetitions
+        pushed_pkts.clear()
+        acq.blocksize(1000)
+        leData2 = acq.get_data(data_processor=new_proc)['data']
+        assert pushed_pkts == [{'CH1' : (1000, 2, 96*4), 'CH2' : (1000, 2, 96*4)}], "The full ACQ block was not read in one go."
+        for cur_ch in ['CH1', 'CH2']:
+            assert np.array_equal(leData['data'][cur_ch], leData2['data'][cur_ch]), "The block readout does not match a single full-block read."
+        self.cleanup()
+
+    def test_CapturePolling(self):
+        self.initialise()
+        acq = self.tabor.ACQ
+        acq.NumSamples = 96
+        acq.NumSegments = 1
+        new_proc = ProcessorCPU('cpu_test', self.lab)
+        #Count the completion polls in every capture
+        num_polls = [0]
+        orig_get_cmd = self.tabor._get_cmd
+        def get_cmd(cmd):
+            if cmd.upper().startswith(':DIG:ACQ') and 'FRAM:STAT' in cmd.upper():
+                num_polls[0] += 1
+            return orig_get_cmd(cmd)
+        self.tabor._get_cmd = get_cmd
+        def capture(frame_period, num_reps):
+            self.tabor._inst.FramePeriod = frame_period
+            acq.NumRepetitions = num_reps
+            num_polls[0] = 0
+            acq.get_data(data_processor=new_proc)
+            return num_polls[0]
+        def check_estimate(rep_time, msg):
+            assert abs(acq._rep_time_est - rep_time) < 0.25*rep_time, f"The capture time per repetition was not learnt {msg} (got {acq._rep_time_est}s instead of {rep_time}s)."
+
+        #Short capture (20ms)
+        leCounts = [capture(20e-6, 1000) for m in range(3)]
+        assert max(leCounts) <= 30, f"Too many completion polls on a short capture: {leCounts}"
+        assert leCounts[-1] <= 15, f"The completion polls did not settle on a short capture: {leCounts}"
+        check_estimate(20e-6, 'on a short capture')
+        #Long capture (300ms) - the estimate must converge after the capture time changes
+        leCounts = [capture(1e-3, 300) for m in range(3)]
+        assert max(leCounts) <= 60, f"Too many completion polls on a long capture: {leCounts}"
+        assert leCounts[-1] <= 20, f"The completion polls did not settle on a long capture: {leCounts}"
+        check_estimate(1e-3, 'after lengthening the capture')
+        #Back to the short capture - the previous (too long) estimate must not linger
+        capture(20e-6, 1000)
+        capture(20e-6, 1000)
+        check_estimate(20e-6, 'after shortening the capture')
+
+        #No frames are captured - i.e. no trigger
+        self.tabor._inst.FramePeriod = 1e3
+        with unittest.mock.patch.object(TaborP2584M_ACQ, 'NO_TRIGGER_TIMEOUT', 0.05):
+            self.assertRaisesRegex(AssertionError, 'No trigger detected', acq.get_data, data_processor=new_proc)
+        self.tabor._get_cmd = orig_get_cmd
+        self.cleanup()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -787,6 +787,78 @@ class TestSegments(unittest.TestCase):
         shutil.rmtree('test_save_dir')
         self.cleanup()
 
+    def test_SegmentCache(self):
+        self.initialise()
+        awg_wfm = self.lab.HAL("Wfm1")
+        WFMT_ModulationIQ('IQmod', self.lab, 47e7)
+
+        awg_wfm.clear_segments()
+        awg_wfm.add_waveform_segment(WFS_Constant("SEQPAD", None, 10e-9, 0.0))
+        awg_wfm.add_waveform_segment(WFS_Gaussian("init", self.lab.WFMT('IQmod').apply(), 20e-9, 0.5))
+        awg_wfm.add_waveform_segment(WFS_Constant("zero1", None, 30e-9, 0.1))
+        awg_wfm.add_waveform_segment(WFS_Gaussian("init2", self.lab.WFMT('IQmod').apply(phase_offset=0.3), 45e-9, 0.5))
+        awg_wfm.add_waveform_segment(WFS_Gaussian("init3", self.lab.WFMT('IQmod').apply(), 45e-9, 0.5))
+        awg_wfm.add_waveform_segment(WFS_Constant("zero2", None, -1, 0.0))
+        awg_wfm.set_valid_total_time(200e-9)
+        wfm_first = np.vstack(awg_wfm.get_raw_waveforms())
+        num_cached = len(awg_wfm._seg_cache)
+        assert num_cached == 12, "The rendered segments were not cached."
+        #Reassembling should reuse the cached segments (with the phase offset carried on to later segments) 
+        wfm_second = np.vstack(awg_wfm.get_raw_waveforms())
+        assert len(awg_wfm._seg_cache) == num_cached, "The cached segments were not reused."
+        assert np.array_equal(wfm_first, wfm_second), "The waveform assembled from cached segments differs from the original."
+        awg_wfm._seg_cache.clear()
+        awg_wfm._seg_cache_bytes = 0
+        assert np.array_equal(wfm_first, np.vstack(awg_wfm.get_raw_waveforms())), "The waveform assembled from cached segments differs from a fresh assembly."
+        #Change a segment parameter
+        awg_wfm.get_waveform_segment('init2').Amplitude = 0.25
+        wfm_changed = np.vstack(awg_wfm.get_raw_waveforms())
+        assert len(awg_wfm._seg_cache) == num_cached + 2, "Changing a segment parameter did not invalidate its cached waveform."
+        assert self.arr_equality(wfm_changed[:,60:105], wfm_first[:,60:105]*0.5), "Changing a segment parameter did not yield the correct waveform."
+        assert np.array_equal(wfm_changed[:,105:], wfm_first[:,105:]), "Changing a segment parameter affected other segments."
+        #Change a WFMT parameter
+        self.lab.WFMT('IQmod').IQAmplitude = 2.0
+        wfm_changed = np.vstack(awg_wfm.get_raw_waveforms())
+        assert self.arr_equality(wfm_changed[:,10:30], wfm_first[:,10:30]*2.0), "Changing a WFMT parameter did not invalidate the cached waveform."
+        #Change the elastic segment length
+        awg_wfm.set_valid_total_time(400e-9)
+        wfm_changed = np.vstack(awg_wfm.get_raw_waveforms())
+        assert wfm_changed.shape[1] == 400 and np.all(wfm_changed[:,150:] == 0.0), "Changing the elastic segment did not yield the correct waveform."
+
+        shutil.rmtree('test_save_dir')
+        self.cleanup()
+
+    def test_IQCarrierCache(self):
+        self.initialise()
+        WFMT_ModulationIQ('IQmod', self.lab, 47e7)
+        wfmt = self.lab.WFMT('IQmod')
+        wfmt.IQPhaseOffset = 0.4
+        wfmt.IQAmplitudeFactor = 0.9
+        wfm_pts = np.linspace(0.1, 1.0, 37)
+        fs = 1e9
+        for cur_kwargs in [{}, {'phase':0.7}, {'phase_segment':-1.2}]:
+            wfmt.initialise_for_new_waveform()
+            t_vals = np.arange(wfm_pts.size) / fs + 20/fs
+            if 'phase' in cur_kwargs:
+                t_vals -= 20/fs
+                t_vals -= cur_kwargs['phase'] / (2*np.pi*47e7)
+            if 'phase_segment' in cur_kwargs:
+                t_vals -= cur_kwargs['phase_segment'] / (2*np.pi*47e7)
+            wfm_i = wfmt.modify_waveform(wfm_pts, fs, 20, 0, **cur_kwargs)
+            wfmt.initialise_for_new_waveform()
+            wfm_q = wfmt.modify_waveform(wfm_pts, fs, 20, 1, **cur_kwargs)
+            assert self.arr_equality(wfm_i, wfm_pts*np.cos(2*np.pi*47e7*t_vals)), "The I-channel carrier is incorrect."
+            assert self.arr_equality(wfm_q, wfm_pts*0.9*np.sin(2*np.pi*47e7*t_vals + 0.4)), "The Q-channel carrier is incorrect."
+        assert len(wfmt._carrier_tables) == 1, "The complex carrier table was not reused across the I and Q channels and different phases."
+        #Check that the carrier cache is bounded in bytes
+        wfmt.CARRIER_CACHE_MAX_BYTES = 3*100*16
+        for num_pts in [100, 100, 50, 100, 150, 400]:
+            wfmt.modify_waveform(np.ones(num_pts), fs, 0, 0)
+            assert wfmt._carrier_tables_bytes == sum([x.nbytes for x in wfmt._carrier_tables.values()]), "The size of the carrier cache is not tracked correctly."
+            assert wfmt._carrier_tables_bytes <= wfmt.CARRIER_CACHE_MAX_BYTES, "The carrier cache exceeds its maximum size."
+        assert list(x[2] for x in wfmt._carrier_tables) == [50, 100, 150], "The least recently used carrier tables were not evicted."
+        self.cleanup()
+
     def test_WFMTcopy(self):
         self.initialise()
 
@@ -909,6 +981,151 @@ class TestAWGChecks(unittest.TestCase):
         shutil.rmtree('test_save_dir')
         self.cleanup()
 
+    def test_AutoCompression(self):
+        self.initialise()
+        awg_wfm = self.lab.HAL("Wfm1")
+        #
+        #Verify the auto-compression algorithms on a waveform with long idle sections
+        #
+        awg_wfm.clear_segments()
+        awg_wfm.add_waveform_segment(WFS_Constant("SEQPAD", None, 96e-9, 0.0))
+        awg_wfm.add_waveform_segment(WFS_Gaussian("init", None, 20e-9, 0.5-0.1))
+        awg_wfm.add_waveform_segment(WFS_Constant("zero1", None, 200e-9, 0.1))
+        awg_wfm.add_waveform_segment(WFS_Gaussian("init2", None, 20e-9, 0.5-0.1))
+        awg_wfm.add_waveform_segment(WFS_Constant("zero2", None, 164e-9, 0.0))
+        awg_wfm.add_waveform_segment(WFS_Constant("pad", None, 4e-9, 0.0))
+        awg_wfm.get_output_channel(0).marker(0).set_markers_to_segments(["init"])
+        awg_wfm.get_output_channel(1).marker(1).set_markers_to_segments(["zero1"])
+        final_wfms = awg_wfm.get_raw_waveforms()
+        final_mkrs = [[x._assemble_marker_raw() for x in cur_ch._awg_mark_list] for cur_ch in awg_wfm.get_output_channels()]
+        def expand(dict_wfm_data):
+            seq_ids = np.repeat(dict_wfm_data['seq_ids'], dict_wfm_data.get('seq_loops', [1]*len(dict_wfm_data['seq_ids'])))
+            wfm = np.concatenate([dict_wfm_data['waveforms'][x] for x in seq_ids])
+            mkrs = [np.concatenate([dict_wfm_data['markers'][x][m] for x in seq_ids]) for m in range(len(dict_wfm_data['markers'][0]))]
+            return wfm, mkrs
+        for linked in [False, True]:
+            num_segs = {}
+            for algo in ['Basic', 'Hashed']:
+                awg_wfm.AutoCompression = algo
+                awg_wfm.AutoCompressionLinkChannels = linked
+                #Force reprogramming as the waveforms are unchanged
+                awg_wfm._cur_prog_waveforms = [None]*2
+                awg_wfm.prepare_initial()
+                awg_wfm.prepare_final()
+                for ind, dict_wfm_data in enumerate(awg_wfm.cur_wfms_to_commit):
+                    wfm, mkrs = expand(dict_wfm_data)
+                    assert np.array_equal(wfm, final_wfms[ind]), f"The {algo} auto-compression algorithm does not reproduce the waveform."
+                    for m in range(len(mkrs)):
+                        assert np.array_equal(mkrs[m], final_mkrs[ind][m]), f"The {algo} auto-compression algorithm does not reproduce the markers."
+                num_segs[algo] = (len(awg_wfm.cur_wfms_to_commit[0]['waveforms']), len(awg_wfm.cur_wfms_to_commit[0]['seq_ids']))
+            assert num_segs['Hashed'][0] <= num_segs['Basic'][0], "The Hashed auto-compression algorithm yields more unique segments than the Basic algorithm."
+            assert num_segs['Hashed'][1] < num_segs['Basic'][1], "The Hashed auto-compression algorithm did not merge repeated segments into loops."
+        awg_wfm.AutoCompression = 'None'
+        awg_wfm.AutoCompressionLinkChannels = False
+
+        shutil.rmtree('test_save_dir')
+        self.cleanup()
+
+    def test_DeltaUpload(self):
+        self.initialise()
+        awg_wfm = self.lab.HAL("Wfm1")
+        instr_awg = self.lab._get_instrument('virAWG')
+        #
+        #Verify that only the changed segments are uploaded when sweeping an amplitude over a long sequence
+        #
+        awg_wfm.clear_segments()
+        awg_wfm.add_waveform_segment(WFS_Constant("SEQPAD", None, 96e-9, 0.0))
+        awg_wfm.add_waveform_segment(WFS_Gaussian("init", None, 16e-9, 0.5))
+        awg_wfm.add_waveform_segment(WFS_Constant("zero1", None, 4000e-9, 0.1))
+        awg_wfm.add_waveform_segment(WFS_Gaussian("init2", None, 16e-9, 0.4))
+        awg_wfm.add_waveform_segment(WFS_Constant("zero2", None, 4000e-9, 0.0))
+        awg_wfm.get_output_channel(0).marker(0).set_markers_to_segments(["init"])
+        awg_wfm.AutoCompression = 'Hashed'
+        awg_wfm.prepare_initial()
+        awg_wfm.prepare_final()
+        full_bytes = instr_awg.UploadedBytes
+        num_seq_writes = instr_awg.NumSequenceWrites
+        for cur_ampl in [0.1, 0.2, 0.3]:
+            awg_wfm.get_waveform_segment('init2').Amplitude = cur_ampl
+            prev_bytes = instr_awg.UploadedBytes
+            awg_wfm.prepare_initial()
+            awg_wfm.prepare_final()
+            final_wfms = awg_wfm.get_raw_waveforms()
+            for ind, cur_ch in enumerate(['CH1', 'CH2']):
+                assert np.array_equal(instr_awg.get_programmed_waveform(cur_ch), final_wfms[ind]), "The waveform was not correctly programmed when only uploading the changed segments."
+            assert instr_awg.UploadedBytes - prev_bytes < full_bytes / 2, "More than the changed segments were uploaded when changing a single segment."
+            assert instr_awg.NumSequenceWrites == num_seq_writes, "The sequence was rewritten even though it did not change."
+        #Changing the sequence (init2 now repeats init) must rewrite it
+        awg_wfm.get_waveform_segment('init2').Amplitude = 0.5
+        awg_wfm.prepare_initial()
+        awg_wfm.prepare_final()
+        assert instr_awg.NumSequenceWrites > num_seq_writes, "The sequence was not rewritten after it changed."
+        final_wfms = awg_wfm.get_raw_waveforms()
+        for ind, cur_ch in enumerate(['CH1', 'CH2']):
+            assert np.array_equal(instr_awg.get_programmed_waveform(cur_ch), final_wfms[ind]), "The waveform was not correctly programmed after changing the sequence."
+        awg_wfm.AutoCompression = 'None'
+
+        shutil.rmtree('test_save_dir')
+        self.cleanup()
+
+    def test_ChangeDetection(self):
+        self.initialise()
+        awg_wfm = self.lab.HAL("Wfm1")
+        instr_awg = self.lab._get_instrument('virAWG')
+        #
+        #Verify that unchanged waveforms and markers are not reprogrammed while changes in either are detected
+        #
+        awg_wfm.clear_segments()
+        awg_wfm.add_waveform_segment(WFS_Constant("SEQPAD", None, 96e-9, 0.0))
+        awg_wfm.add_waveform_segment(WFS_Gaussian("init", None, 16e-9, 0.5))
+        awg_wfm.add_waveform_segment(WFS_Constant("zero1", None, 400e-9, 0.1))
+        awg_wfm.add_waveform_segment(WFS_Gaussian("init2", None, 16e-9, 0.4))
+        awg_wfm.get_output_channel(0).marker(0).set_markers_to_segments(["init"])
+        awg_wfm.get_output_channel(1).marker(1).set_markers_to_segments(["zero1"])
+        for algo in ['None', 'Hashed']:
+            awg_wfm.AutoCompression = algo
+            awg_wfm._cur_prog_waveforms = [None]*2
+            awg_wfm.prepare_initial()
+            awg_wfm.prepare_final()
+            assert not awg_wfm._dont_reprogram, "The waveform was not programmed initially."
+            prev_bytes = instr_awg.UploadedBytes
+            awg_wfm.prepare_initial()
+            awg_wfm.prepare_final()
+            assert awg_wfm._dont_reprogram and instr_awg.UploadedBytes == prev_bytes, f"An unchanged waveform was reprogrammed when using {algo} auto-compression."
+            #Change the markers only
+            awg_wfm.get_output_channel(1).marker(1).set_markers_to_segments(["init2"])
+            awg_wfm.prepare_initial()
+            assert not awg_wfm._dont_reprogram, f"A change in the markers was not detected when using {algo} auto-compression."
+            assert awg_wfm._cur_digests_to_commit[0] == awg_wfm._cur_prog_digests[0], "An unchanged channel was flagged as changed."
+            assert awg_wfm._cur_digests_to_commit[1] != awg_wfm._cur_prog_digests[1], "The marker change was not detected on the changed channel."
+            awg_wfm.prepare_final()
+            #Change the waveform only
+            awg_wfm.get_waveform_segment('zero1').Value = 0.2
+            awg_wfm.prepare_initial()
+            assert not awg_wfm._dont_reprogram, f"A change in the waveform was not detected when using {algo} auto-compression."
+            awg_wfm.prepare_final()
+            awg_wfm.get_waveform_segment('zero1').Value = 0.1
+            awg_wfm.get_output_channel(1).marker(1).set_markers_to_segments(["zero1"])
+        awg_wfm.AutoCompression = 'None'
+        #
+        #Verify that the compact markers reproduce the marker arrays
+        #
+        for cur_arr in [np.array([0,1,1,0,1]), np.array([1,1,0,0,0,1,1]), np.zeros(6), np.ones(3), np.array([])]:
+            assert np.array_equal(AWGMarkerEdges.from_array(cur_arr).to_array(), cur_arr), "The compact marker does not reproduce the marker array."
+        assert AWGMarkerEdges(10, [[0,3],[3,5],[7,12]]).Intervals.tolist() == [[0,5],[7,10]], "The compact marker intervals were not normalised."
+        cur_mkr = awg_wfm.get_output_channel(0).marker(0)
+        cur_mkr.set_markers_to_trigger()
+        cur_mkr.TrigPulseDelay = 20e-9
+        cur_mkr.TrigPulseLength = 50e-9
+        for cur_pol in [1, 0]:
+            cur_mkr.TrigPolarity = cur_pol
+            expected = np.zeros(awg_wfm.NumPts, dtype=np.ubyte) + 1 - cur_pol
+            expected[20:71] = cur_pol
+            assert np.array_equal(cur_mkr._assemble_marker_raw(), expected), f"The trigger marker with polarity {cur_pol} is incorrect."
+
+        shutil.rmtree('test_save_dir')
+        self.cleanup()
+
     def test_ValidLengthFunctions(self):
         self.initialise()
         awg_wfm = self.lab.HAL("Wfm1")
@@ -8,9 +8,11 @@ import sqdtoolz.Drivers.Dependencies.Spectrum.pyspcm as spcm
 from qcodes.instrument.base import Instrument
 import qcodes
 import gc
-from copy import deepcopy
 
 class ACQ_M4i_Digitiser(M4i):
+    #Approximate size of the blocks (in whole repetitions) streamed from the FIFO
+    BLOCK_BYTES = 2**20
+
     class DataArray(ArrayParameter):
         def __init__(self, *args, **kwargs):
             super().__init__(*args, snapshot_value=False, **kwargs)
@@ -180,104 +182,76 @@ class ACQ_M4i_Digitiser(M4i):
         new_rate = self.sample_rate.get()
         logging.warning(f"Cannot set sampling rate to {rate}, it is set to {new_rate} instead")
 
+    def get_scale_factors(self):
+        '''
+        Returns the factors (for every enabled channel) that convert the raw ADC values into voltages.
+        '''
+        ch_inds = [m for m in range(2) if self.ch_states[m]]
+        return [getattr(self, f'range_channel_{m}').get() / 1000 / self.ADC_to_voltage() for m in ch_inds]
+
+    def _get_blocksize(self):
+        #Number of segments per block (i.e. whole repetitions) streamed from the FIFO
+        rep_bytes = 2 * self.NumSegments * self.NumSamples * self.num_channels
+        return self.NumSegments * max(min(self.BLOCK_BYTES // rep_bytes, self.NumRepetitions), 1)
+
     def get_data(self, **kwargs):
         '''
-        Gets processed data from the GPU. Processing involves gathering data and passing it through TvMode
+        Gets the data from the card - either passing it through the data processor (given via the argument data_processor) or returning the
+        raw data. The raw data is written (as raw ADC values unless scale_to_voltage=True) into the optional argument out; an array of shape
+        (num_channels, NumRepetitions, NumSegments, NumSamples) that is otherwise allocated as float64.
         '''
         assert self.NumSamples > 32, "M4i requires the number of samples per segment to be at least 32."
         assert self.NumSamples % 16 == 0, "M4i requires the number of samples per segment to be divisible by 16."
 
         cur_processor = kwargs.get('data_processor', None)
 
-        #Capture extra frame when running SEQ triggering as the SEQ trigger signal on X0 may not align exactly before the first captured segment trigger...
-        if self.enable_TS_SEQ_trig():
-            total_frames = (self.NumRepetitions+1)*self.NumSegments
-        else:
-            total_frames = (self.NumRepetitions)*self.NumSegments
+        num_reps, num_segs, num_samples = self.NumRepetitions, self.NumSegments, self.NumSamples
+        num_channels = self.num_channels
+        blocksize = self._get_blocksize()
+        #The FIFO readout discards the segments captured before the first SEQ trigger (if enabled) and thus, only the required segments are read
+        blocks = self.multiple_trigger_fifo_acquisition(num_reps*num_segs, num_samples, blocksize, num_segs)
 
         if cur_processor == None:
-            if self.num_channels == 1:
-                final_arrs = [np.zeros(total_frames * self.NumSamples)]
-                final_arrs[0][:] = np.nan
-            else:
-                final_arrs = [np.zeros(total_frames * self.NumSamples), np.zeros(total_frames * self.NumSamples)]
-                final_arrs[0][:] = np.nan
-                final_arrs[1][:] = np.nan
-            #
-            cur_ind = 0
-            for cur_block in self.multiple_trigger_fifo_acquisition(total_frames, self.NumSamples, 1, self.NumSegments, notify_page_size_bytes=4096):
-                if self.num_channels == 1:
-                    blk_size = cur_block.size
-                    end_pt = min( blk_size, final_arrs[0].size - cur_ind)
-                    final_arrs[0][cur_ind:cur_ind+end_pt] = deepcopy(cur_block[:end_pt])
-                else:
-                    blk_size = int(cur_block.size/2)
-                    end_pt = min( blk_size, final_arrs[0].size - cur_ind)
-                    final_arrs[0][cur_ind:cur_ind+end_pt] = deepcopy(cur_block[:2*end_pt:2])
-                    final_arrs[1][cur_ind:cur_ind+end_pt] = deepcopy(cur_block[1:2*end_pt:2])
-                cur_ind += end_pt
-            #
-            total_num_data = self.NumRepetitions * self.NumSegments * self.NumSamples   #The trimmed indexing is required when using SEQ trigger mode in which the data will be taken in excess...
-            #TODO: Investigate the impact of multiplying by mVrange/1000/ADC_to_voltage() to get the voltage - may have a slight performance impact?
+            out = kwargs.get('out', None)
+            if out is None:
+                out = np.empty((num_channels, num_reps, num_segs, num_samples))
+            assert out.shape == (num_channels, num_reps, num_segs, num_samples), f"The output array must have the shape {(num_channels, num_reps, num_segs, num_samples)}."
+            assert out.flags.c_contiguous, "The output array must be C-contiguous."
+            out_segs = out.reshape(num_channels, num_reps*num_segs, num_samples)
+            scales = self.get_scale_factors() if kwargs.get('scale_to_voltage', False) else [1]*num_channels
+            #The blocks are views of the DMA buffer - so scale and cast them directly into the output array
+            cur_seg = 0
+            for cur_block in blocks:
+                cur_len = cur_block.shape[0]
+                for m in range(num_channels):
+                    if scales[m] == 1:
+                        np.copyto(out_segs[m, cur_seg:cur_seg+cur_len], cur_block[:,:,m], casting='unsafe')
+                    else:
+                        np.multiply(cur_block[:,:,m], scales[m], out=out_segs[m, cur_seg:cur_seg+cur_len], casting='unsafe')
+                cur_seg += cur_len
             return {'data': {
                 'parameters' : ['repetition', 'segment', 'sample'],
-                'data' : { f'ch{m}' : final_arrs[m][:total_num_data].reshape(self.NumRepetitions, self.NumSegments, self.NumSamples) for m in range(len(final_arrs)) },
-                'misc' : {'SampleRates' : [self.sample_rate.get()]*self.num_channels}
+                'data' : { f'ch{m}' : out[m] for m in range(num_channels) },
+                'misc' : {'SampleRates' : [self.sample_rate.get()]*num_channels}
             }}
         else:
-            #Gather data and either pass it to the data-processor or just collate it under final_arr - note that it is sent to the processor as properly grouped under the ACQ
-            #data format specification.
-            cache_array = []
-            total_reps = 0
-            done = False
-            for cur_block in self.multiple_trigger_fifo_acquisition(total_frames, self.NumSamples, 1, self.NumSegments, notify_page_size_bytes=4096):
-                if len(cache_array) > 0:
-                    arr_blk = np.concatenate((cache_array, np.array(cur_block)))
-                else:
-                    arr_blk = np.array(cur_block)
-
-                if self.num_channels == 1:
-                    num_reps = int( arr_blk.size / (self.NumSegments*self.NumSamples) ) 
-                    if num_reps + total_reps <= self.NumRepetitions:
-                        total_reps += num_reps                
-                        cache_array = arr_blk[(num_reps*self.NumSegments*self.NumSamples):]
-                        if num_reps == 0:
-                            continue
-                        arr_blk = [arr_blk[0:(num_reps*self.NumSegments*self.NumSamples)].reshape(num_reps, self.NumSegments, self.NumSamples)]
-                    else:
-                        num_reps = self.NumRepetitions - total_reps
-                        if num_reps == 0:
-                            done = True
-                        arr_blk = [arr_blk[0:(num_reps*self.NumSegments*self.NumSamples)].reshape(num_reps, self.NumSegments, self.NumSamples)]
-                        done = True
-                else:
-                    num_reps = int( arr_blk.size / (self.NumSegments*self.NumSamples*2) )
-                    if num_reps + total_reps <= self.NumRepetitions:
-                        total_reps += num_reps
-                        cache_array = arr_blk[(num_reps*self.NumSegments*self.NumSamples*2):]
-                        if num_reps == 0:
-                            continue
-                        arr_blk = [
-                            arr_blk[0:(num_reps*self.NumSegments*self.NumSamples*2):2].reshape(num_reps, self.NumSegments, self.NumSamples),
-                            arr_blk[1:(num_reps*self.NumSegments*self.NumSamples*2):2].reshape(num_reps, self.NumSegments, self.NumSamples)
-                        ]
-                    else:
-                        num_reps = self.NumRepetitions - total_reps
-                        if num_reps == 0:
-                            done = True
-                        arr_blk = [
-                            arr_blk[0:(num_reps*self.NumSegments*self.NumSamples*2):2].reshape(num_reps, self.NumSegments, self.NumSamples),
-                            arr_blk[1:(num_reps*self.NumSegments*self.NumSamples*2):2].reshape(num_reps, self.NumSegments, self.NumSamples)
-                        ]
-                        done = True
-                
+            #The data processor may retain the pushed data (e.g. when processing asynchronously) and thus, the blocks are copied out of the
+            #DMA buffer into a preallocated raw array - the processor is given int16 views of it (the scale factors to convert into voltages
+            #are given in 'misc').
+            raw_data = np.empty((num_channels, num_reps*num_segs, num_samples), dtype=np.int16)
+            sample_rate = self.sample_rate.get()
+            scales = self.get_scale_factors()
+            cur_seg = 0
+            for cur_block in blocks:
+                cur_len = cur_block.shape[0]
+                for m in range(num_channels):
+                    raw_data[m, cur_seg:cur_seg+cur_len] = cur_block[:,:,m]
                 cur_processor.push_data({
                     'parameters' : ['repetition', 'segment', 'sample'],
-                    'data' : { f'CH{m}' : arr_blk[m].astype(dtype=np.float64) for m in range(self.num_channels) },
-                    'misc' : {'SampleRates' : [self.sample_rate.get()]*self.num_channels}
+                    'data' : { f'CH{m}' : raw_data[m, cur_seg:cur_seg+cur_len].reshape(-1, num_segs, num_samples) for m in range(num_channels) },
+                    'misc' : {'SampleRates' : [sample_rate]*num_channels, 'RawDataType' : 'int16', 'ScaleFactors' : scales[:]}
                 })
-                if done:
-                    break
+                cur_seg += cur_len
         
             return {'data': cur_processor.get_all_data()}
 
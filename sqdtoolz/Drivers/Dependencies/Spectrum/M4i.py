@@ -38,6 +38,7 @@ from typing import Union, Type
 
 from sqdtoolz.Drivers.Dependencies.Spectrum.py_header.spcerr import*
 from sqdtoolz.Drivers.Dependencies.Spectrum.py_header.regs import*
+from sqdtoolz.Drivers.Dependencies.Spectrum.fifo_ring import read_fifo_blocks
 
 from qcodes.utils.validators import Enum, Numbers, Anything, Ints, Bool
 from qcodes.instrument.base import Instrument
@@ -83,6 +84,109 @@ def szTypeToName(lCardType):
         sName = 'unknown type'
     return sName
 
+# %% FIFO backend
+
+class M4iFifo:
+    '''
+    Backend (see fifo_ring.read_fifo_blocks) to stream the data from the card's DMA ring buffer in FIFO mode. When using SEQ triggering, the
+    time-stamps (one per segment with the X0 flag marking the SEQ trigger) are used to find the first segment after the SEQ trigger.
+    '''
+    BYTES_PER_TS = 16       #For M4i models
+    TS_BUFFER_BYTES = MEGA_B(1)
+
+    def __init__(self, parent, ring_bytes, notify_bytes, seg_len, use_seq):
+        self._parent = parent
+        self.notify_bytes = notify_bytes
+        self._ring_bytes = ring_bytes
+        #The DMA buffer is mapped directly as the int16 ring buffer
+        self._pvBuffer = pyspcm.pvAllocMemPageAligned(ring_bytes)
+        self.buffer = np.frombuffer(self._pvBuffer, dtype=np.int16)
+        self._seg_len = seg_len
+        self._use_seq = use_seq
+        self._seq_start = None
+        self._num_ts = 0
+        if use_seq:
+            self._ts_cbuffer = ct.create_string_buffer(self.TS_BUFFER_BYTES)
+            self._ts_buffer = np.frombuffer(self._ts_cbuffer, dtype=np.uint64, count=self.TS_BUFFER_BYTES // 8)
+
+    def start(self):
+        hCard = self._parent.hCard
+        pyspcm.spcm_dwDefTransfer_i64(hCard, pyspcm.SPCM_BUF_DATA, pyspcm.SPCM_DIR_CARDTOPC, pyspcm.int32(self.notify_bytes), self._pvBuffer, pyspcm.uint64(0), pyspcm.uint64(self._ring_bytes))
+        if self._use_seq:
+            #Initialise Time-Stamp mode...
+            self._parent._set_param32bit(pyspcm.SPC_TIMESTAMP_CMD, pyspcm.SPC_TSMODE_STARTRESET | pyspcm.SPC_TSCNT_REFCLOCKPOS)   #i.e. with reset X0 as the reference reset clock used for sequence triggering
+            #Notify size of 4096 is ignored in polling-mode, but needs to be set to 4k...
+            self._parent._def_transfer64bit(pyspcm.SPCM_BUF_TIMESTAMP, pyspcm.SPCM_DIR_CARDTOPC, 4096, self._ts_cbuffer, 0, pyspcm.uint64(self.TS_BUFFER_BYTES))
+            self._parent.general_command(pyspcm.M2CMD_EXTRA_POLL)
+        # start data acquisition & transfer
+        dwError = pyspcm.spcm_dwSetParam_i32(hCard, pyspcm.SPC_M2CMD, pyspcm.M2CMD_CARD_START | pyspcm.M2CMD_CARD_ENABLETRIGGER | pyspcm.M2CMD_DATA_STARTDMA)
+        if dwError != ERR_OK:
+            self._parent.get_error_info32bit(verbose=True)
+            assert False, "Could not start DMA transfer on M4i Digitiser card."
+
+    def wait(self):
+        hCard = self._parent.hCard
+        dwError = pyspcm.spcm_dwSetParam_i32(hCard, pyspcm.SPC_M2CMD, pyspcm.M2CMD_DATA_WAITDMA)
+        if dwError == ERR_TIMEOUT:
+            return None
+        assert dwError == ERR_OK, f"M4i DMA transfer failed with error code {dwError}."
+        if self._use_seq and self._seq_start != None:
+            #Read from TS Buffer to enact its clear/free functionality...
+            self._read_seq_flags()
+        lAvailUser = pyspcm.int32()
+        lPCPos = pyspcm.int32()
+        pyspcm.spcm_dwGetParam_i32(hCard, pyspcm.SPC_DATA_AVAIL_USER_LEN, pyspcm.byref(lAvailUser))
+        pyspcm.spcm_dwGetParam_i32(hCard, pyspcm.SPC_DATA_AVAIL_USER_POS, pyspcm.byref(lPCPos))
+        return (lAvailUser.value, lPCPos.value)
+
+    def release(self, num_bytes):
+        pyspcm.spcm_dwSetParam_i32(self._parent.hCard, pyspcm.SPC_DATA_AVAIL_CARD_LEN, int(num_bytes))
+
+    def _read_seq_flags(self):
+        #Returns the X0 (i.e. SEQ trigger) flags of the newly available time-stamps (one per segment) and frees them on the card
+        hCard = self._parent.hCard
+        lAvailUserTS = pyspcm.int32()
+        lPCPosTS = pyspcm.int32()
+        pyspcm.spcm_dwGetParam_i32(hCard, pyspcm.SPC_TS_AVAIL_USER_LEN, pyspcm.byref(lAvailUserTS))
+        if lAvailUserTS.value < self.BYTES_PER_TS:
+            return np.zeros(0, dtype=np.uint64)
+        pyspcm.spcm_dwGetParam_i32(hCard, pyspcm.SPC_TS_AVAIL_USER_POS, pyspcm.byref(lPCPosTS))
+        #Time-stamps wrapping around the end of the buffer are read on the next call
+        num_ts = min(lAvailUserTS.value, self.TS_BUFFER_BYTES - lPCPosTS.value) // self.BYTES_PER_TS
+        ind = lPCPosTS.value // 8
+        flags = (self._ts_buffer[ind:ind+2*num_ts:2] & np.uint64(0xFFFFF0000000000)) >> np.uint64(40)
+        pyspcm.spcm_dwSetParam_i32(hCard, pyspcm.SPC_TS_AVAIL_CARD_LEN, num_ts*self.BYTES_PER_TS)
+        return flags
+
+    def get_seq_start(self):
+        if not self._use_seq:
+            return 0, True
+        if self._seq_start is None:
+            flags = self._read_seq_flags()
+            first_ind = np.flatnonzero(flags)
+            if first_ind.size > 0:
+                self._seq_start = (self._num_ts + int(first_ind[0])) * self._seg_len
+            self._num_ts += flags.size
+        if self._seq_start is None:
+            return self._num_ts * self._seg_len, False
+        return self._seq_start, True
+
+    def stop(self):
+        hCard = self._parent.hCard
+        #Empty any remaining data in Main Buffer
+        lAvailUser = pyspcm.int32()
+        pyspcm.spcm_dwGetParam_i32(hCard, pyspcm.SPC_DATA_AVAIL_USER_LEN, pyspcm.byref(lAvailUser))
+        if lAvailUser.value > 0:
+            pyspcm.spcm_dwSetParam_i32(hCard, pyspcm.SPC_DATA_AVAIL_CARD_LEN, lAvailUser.value)
+        #Empty any remaining data in TS Buffer
+        if self._use_seq:
+            lAvailUserTS = pyspcm.int32()
+            pyspcm.spcm_dwGetParam_i32(hCard, pyspcm.SPC_TS_AVAIL_USER_LEN, pyspcm.byref(lAvailUserTS))
+            if lAvailUserTS.value >= self.BYTES_PER_TS:
+                pyspcm.spcm_dwSetParam_i32(hCard, pyspcm.SPC_TS_AVAIL_CARD_LEN, lAvailUserTS.value)
+        # stop transfer before invalidating buffer
+        self._parent._stop_acquisition()
+
 # %% Main driver class
 
 
@@ -824,14 +928,14 @@ class M4i(Instrument):
 
         return voltages
 
-    def multiple_trigger_fifo_acquisition(self, segments, num_samples, blocksize, segmentsPerSEQ=0, posttrigger=None, notify_page_size_bytes = 4096):
+    def multiple_trigger_fifo_acquisition(self, segments, num_samples, blocksize, segmentsPerSEQ=0, posttrigger=None, notify_page_size_bytes=None):
         '''
         Multiple recording acquisition with background DMA data transfer.
         
         Input
         -----
         segments: `int`
-            Total number of segments measured
+            Total number of segments measured (after the first SEQ trigger when using sequence triggering)
         samples: `int`, min 32 step 16
             Number of samples per segment
         blocksize: `int`
@@ -840,6 +944,9 @@ class M4i(Instrument):
             Number of segments per repetition (only relevant when using sequence triggering in which enable_TS_SEQ_trig is True)
         posttrigger: `int`, range 16 to samples-16 in steps of 16
             Number of samples recorded after each trigger. Defaults to samples-16. 
+        notify_page_size_bytes: `int`, multiple of 4096
+            Granularity in which the DMA transfers are notified. Defaults to the block size (in bytes) rounded down to a power of 2
+            (clipped to the range 4kB to 1MB).
             
         Yields
         ------
@@ -850,7 +957,9 @@ class M4i(Instrument):
         Notes
         -----
         * Returns a generator expression that can be used like an iterator in a for loop.
-        * The internal buffer is twice the size of data.
+        * The yielded blocks are views of the DMA ring buffer that are only valid until the next block is requested - i.e.
+        copy the data out of the block before requesting the next block (see fifo_ring.read_fifo_blocks).
+        * The internal ring buffer holds at least two blocks (and at least 4MB).
         * Buffer overrun detection may fail if the digitizer status is queried by the user
         during acquisition.
         '''
@@ -870,154 +979,16 @@ class M4i(Instrument):
         if not numch:
             raise RuntimeError('No channels are enabled.')
 
-        # setup software buffer(s)
-        qwBufferSize = pyspcm.uint64 (pyspcm.MEGA_B(4))
-        pvBuffer = pyspcm.pvAllocMemPageAligned(qwBufferSize.value)
-        lNotifySize = pyspcm.int32 (pyspcm.KILO_B(8)) 
-        #Setup H/W buffer
-        pyspcm.spcm_dwDefTransfer_i64(self.hCard, pyspcm.SPCM_BUF_DATA, pyspcm.SPCM_DIR_CARDTOPC, lNotifySize, pvBuffer, pyspcm.uint64 (0), qwBufferSize)
-
-        first_acq = False
-        if self.enable_TS_SEQ_trig():
-            #Initialise Time-Stamp mode...
-            self._set_param32bit(pyspcm.SPC_TIMESTAMP_CMD, pyspcm.SPC_TSMODE_STARTRESET | pyspcm.SPC_TSCNT_REFCLOCKPOS)   #i.e. with reset X0 as the reference reset clock used for sequence triggering
+        seg_len = num_samples*numch
+        block_bytes = 2*blocksize*seg_len
+        if notify_page_size_bytes is None:
+            notify_page_size_bytes = min(max(2**int(np.log2(block_bytes)), KILO_B(4)), MEGA_B(1))
+        ring_bytes = max(MEGA_B(4), 2*block_bytes + notify_page_size_bytes)
+        ring_bytes = int(np.ceil(ring_bytes / notify_page_size_bytes)) * notify_page_size_bytes
 
-            qwBufferSizeTS = pyspcm.uint64 (MEGA_B(1))
-            #TODO: Try to make dynamic via: (segmentsPerSEQ+1)*16 #Accounting for the 64-bit time-stamp value (allocating 2 blocks' worth - assuming that a block holds one full repetition)
-
-            time_buffers = ct.create_string_buffer(qwBufferSizeTS.value)
-            #Notify size of 4096 is ignored in polling-mode, but needs to be set to 4k...
-            self._def_transfer64bit(
-                pyspcm.SPCM_BUF_TIMESTAMP, pyspcm.SPCM_DIR_CARDTOPC, 4096, time_buffers, 
-                0, qwBufferSizeTS
-            )
-            pllData = ct.cast (time_buffers, pyspcm.ptr64)
-            first_acq = True
-
-        try:
-            # start data acquisition & transfer
-            if self.enable_TS_SEQ_trig():
-                self.general_command(pyspcm.M2CMD_EXTRA_POLL)
-            dwError = pyspcm.spcm_dwSetParam_i32(self.hCard, pyspcm.SPC_M2CMD, pyspcm.M2CMD_CARD_START | pyspcm.M2CMD_CARD_ENABLETRIGGER | pyspcm.M2CMD_DATA_STARTDMA)
-            if dwError != ERR_OK:
-                szErrorTextBuffer = create_string_buffer (ERRORTEXTLEN)
-                pyspcm.spcm_dwGetErrorInfo_i32 (self.hCard, None, None, szErrorTextBuffer)
-                print("{0}\n".format(szErrorTextBuffer.value))
-                print('Could not start DMA transfer on M4i Digitiser card')
-                spcm_vClose (self.hCard)
-            
-            lStatus = pyspcm.int32 ()
-            lAvailUser = pyspcm.int32 ()
-            lPCPos = pyspcm.int32 ()
-            #
-            qwTotalMem = pyspcm.uint64 (0)
-            lSegmentIndex = pyspcm.uint32 (0)
-            lSegmentCnt = pyspcm.uint32 (0)
-            #
-            #Timestamp-specific variables
-            lAvailUserTS = pyspcm.int32 ()
-            lPCPosTS = pyspcm.int32 ()
-            lBytesPerTS = 16        #For M4i models
-            ts_index = 0
-            #
-            #while qwTotalMem.value < 2*segments*num_samples*numch:  #2 Bytes per sample...
-            while qwTotalMem.value < 2*segments*num_samples*numch:
-                dwError = pyspcm.spcm_dwSetParam_i32 (self.hCard, pyspcm.SPC_M2CMD, pyspcm.M2CMD_DATA_WAITDMA)
-                if dwError != ERR_OK:
-                    print("... Error: {0:d}\n".format(dwError))
-                    assert dwError == ERR_TIMEOUT, "... Timeout\n"
-                    break
-                else:
-                    pyspcm.spcm_dwGetParam_i32 (self.hCard, pyspcm.SPC_M2STATUS,            pyspcm.byref (lStatus))
-                    pyspcm.spcm_dwGetParam_i32 (self.hCard, pyspcm.SPC_DATA_AVAIL_USER_LEN, pyspcm.byref (lAvailUser))
-                    pyspcm.spcm_dwGetParam_i32 (self.hCard, pyspcm.SPC_DATA_AVAIL_USER_POS, pyspcm.byref (lPCPos))
-
-                    data_arr = []
-                    if lAvailUser.value >= lNotifySize.value:
-                        qwTotalMem.value += lNotifySize.value
-                        
-                        # thi`s is the point to do anything with the data
-                        # e.g. calculate minimum and maximum of the acquired data
-                        # pnData = ct.cast(pvBuffer, pyspcm.ptr16) # cast to pointer to 16bit integer
-                        pnData = ct.cast(ct.addressof(pvBuffer) + lPCPos.value, pyspcm.ptr16)
-                        lNumSamples = int(lNotifySize.value / 2) # two bytes per sample
-                        for i in range (0, lNumSamples, 1):
-                            data_arr += [pnData[i]]
-
-                            lSegmentIndex.value += 1
-                            lSegmentIndex.value %= num_samples
-                            # check end of acquired segment
-                            if (lSegmentIndex.value == 0):
-                                lSegmentCnt.value += 1
-
-                        pyspcm.spcm_dwSetParam_i32(self.hCard, pyspcm.SPC_DATA_AVAIL_CARD_LEN, lNotifySize)
-                    
-                    if ts_index > 0:
-                        #If the time-stamp index is still beyond the current set of sampled waveform points, then don't return the array and just update the time-stamp index...
-                        if ts_index > len(data_arr):
-                            ts_index -= len(data_arr)
-                            del data_arr
-                            data_arr = []
-                    elif first_acq:
-                        ts_vals = []
-                        ts_times = []
-                        pyspcm.spcm_dwGetParam_i32(self.hCard, pyspcm.SPC_TS_AVAIL_USER_LEN, pyspcm.byref(lAvailUserTS))
-                        # read timestamp value (1 timestamp = 8 bytes (M2i, M3i) or 16 byte (M4i))
-                        if (lAvailUserTS.value >= lBytesPerTS):
-                            pyspcm.spcm_dwGetParam_i32 (self.hCard, pyspcm.SPC_TS_AVAIL_USER_POS, pyspcm.byref(lPCPosTS))
-                            if ((lPCPosTS.value + lAvailUserTS.value) >= qwBufferSizeTS.value):
-                                lAvailUserTS.value = qwBufferSizeTS.value - lPCPosTS.value
-                            for i in range (0, int (lAvailUserTS.value / lBytesPerTS), 1):
-                                # calculate current timestamp buffer index
-                                lIndex = int (lPCPosTS.value / 8) + i * int (lBytesPerTS / 8)
-                                # calculate timestamp value
-                                timestampVal = pllData[lIndex] #/ llSamplingrate.value
-                                ts_times += [timestampVal & 0xFFFFFFFFFF]
-                                ts_vals += [(timestampVal & 0xFFFFF0000000000)>>40]
-                            pyspcm.spcm_dwSetParam_i32 (self.hCard, pyspcm.SPC_TS_AVAIL_CARD_LEN, lAvailUserTS.value)
-                        #
-                        first_ind = next((i for i, x in enumerate(ts_vals) if x), None)
-                        if first_ind != None:
-                            #This time-stamp capture found the first SEQ trigger - great, now let's set that as the filtering index...
-                            first_ind = first_ind*num_samples*numch
-                            if first_ind > len(data_arr):
-                                #The slicing index falls beyond the current set of sampled waveform points in the buffer - so it'll fall in a future iteration...
-                                ts_index = first_ind - len(data_arr)
-                                del data_arr
-                                data_arr = []
-                            else:
-                                ts_index = first_ind
-                                #assert first_ind != None, "The SEQ trigger has not been captured - check that it's connected to input X0..."
-                                first_acq = False
-                        else:
-                            #The slicing index falls beyond the current set of sampled time-stamps - so it'll fall in a future iteration... Only a problem if beyond 1024 segments per repetition... What does the last sentence here even mean?
-                            del data_arr
-                            data_arr = []
-                    elif self.enable_TS_SEQ_trig():
-                        #Read from TS Buffer to enact its clear/free functionality...
-                        pyspcm.spcm_dwGetParam_i32(self.hCard, pyspcm.SPC_TS_AVAIL_USER_LEN, pyspcm.byref(lAvailUserTS))
-                        if (lAvailUserTS.value >= lBytesPerTS):
-                            pyspcm.spcm_dwSetParam_i32 (self.hCard, pyspcm.SPC_TS_AVAIL_CARD_LEN, lAvailUserTS.value)
-
-                    #Return the data if relevant...
-                    if len(data_arr) > 0:
-                        if ts_index > 0:
-                            yield np.array(data_arr[ts_index:])
-                            ts_index = 0
-                        else:
-                            yield np.array(data_arr)
-        finally:
-            #Empty any remaining data in Main Buffer
-            pyspcm.spcm_dwGetParam_i32(self.hCard, pyspcm.SPC_DATA_AVAIL_USER_LEN, pyspcm.byref (lAvailUser))
-            if (lAvailUser.value > 0):
-                pyspcm.spcm_dwSetParam_i32(self.hCard, pyspcm.SPC_DATA_AVAIL_CARD_LEN, lAvailUser)
-            #Empty any remaining data in TS Buffer
-            pyspcm.spcm_dwGetParam_i32(self.hCard, pyspcm.SPC_TS_AVAIL_USER_LEN, pyspcm.byref(lAvailUserTS))
-            if (lAvailUserTS.value >= lBytesPerTS):
-                pyspcm.spcm_dwSetParam_i32 (self.hCard, pyspcm.SPC_TS_AVAIL_CARD_LEN, lAvailUserTS.value)
-
-            # stop transfer before invalidating buffer
-            self._stop_acquisition()
+        cur_fifo = M4iFifo(self, ring_bytes, notify_page_size_bytes, seg_len, self.enable_TS_SEQ_trig())
+        for cur_block in read_fifo_blocks(cur_fifo, blocksize*seg_len, segments*seg_len):
+            yield cur_block.reshape(-1, num_samples, numch)
 
     def start_acquisition(self, mV_range, memsize, posttrigger_size=None, verbose=0):
         """ Start data acquisition of a single data trace
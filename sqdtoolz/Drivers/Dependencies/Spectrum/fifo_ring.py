@@ -0,0 +1,188 @@
+'''
+Ring-buffer readout of the M4i FIFO (multiple recording) mode.
+
+The card streams the samples (interleaved over the enabled channels) into a DMA buffer that is used as a ring. The function
+read_fifo_blocks walks this ring and yields the data in blocks as int16 views of the DMA buffer (only a block that straddles the end of the
+ring is stitched together in a staging array). The FIFO itself is accessed via a small backend interface:
+
+    - buffer        - int16 numpy array mapped over the DMA buffer (its size must be a multiple of the notify size)
+    - notify_bytes  - notify size in bytes (i.e. the granularity in which data is made available and is released)
+    - start()       - starts the acquisition and the DMA transfer
+    - wait()        - waits for the next chunk of data, returning (available bytes, ring position in bytes) or None on a timeout
+    - release(num)  - hands num bytes (at the ring position) back to the card
+    - get_seq_start() - returns (start, found) where start is the sample index (within the stream) of the first segment after a SEQ
+                        trigger if found is True. Otherwise, start is the number of samples known to precede the SEQ trigger.
+    - stop()        - stops the acquisition and the DMA transfer
+
+It is implemented by the M4i driver for the actual card and by SimulatedFifo (found here) to test the readout without any hardware - i.e.
+this module must not depend on pyspcm.
+'''
+import numpy as np
+import time
+
+def read_fifo_blocks(fifo, block_len, total_len):
+    '''
+    Generator yielding the FIFO data (starting at the SEQ trigger if applicable) in blocks of block_len samples until total_len samples
+    have been yielded (the last block being shorter if block_len does not divide total_len).
+
+    The yielded blocks are views of the DMA buffer. They are only valid until the generator is resumed, after which their memory is
+    handed back to the card. Thus, copy the data out of the block (e.g. into a preallocated array) before requesting the next block.
+    '''
+    ring = fifo.buffer
+    ring_len = ring.size
+    notify_len = fifo.notify_bytes // 2
+    assert ring_len % notify_len == 0, "The FIFO ring buffer size must be a multiple of the notify size."
+    assert block_len + notify_len <= ring_len, "The FIFO ring buffer is too small for the requested block size."
+    staging = np.empty(block_len, dtype=np.int16)
+
+    #All positions are sample indices within the stream (i.e. not wrapped by the ring size)
+    released = 0        #Samples handed back to the card (i.e. the card's ring position)
+    consumed = 0        #Samples that have either been yielded or discarded
+    out_start = None    #First sample to yield (i.e. the SEQ trigger position)
+
+    fifo.start()
+    try:
+        while out_start is None or consumed < out_start + total_len:
+            cur_avail = fifo.wait()
+            assert cur_avail != None, "Timed out while waiting for data from the M4i FIFO - check that the triggers (and the SEQ trigger on X0 if used) are connected."
+            stream_end = released + cur_avail[0] // 2
+
+            if out_start is None:
+                seq_start, found = fifo.get_seq_start()
+                if found:
+                    out_start = seq_start
+                #Discard the data known to precede the SEQ trigger (the rest is held until the SEQ trigger is found)
+                consumed = max(consumed, min(seq_start, stream_end))
+
+            while out_start != None and consumed < out_start + total_len:
+                cur_len = min(block_len, out_start + total_len - consumed)
+                if stream_end - consumed < cur_len:
+                    break
+                ind = consumed % ring_len
+                if ind + cur_len <= ring_len:
+                    yield ring[ind:ind+cur_len]
+                else:
+                    split = ring_len - ind
+                    staging[:split] = ring[ind:]
+                    staging[split:cur_len] = ring[:cur_len-split]
+                    yield staging[:cur_len]
+                consumed += cur_len
+                released = _release_chunks(fifo, released, consumed, notify_len)
+
+            released = _release_chunks(fifo, released, consumed, notify_len)
+    finally:
+        fifo.stop()
+
+def _release_chunks(fifo, released, consumed, notify_len):
+    #The memory is handed back to the card in whole notify-sized chunks
+    num_release = (consumed - released) // notify_len * notify_len
+    if num_release > 0:
+        fifo.release(num_release * 2)
+    return released + num_release
+
+class SimulatedFifo:
+    '''
+    Emulated M4i FIFO backend (for read_fifo_blocks) that requires no hardware. The card is simulated to record segments of seg_len
+    samples (interleaved over the enabled channels) continuously, filling the ring buffer notify chunk by notify chunk:
+
+        - data_rate - emulated data rate of the card in samples per second. If None, the ring buffer is filled as fast as possible. Otherwise,
+                      wait() sleeps until the next chunk has been recorded and an overrun (i.e. the card recording faster than the data is
+                      being released) raises an error like on the actual card.
+        - seq_offset - number of segments recorded before the first SEQ trigger. If None, SEQ triggering is not used.
+
+    The sample values are deterministic: every notify chunk is a fixed pseudo-random template offset by the chunk index (modulo 256) so that
+    any misplaced sample shows up in the readout. Use get_expected_data to generate the values expected in the readout.
+    '''
+    def __init__(self, seg_len, ring_bytes=2**22, notify_bytes=2**13, data_rate=None, seq_offset=None):
+        assert ring_bytes % notify_bytes == 0, "The ring buffer size must be a multiple of the notify size."
+        self.buffer = np.zeros(ring_bytes // 2, dtype=np.int16)
+        self.notify_bytes = notify_bytes
+        self._seg_len = seg_len
+        self._data_rate = data_rate
+        self._seq_offset = seq_offset
+        self._template = np.random.default_rng(0).integers(-2**14, 2**14, notify_bytes // 2).astype(np.int16)
+        self._written = 0
+        self._released = 0
+        self._start_time = None
+        self.NumWaits = 0
+
+    def start(self):
+        self._written = 0
+        self._released = 0
+        self._start_time = time.perf_counter()
+
+    def stop(self):
+        self._start_time = None
+
+    def get_expected_data(self, first_seg, num_segs):
+        '''
+        Returns the samples expected in the given segments (counted from the SEQ trigger) as an array of shape (num_segs, seg_len).
+        '''
+        if self._seq_offset != None:
+            first_seg += self._seq_offset
+        return self._generate(first_seg * self._seg_len, num_segs * self._seg_len).reshape(num_segs, self._seg_len)
+
+    def _generate(self, stream_pos, num_samples):
+        notify_len = self.notify_bytes // 2
+        inds = np.arange(stream_pos, stream_pos + num_samples)
+        return self._template[inds % notify_len] + (inds // notify_len % 256).astype(np.int16)
+
+    def _record_chunks(self, num_chunks):
+        notify_len = self.notify_bytes // 2
+        for m in range(num_chunks):
+            ind = self._written % self.buffer.size
+            np.add(self._template, np.int16(self._written // notify_len % 256), out=self.buffer[ind:ind+notify_len])
+            self._written += notify_len
+
+    def wait(self):
+        assert self._start_time != None, "The simulated FIFO has not been started."
+        self.NumWaits += 1
+        notify_len = self.notify_bytes // 2
+        free_chunks = (self.buffer.size - (self._written - self._released)) // notify_len
+        if self._data_rate is None:
+            if free_chunks == 0:
+                return None
+            self._record_chunks(free_chunks)
+        else:
+            #Wait for the next chunk (beyond those that have already been recorded) to be recorded by the card
+            next_time = self._start_time + (self._written + notify_len) / self._data_rate
+            time.sleep(max(next_time - time.perf_counter(), 0))
+            num_chunks = int((time.perf_counter() - self._start_time) * self._data_rate) // notify_len - self._written // notify_len
+            assert num_chunks <= free_chunks, "Simulated M4i FIFO buffer overrun - the data was not read out fast enough."
+            self._record_chunks(num_chunks)
+        return ((self._written - self._released) * 2, (self._released % self.buffer.size) * 2)
+
+    def release(self, num_bytes):
+        assert num_bytes % 2 == 0 and self._released + num_bytes // 2 <= self._written, "Cannot release more data than is available."
+        self._released += num_bytes // 2
+
+    def get_seq_start(self):
+        if self._seq_offset is None:
+            return 0, True
+        seq_start = self._seq_offset * self._seg_len
+        if self._written > seq_start:
+            return seq_start, True
+        #Like the time-stamps on the actual card, only the recorded segments are known to precede the SEQ trigger
+        return self._written // self._seg_len * self._seg_len, False
+
+def runme():
+    #Throughput of the ring-buffer readout (copying the blocks into a preallocated array) on a simulated card
+    num_channels, num_samples, num_segs, num_reps = 2, 1024, 4, 4096
+    seg_len = num_samples * num_channels
+    block_segs = num_segs * 64
+    fifo = SimulatedFifo(seg_len, seq_offset=3)
+    final_arr = np.empty((num_reps * num_segs, num_samples, num_channels), dtype=np.int16)
+
+    cur_time = time.perf_counter()
+    cur_seg = 0
+    for cur_block in read_fifo_blocks(fifo, block_segs * seg_len, num_reps * num_segs * seg_len):
+        cur_block = cur_block.reshape(-1, num_samples, num_channels)
+        final_arr[cur_seg:cur_seg+cur_block.shape[0]] = cur_block
+        cur_seg += cur_block.shape[0]
+    cur_time = time.perf_counter() - cur_time
+
+    assert np.array_equal(final_arr.reshape(-1, seg_len), fifo.get_expected_data(0, num_reps * num_segs)), "The FIFO readout is corrupted."
+    print(f'Read {final_arr.nbytes/1e6:.1f} MB in {cur_time*1e3:.1f} ms ({final_arr.nbytes/1e6/cur_time:.0f} MB/s) over {fifo.NumWaits} waits.')
+
+if __name__ == '__main__':
+    runme()
@@ -0,0 +1,305 @@
+'''
+Emulated drop-in replacement for the Tabor Proteus API (teproteus.py) - i.e. TEProteusAdmin and TEProteusInst.
+
+It requires neither the hardware nor TEProteus.dll. The SCPI settings are simply stored and returned on querying (with sensible replies to
+the status queries used by the Tabor_P2584M driver), while the digitiser memory is filled with synthetic offset-binary samples on reading
+it via :DIG:DATA:READ?. It is used by passing fake_backend=True into the Tabor_P2584M driver - e.g. to test the readout path or to
+benchmark its throughput by emulating the capture time (FramePeriod) and the transfer rate over the PXI backplane (TransferRate). The
+AWG segment definitions (:TRAC:DEF) are kept per memory bank while the segment uploads and task table writes are logged in SegmentWrites
+and TaskTableWrites - e.g. to test which parts of the AWG memory are reprogrammed.
+'''
+import numpy as np
+import time
+import re
+
+class TEProteusAdmin(object):
+    def __init__(self, lib_dir_path=None):
+        self._is_open = False
+        self._inst_dict = {}
+
+    def __enter__(self):
+        self.open_inst_admin()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close_inst_admin()
+
+    def open_inst_admin(self):
+        self._is_open = True
+        return 0
+
+    def close_inst_admin(self):
+        self.close_all_instruments()
+        self._is_open = False
+        return 0
+
+    def is_inst_admin_open(self):
+        return self._is_open
+
+    def get_slot_ids(self):
+        return [x for x in range(1, 19)]
+
+    def open_instrument(self, slot_id, reset_hot_flag=True):
+        assert self._is_open, "The (emulated) instruments-administrator must be opened first."
+        if slot_id in self._inst_dict:
+            return None     #Already in use - like in the actual API...
+        new_inst = TEProteusInst(self, slot_id)
+        self._inst_dict[slot_id] = new_inst
+        return new_inst
+
+    def close_all_instruments(self):
+        for cur_inst in list(self._inst_dict.values()):
+            cur_inst.close_instrument()
+
+class TEProteusInst(object):
+    #Replies to queries on settings that have not been set yet
+    DEFAULT_REPLIES = {
+        '*IDN' : 'Tabor Electronics,P2584M,000000000,1.0 (emulated)',
+        ':SYST:INF:MOD' : 'P2584M',
+        ':SYST:INF:DAC' : 'M0',
+        ':INST:CHAN' : '1',
+        ':TRAC:SEL:SEGM' : '1',
+        ':TRAC:FREE' : '8589934592',
+        ':DIG:MODE' : 'DUAL',
+        ':DIG:DDC:MODE' : 'REAL',
+        ':DSP:STOR' : 'DIR',
+        ':DIG:ACQ:AVER:STAT' : 'OFF',
+    }
+    #Maximum values returned on queries like :INST:CHAN? MAX
+    MAX_REPLIES = {
+        ':INST:CHAN' : '4',
+        ':TRAC:SEL:SEGM' : '65536',
+    }
+    FRAME_HEADER_BYTES = 88
+
+    def __init__(self, te_proteus_admin, slot_id):
+        self._admin = te_proteus_admin
+        self._slot_id = slot_id
+        self._default_paranoia_level = 1
+        self.timeout = 10000
+
+        self._default_replies = {self._norm_header(x) : self.DEFAULT_REPLIES[x] for x in self.DEFAULT_REPLIES}
+        self._max_replies = {self._norm_header(x) : self.MAX_REPLIES[x] for x in self.MAX_REPLIES}
+        self._settings = {}
+        #Per-channel digitiser settings (the channel being chosen via :DIG:CHAN:SEL)
+        self._dig_ch = 1
+        self._dig_ch_settings = {1 : {}, 2 : {}}
+        self._capture_start = None
+        self._frame_templates = {}
+        #Segment lengths defined via :TRAC:DEF keyed by (memory bank, segment number)
+        self._trace_lens = {}
+
+        self.FramePeriod = 0.0
+        self.TransferRate = None
+        self.NumBytesRead = 0
+        #Logs of (channel, segment number) for every :TRAC:DATA upload and the channel for every :TASK:COMP:WRIT
+        self.SegmentWrites = []
+        self.TaskTableWrites = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close_instrument()
+
+    @property
+    def default_paranoia_level(self):
+        return self._default_paranoia_level
+    @default_paranoia_level.setter
+    def default_paranoia_level(self, value):
+        self._default_paranoia_level = max(0, min(int(value), 2))
+
+    @property
+    def FramePeriod(self):
+        '''
+        Time (in seconds) taken to capture each frame after :DIG:INIT ON. The capture is reported done (via :DIG:ACQ:FRAM:STAT?) once all
+        the allocated frames have been captured.
+        '''
+        return self._frame_period
+    @FramePeriod.setter
+    def FramePeriod(self, period):
+        self._frame_period = period
+
+    @property
+    def TransferRate(self):
+        '''
+        Emulated transfer rate (in bytes per second) when reading data from the instrument. None reads the data as fast as possible.
+        '''
+        return self._transfer_rate
+    @TransferRate.setter
+    def TransferRate(self, bytes_per_second):
+        assert bytes_per_second is None or bytes_per_second > 0, "The transfer rate must be positive (or None)."
+        self._transfer_rate = bytes_per_second
+
+    def close_instrument(self):
+        if self._admin is not None:
+            self._admin._inst_dict.pop(self._slot_id, None)
+            self._admin = None
+
+    @staticmethod
+    def _norm_header(header):
+        #Normalise the SCPI header to the short-form of every node (e.g. :DIG:ACQuire:FRAM:STATus and :DIG:ACQ:FRAM:STAT are the same)
+        nodes = []
+        for cur_node in header.upper().split(':'):
+            leMatch = re.match(r'^(\*?[A-Z]+)(\d*)$', cur_node)
+            if leMatch is None:
+                nodes.append(cur_node)
+                continue
+            cur_name, cur_suffix = leMatch.groups()
+            if not cur_name.startswith('*'):
+                cur_name = cur_name[:4]
+                if len(cur_name) == 4 and cur_name[3] in 'AEIOU':
+                    cur_name = cur_name[:3]
+            nodes.append(cur_name + cur_suffix)
+        return ':'.join(nodes)
+
+    def _is_header(self, header, scpi_header):
+        return header == self._norm_header(scpi_header)
+
+    def _get_setting(self, scpi_header, default_val):
+        return self._settings.get(self._norm_header(scpi_header), default_val)
+
+    def _get_frame_def(self):
+        frame_def = self._get_setting(':DIG:ACQ:FRAM:DEF', '1,4800').split(',')
+        return int(frame_def[0]), int(frame_def[1])
+
+    def _get_selected_frames(self):
+        #Returns the first frame (zero-indexed) and the number of frames chosen to be read via :DIG:DATA:READ?
+        num_frames = self._get_frame_def()[0]
+        if self._get_setting(':DIG:DATA:SEL', 'ALL').upper() == 'ALL':
+            return 0, num_frames
+        first_frame, frame_count = [int(x) for x in self._get_setting(':DIG:DATA:FRAM', f'1,{num_frames}').split(',')]
+        return first_frame - 1, frame_count
+
+    def _get_sample_bytes(self):
+        #Repetition averaging accumulates the samples into 32-bit words
+        return 4 if self._get_setting(':DIG:ACQ:AVER:STAT', 'OFF').upper() == 'ON' else 2
+
+    def _reads_headers(self):
+        return self._get_setting(':DIG:DATA:TYPE', 'FRAM').upper().startswith('HEAD')
+
+    def _get_data_size(self):
+        first_frame, frame_count = self._get_selected_frames()
+        if self._reads_headers():
+            return frame_count * self.FRAME_HEADER_BYTES
+        return frame_count * self._get_frame_def()[1] * self._get_sample_bytes()
+
+    def _get_frame_status(self):
+        num_frames = self._get_frame_def()[0]
+        if self._capture_start is None:
+            return '0,0,0,0'
+        if self.FramePeriod > 0:
+            num_captured = min(int((time.perf_counter() - self._capture_start) / self.FramePeriod), num_frames)
+        else:
+            num_captured = num_frames
+        return f'1,{int(num_captured == num_frames)},0,{num_captured}'
+
+    def _get_awg_channel(self):
+        return int(float(self._get_setting(':INST:CHAN', '1')))
+
+    def _get_trace_key(self, seg_num):
+        #Channels 1 and 2 share memory bank 0 while channels 3 and 4 share memory bank 1
+        return ((self._get_awg_channel()-1) // 2, int(float(seg_num)))
+
+    def _is_channel_setting(self, header):
+        #Settings that are stored separately for every digitiser channel (chosen via :DIG:CHAN:SEL)
+        if self._is_header(header, ':DIG:CHAN:SEL'):
+            return False
+        return header.startswith(self._norm_header(':DIG:CHAN:')) or header.startswith(self._norm_header(':DIG:TRIG:'))
+
+    def _process_query(self, header, args):
+        if self._is_header(header, ':SYST:ERR'):
+            return '0, no error'
+        if self._is_header(header, '*OPC'):
+            return '1'
+        if self._is_header(header, ':DIG:ACQ:FRAM:STAT'):
+            return self._get_frame_status()
+        if self._is_header(header, ':DIG:DATA:SIZE'):
+            return str(self._get_data_size())
+        if self._is_header(header, ':TRAC:DEF:LENG'):
+            return str(self._trace_lens.get(self._get_trace_key(self._get_setting(':TRAC:SEL', '1')), 0))
+        if args.upper() == 'MAX' and header in self._max_replies:
+            return self._max_replies[header]
+        if self._is_channel_setting(header):
+            cur_val = self._dig_ch_settings[self._dig_ch].get(header)
+        else:
+            cur_val = self._settings.get(header)
+        if cur_val is None:
+            return self._default_replies.get(header, '0')
+        return cur_val
+
+    def _process_cmd(self, header, args):
+        if self._is_header(header, ':DIG:CHAN:SEL') or self._is_header(header, ':DIG:CHAN'):
+            self._dig_ch = int(float(args))
+        elif self._is_header(header, ':DIG:INIT') and args.upper() == 'ON':
+            self._capture_start = time.perf_counter()
+        elif self._is_header(header, ':TRAC:DEF'):
+            seg_num, seg_len = args.split(',')
+            self._trace_lens[self._get_trace_key(seg_num)] = int(float(seg_len))
+        elif self._is_header(header, ':TRAC:DEL:ALL'):
+            self._trace_lens.clear()
+        elif self._is_header(header, ':TASK:COMP:WRIT'):
+            self.TaskTableWrites.append(self._get_awg_channel())
+        elif self._is_header(header, '*RST'):
+            self._settings.clear()
+            self._dig_ch_settings = {1 : {}, 2 : {}}
+            self._capture_start = None
+            self._trace_lens.clear()
+            return
+        if self._is_channel_setting(header):
+            self._dig_ch_settings[self._dig_ch][header] = args
+        else:
+            self._settings[header] = args
+
+    def send_scpi_query(self, scpi_str, max_resp_len=256):
+        resp = ''
+        for cur_cmd in str(scpi_str).split(';'):
+            cur_cmd = cur_cmd.strip()
+            if cur_cmd == '':
+                continue
+            cur_parts = cur_cmd.split(None, 1)
+            header = cur_parts[0]
+            args = cur_parts[1].strip() if len(cur_parts) > 1 else ''
+            if header.endswith('?'):
+                resp = self._process_query(self._norm_header(header[:-1]), args)
+            else:
+                self._process_cmd(self._norm_header(header), args)
+        return resp[:max_resp_len]
+
+    def send_scpi_cmd(self, scpi_str, paranoia_level=None):
+        self.send_scpi_query(scpi_str)
+        return 0
+
+    def write_binary_data(self, scpi_pref, bin_dat):
+        self.send_scpi_query(scpi_pref)
+        if self._is_header(self._norm_header(scpi_pref.split()[0]), ':TRAC:DATA'):
+            self.SegmentWrites.append((self._get_awg_channel(), int(float(self._get_setting(':TRAC:SEL', '1')))))
+        return 0
+
+    def _get_frame_template(self, ch_num, frame_len, dtype):
+        #Synthetic frame: a tone (different on each channel) about the offset-binary mid-point
+        cur_key = (ch_num, frame_len, dtype)
+        if cur_key not in self._frame_templates:
+            t = np.arange(frame_len)
+            self._frame_templates[cur_key] = (2**15 + 2**13*np.sin(2*np.pi*t*ch_num/48.0)).astype(dtype)
+        return self._frame_templates[cur_key]
+
+    def read_binary_data(self, scpi_pref, out_array, num_bytes):
+        num_bytes = int(num_bytes)
+        assert num_bytes <= out_array.nbytes, f"The output array ({out_array.nbytes} bytes) is too small for the requested {num_bytes} bytes."
+        out_bytes = out_array.reshape(-1).view(np.uint8)[:num_bytes]
+        if self._reads_headers():
+            out_bytes[:] = 0
+        else:
+            #Every sample in a frame is the channel's template offset by the frame index (modulo 256) to identify the frames
+            dtype = np.uint32 if self._get_sample_bytes() == 4 else np.uint16
+            frame_len = self._get_frame_def()[1]
+            first_frame, frame_count = self._get_selected_frames()
+            frame_count = min(frame_count, num_bytes // (frame_len * dtype().itemsize))
+            out_frames = out_bytes[:frame_count*frame_len*dtype().itemsize].view(dtype).reshape(frame_count, frame_len)
+            frame_inds = (np.arange(first_frame, first_frame + frame_count) % 256).astype(dtype)
+            np.add(self._get_frame_template(self._dig_ch, frame_len, dtype)[None,:], frame_inds[:,None], out=out_frames)
+        if self.TransferRate is not None:
+            time.sleep(num_bytes / self.TransferRate)
+        self.NumBytesRead += num_bytes
+        return 0
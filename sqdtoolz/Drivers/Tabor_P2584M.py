@@ -2,6 +2,7 @@ import os
 import sys
 from sqdtoolz.Drivers.Dependencies.teproteus import TEProteusAdmin as TepAdmin
 from sqdtoolz.Drivers.Dependencies.teproteus import TEProteusInst as TepInst
+from sqdtoolz.Drivers.Dependencies.teproteus_fake import TEProteusAdmin as TepAdminFake
 from sqdtoolz.HAL.Processors.ProcessorFPGA import ProcessorFPGA
 from sqdtoolz.HAL.Processors.FPGA.FPGA_DDCFIR import FPGA_DDCFIR
 from sqdtoolz.HAL.Processors.FPGA.FPGA_DDC import FPGA_DDC
@@ -14,6 +15,7 @@ import numpy as np
 import math
 import time
 import datetime
+from concurrent.futures import ThreadPoolExecutor
 
 from qcodes import Instrument, InstrumentChannel, validators as vals
 from qcodes.instrument.parameter import ManualParameter
@@ -249,6 +251,10 @@ class TaborP2584M_AWG(InstrumentChannel):
 
         self._sequence_lens = [None]*4
         self._cur_internal_trigs = [False]*4
+        #Flags whether the memory banks were redefined (i.e. contents lost) in the last call to _setup_memory_banks
+        self._banks_redefined = [True]*2
+        #State (amplitude, offset, segment offset) of the segments last uploaded on every channel (None if unknown or using internal triggers)
+        self._prog_states = [None]*4
 
     @property
     def SampleRate(self):
@@ -269,7 +275,7 @@ class TaborP2584M_AWG(InstrumentChannel):
 
     @property
     def AutoCompressionSupport(self):
-        return {'Supported' : True, 'MinSize' : 1024, 'Multiple' : 32}
+        return {'Supported' : True, 'MinSize' : 1024, 'Multiple' : 32, 'Loops' : True}
 
     @property
     def MemoryRequirements(self):
@@ -341,7 +347,7 @@ class TaborP2584M_AWG(InstrumentChannel):
             if self._sequence_lens[bank*2] != None:
                 for m, cur_len in enumerate(self._sequence_lens[bank*2]):
                     self._parent._set_cmd(':TRACe:SEL', m+1)
-                    cur_mem_len = self._parent._get_cmd(':TRAC:DEF:LENG?')
+                    cur_mem_len = int(self._parent._get_cmd(':TRAC:DEF:LENG?'))
                     if cur_mem_len != cur_len:
                         reset_banks = True
                         break
@@ -354,7 +360,7 @@ class TaborP2584M_AWG(InstrumentChannel):
             if self._sequence_lens[bank*2+1] != None and not reset_banks:
                 for m, cur_len in enumerate(self._sequence_lens[bank*2+1]):
                     self._parent._set_cmd(':TRACe:SEL', m+1+prev_ch_data_seq_len)
-                    cur_mem_len = self._parent._get_cmd(':TRAC:DEF:LENG?')
+                    cur_mem_len = int(self._parent._get_cmd(':TRAC:DEF:LENG?'))
                     if cur_mem_len != cur_len:
                         reset_banks = True
                         break
@@ -363,6 +369,7 @@ class TaborP2584M_AWG(InstrumentChannel):
                 pass
             self._parent._chk_err('after setting up memory banks.')
 
+            self._banks_redefined[bank] = reset_banks
             if reset_banks:
                 # self._parent._send_cmd(':TRAC:DEL:ALL')
                 if self._sequence_lens[bank*2] != None:
@@ -387,14 +394,7 @@ class TaborP2584M_AWG(InstrumentChannel):
         cur_chnl = self._get_channel_output(chan_id)
 
         self._setup_memory_banks()
-
-        # Setup segment offsets
-        if chan_ind == 1:
-            seg_offset = self._seg_off_ch2
-        elif chan_ind == 3:
-            seg_offset = self._seg_off_ch4
-        else:
-            seg_offset = 0
+        seg_offset = self._get_segment_offset(chan_ind)
 
         #Select channel
         self._parent._set_cmd(':INST:CHAN', chan_ind+1)
@@ -435,23 +435,15 @@ class TaborP2584M_AWG(InstrumentChannel):
             self._parent.ACQ.trigger2Source(f'TASK{chan_ind+1}')
             # Set Trigger AWG delay to 0 - ?????
             self._parent._send_cmd(':DIG:TRIG:AWG:TDEL {0}'.format(4e-9))
+            self._prog_states[chan_ind] = None
         else:
             self._parent.ACQ.trigger1Source('EXT')
             self._parent.ACQ.trigger2Source('EXT')
-            task_list = []
-            for m, seg_id in enumerate(dict_wfm_data['seq_ids']):
-                task_list += [AWG_TaborP2584M_task(seg_id+1 + seg_offset, 1, (m+1)+1)]
-            task_list[0].trig_src = cur_chnl.trig_src()     #First task is triggered off the TRIG source
-            task_list[-1].next_task_ind = 1                 #Last task maps back onto the first task
+            task_list = self._get_sequence_task_list(cur_chnl, seg_offset, dict_wfm_data)
+            self._prog_states[chan_ind] = (cur_chnl.Amplitude, cur_chnl.Offset, seg_offset)
 
         #Program the memory banks
-        for m in range(len(dict_wfm_data['waveforms'])):
-            cur_data = dict_wfm_data['waveforms'][m]
-            cur_amp = cur_chnl.Amplitude/2
-            cur_off = cur_chnl.Offset   #Don't compensate for offset... # NOTE: this used to be multiplied by 0
-            cur_data = (cur_data - cur_off)/cur_amp
-            assert (max(cur_data) < np.abs(cur_chnl.Amplitude + cur_chnl.Offset)), "The Amplitude and Offset are too large, output will be saturated"
-            self._send_data_to_memory(m+1 + seg_offset, cur_data, dict_wfm_data['markers'][m])
+        self._program_segments(cur_chnl, seg_offset, dict_wfm_data, range(len(dict_wfm_data['waveforms'])))
         #Program the task table...            
         self._program_task_table(chan_ind+1, task_list)
         
@@ -460,6 +452,75 @@ class TaborP2584M_AWG(InstrumentChannel):
         while not self._parent._get_cmd('*OPC?'):
             pass
 
+    def program_channel_delta(self, chan_id, dict_wfm_data, dirty_segs, seq_changed):
+        """
+        Method to program channel by only uploading the segments that have changed since the last programming
+        @param chan_id: Id of channel to be programmed
+        @param dict_wfm_data: wfm data to be programmed
+        @param dirty_segs: list of flags for every segment in dict_wfm_data['waveforms'] that has changed
+        @param seq_changed: True if the sequence (i.e. seq_ids and seq_loops) has changed
+        """
+        chan_ind = self._ch_list.index(chan_id)
+        cur_chnl = self._get_channel_output(chan_id)
+
+        #Internal triggers rebuild the segments from the markers - so just program everything
+        if dict_wfm_data['markers'][0][2].size > 0 or self._prog_states[chan_ind] is None:
+            self.program_channel(chan_id, dict_wfm_data)
+            return
+
+        self._setup_memory_banks()
+        seg_offset = self._get_segment_offset(chan_ind)
+
+        #Everything must be reprogrammed if the memory banks were redefined or if the segments were normalised differently
+        cur_state = (cur_chnl.Amplitude, cur_chnl.Offset, seg_offset)
+        if self._banks_redefined[chan_ind // 2] or self._prog_states[chan_ind] != cur_state:
+            dirty_segs = [True]*len(dict_wfm_data['waveforms'])
+            seq_changed = True
+        if not seq_changed and not any(dirty_segs):
+            return
+
+        #Select channel
+        self._parent._set_cmd(':INST:CHAN', chan_ind+1)
+        #Program the changed segments in the memory banks
+        self._program_segments(cur_chnl, seg_offset, dict_wfm_data, [m for m, x in enumerate(dirty_segs) if x])
+        self._prog_states[chan_ind] = cur_state
+        #Only rewrite the task table if the sequence has changed
+        if seq_changed:
+            self._parent.ACQ.trigger1Source('EXT')
+            self._parent.ACQ.trigger2Source('EXT')
+            self._program_task_table(chan_ind+1, self._get_sequence_task_list(cur_chnl, seg_offset, dict_wfm_data))
+            self._parent._set_cmd('FUNC:MODE', 'TASK')
+        # Ensure all previous commands have been executed
+        while not self._parent._get_cmd('*OPC?'):
+            pass
+
+    def _get_segment_offset(self, chan_ind):
+        # Setup segment offsets
+        if chan_ind == 1:
+            return self._seg_off_ch2
+        elif chan_ind == 3:
+            return self._seg_off_ch4
+        else:
+            return 0
+
+    def _get_sequence_task_list(self, cur_chnl, seg_offset, dict_wfm_data):
+        task_list = []
+        seq_loops = dict_wfm_data.get('seq_loops', [1]*len(dict_wfm_data['seq_ids']))
+        for m, seg_id in enumerate(dict_wfm_data['seq_ids']):
+            task_list += [AWG_TaborP2584M_task(seg_id+1 + seg_offset, seq_loops[m], (m+1)+1)]
+        task_list[0].trig_src = cur_chnl.trig_src()     #First task is triggered off the TRIG source
+        task_list[-1].next_task_ind = 1                 #Last task maps back onto the first task
+        return task_list
+
+    def _program_segments(self, cur_chnl, seg_offset, dict_wfm_data, seg_inds):
+        for m in seg_inds:
+            cur_data = dict_wfm_data['waveforms'][m]
+            cur_amp = cur_chnl.Amplitude/2
+            cur_off = cur_chnl.Offset   #Don't compensate for offset... # NOTE: this used to be multiplied by 0
+            cur_data = (cur_data - cur_off)/cur_amp
+            assert (max(cur_data) < np.abs(cur_chnl.Amplitude + cur_chnl.Offset)), "The Amplitude and Offset are too large, output will be saturated"
+            self._send_data_to_memory(m+1 + seg_offset, cur_data, dict_wfm_data['markers'][m])
+
     def _program_task_table(self, channel_index, tasks):
         #Select current channel
         self._parent._set_cmd(':INST:CHAN', channel_index)
@@ -566,6 +627,23 @@ class TaborP2584M_ACQ(InstrumentChannel):
     digitizes in dual mode or single mode. For now, 
     this driver only operates in dual mode (separate signals on each acquistion channel)
     """
+    #Capture time per repetition (in seconds) assumed before any capture has been timed
+    DEFAULT_REP_TIME = 5e-6
+    #The completion polling starts at this fraction of the expected capture time
+    POLL_START_FRACTION = 0.5
+    #The polling interval starts at POLL_MIN_INTERVAL and doubles (POLL_BACKOFF) on every poll up to the smaller of POLL_MAX_INTERVAL and
+    #POLL_MAX_FRACTION of the expected (or elapsed if longer) capture time (in seconds)
+    POLL_MIN_INTERVAL = 100e-6
+    POLL_MAX_INTERVAL = 0.1
+    POLL_MAX_FRACTION = 0.1
+    POLL_BACKOFF = 2.0
+    #Weight given to the latest capture when updating the learnt capture time per repetition - the latest capture time is taken directly if
+    #it differs from the learnt one by more than the factor REP_TIME_RESET_RATIO (e.g. on changing the experiment)
+    REP_TIME_SMOOTHING = 0.5
+    REP_TIME_RESET_RATIO = 2.0
+    #Time (in seconds) beyond the expected capture time without a captured frame before assuming that no trigger is present
+    NO_TRIGGER_TIMEOUT = 10.0
+
     def __init__(self, parent):
         super().__init__(parent, 'ACQ')
         self._parent = parent
@@ -750,6 +828,9 @@ class TaborP2584M_ACQ(InstrumentChannel):
 
         self._dsp_kernel_coefs = [None]*10
 
+        #Capture time per repetition learnt from the previous captures (None if no capture has been timed yet)
+        self._rep_time_est = None
+
     @property
     def NumSamples(self):
         return self._num_samples
@@ -1009,99 +1090,66 @@ class TaborP2584M_ACQ(InstrumentChannel):
 
         return self._get_captured_header(N=number_of_frames, buf=wav2) #dec_vals
 
-    def process_block(self, block_idx, cur_processor, blocksize):
-        if block_idx == 0:
-            #Choose what to read (only the frame-data without the header in this example)
-            self._parent._set_cmd(':DIG:DATA:TYPE', 'FRAM')
-            #Choose which frames to read (One or more frames in this case)
-            self._parent._set_cmd(':DIG:DATA:SEL', 'FRAM') 
-            
-            self._parent._set_cmd(':DIG:DATA:FRAM', f'{1},{blocksize*self.NumSegments}')
-
-            # Get the total data size (in bytes)
-            resp = self._parent._get_cmd(':DIG:DATA:SIZE?')
-            # self.num_bytes = 4176*np.uint64(resp)
-            # self.num_bytes = np.uint64(resp)
-            # print(resp, self.num_bytes, 'hi', self._parent._get_cmd(':DIG:DATA:FRAM?'))
-
-            # wavlen = int(self.num_bytes // 2)
-            wavlen = int(blocksize*self.NumSegments*self.NumSamples)
-            # print(self.num_bytes)
-            #TODO : Run a check on DSP before setting up the waves, NEED TO KNOW WHAT CHANNEL AS WELL
-            if (self.ddr_store() == "DIR") :
-                wav1 = np.zeros(wavlen, dtype=np.uint16)   #NOTE!!! FOR DSP, THIS MUST BE np.uint32 - SO MAKE SURE TO SWITCH/CHANGE (uint16 otherwise)
-                wav1 = wav1.reshape(blocksize, self.NumSegments, self.NumSamples)
-            else :
-                wav1 = np.zeros(wavlen, dtype=np.uint32)   #NOTE!!! FOR DSP, THIS MUST BE np.uint32 - SO MAKE SURE TO SWITCH/CHANGE (uint16 otherwise)
-                wav1 = wav1.reshape(blocksize, self.NumSegments, self.NumSamples)
-
-            if (self.ddr_store() == "DIR") :
-                wav2 = np.zeros(wavlen, dtype=np.uint16)   #NOTE!!! FOR DSP, THIS MUST BE np.uint32 - SO MAKE SURE TO SWITCH/CHANGE (uint16 otherwise)
-                wav2 = wav2.reshape(blocksize, self.NumSegments, self.NumSamples)
-            else :
-                wav2 = np.zeros(wavlen, dtype=np.uint32)   #NOTE!!! FOR DSP, THIS MUST BE np.uint32 - SO MAKE SURE TO SWITCH/CHANGE (uint16 otherwise)
-                wav2 = wav2.reshape(blocksize, self.NumSegments, self.NumSamples)
+    def _read_block(self, block_idx, blocksize, read_bufs):
+        '''
+        Reads the frames of a block of repetitions (the last block may be partial) from the FPGA DRAM directly into the corresponding slices
+        of the readout buffers (one per active channel) and returns these slices as views (no copies are made).
+        '''
+        rep_start = block_idx*blocksize
+        rep_stop = min(rep_start + blocksize, self.NumRepetitions)
+        #Select the frames to read
+        self._parent._set_cmd(':DIG:DATA:FRAM', f'{1+rep_start*self.NumSegments},{(rep_stop-rep_start)*self.NumSegments}')
+        # Get the total data size (in bytes)
+        num_bytes = np.uint64(self._parent._get_cmd(':DIG:DATA:SIZE?'))
+        ret_val = {}
+        for ch_ind in read_bufs:
+            cur_view = read_bufs[ch_ind][rep_start:rep_stop]
+            assert num_bytes <= cur_view.nbytes, f"The ACQ block data ({num_bytes} bytes) does not fit into the readout buffer ({cur_view.nbytes} bytes)."
+            self._parent._set_cmd(':DIG:CHAN:SEL', ch_ind+1)
+            rc = self._parent._inst.read_binary_data(':DIG:DATA:READ?', cur_view, num_bytes)
+            ret_val[f'CH{ch_ind+1}'] = cur_view
+        # Check errors
+        self._parent._chk_err('after downloading the ACQ data from the FGPA DRAM.')
+        return ret_val
 
-            self.wav1 = wav1
-            self.wav2 = wav2
+    def process_blocks(self, cur_processor, blocksize):
+        '''
+        Streams the captured frames into the CPU processor in blocks of repetitions. The readout is double-buffered: the next block is read
+        in a background thread while the current block is being pushed into (and possibly processed by) the processor.
 
-        resp = self._parent._get_cmd(':DIG:DATA:SIZE?')
-        num_bytes = np.uint64(resp)
+        The raw samples are handed over as views of the readout buffers (i.e. without copying or casting them) with their data type tagged
+        under 'RawDataType' in 'misc'. The buffers are allocated once per capture (via np.empty) and never reused as the processor may
+        still hold onto the data packets (e.g. when queued for processing in get_all_data).
+        '''
+        #Choose what to read (only the frame-data without the header)
+        self._parent._set_cmd(':DIG:DATA:TYPE', 'FRAM')
+        #Choose which frames to read (One or more frames in this case)
+        self._parent._set_cmd(':DIG:DATA:SEL', 'FRAM')
 
-        # Select the frames to read
-        self._parent._set_cmd(':DIG:DATA:FRAM', f'{1+block_idx*blocksize},{blocksize}')
-        if (self.ChannelStates[0]) :
-            # Read from channel 1
-            self._parent._set_cmd(':DIG:CHAN:SEL', 1)
-            rc = self._parent._inst.read_binary_data(':DIG:DATA:READ?', self.wav1, num_bytes)
-        if (self.ChannelStates[1]) :
-            # read from channel 2
-            self._parent._set_cmd(':DIG:CHAN:SEL', 2)
-            rc = self._parent._inst.read_binary_data(':DIG:DATA:READ?', self.wav2, num_bytes)
-        # Check errors
-        self._parent._chk_err('after downloading the ACQ data from the FGPA DRAM.')
-        sampleRates = []
-        
-        # Adjust Sample Rates for DDC stages if in DSP Mode
-        # if (self.ddr1_store() == "DIR1") :
-        #     sampleRates.append(self.SampleRate)
-        # elif (self.ddc_mode() == "REAL") :
-        #     # We are in non-direct REAL mode = DSP is enabled
-        #     sampleRates.append(self.SampleRate/16)
-        # else :
-        #     sampleRates.append(self.SampleRate)
-
-        # if (self.ddr2_store() == "DIR2") :
-        #     sampleRates = sampleRates.append(self.SampleRate)
-        # elif (self.ddc_mode() == "REAL") :
-        #     # We are in non-direct REAL mode = DSP is enabled
-        #     sampleRates.append(self.SampleRate/16)
-        # else :
-        #     sampleRates.append(self.SampleRate)
-
-        #TODO: Write some blocked caching code here (like with the M4i)... 
-        """ 
-        ret_val = {
-                    'parameters' : ['repetition', 'segment', 'sample'],
-                    'data' : {
-                                'CH1' : self.wav1.astype(np.int32),
-                                'CH2' : self.wav2.astype(np.int32),
-                                },
-                    'misc' : {'SampleRates' : [self.SampleRate] * 2}  #NOTE!!! DIVIDE SAMPLERATE BY /16 IF USING DECIMATION STAGES! # sampleRates
-                }
-        """
-        ret_val = {
-                        'parameters' : ['repetition', 'sample'],
-                        'data' : {},
-                        'misc' : {'SampleRates' : [self.SampleRate]*2}
-                    }
-        # Only return data which matches channels that are active
-        if (self.ChannelStates[0]) :
-            ret_val['data']['CH1'] = self.wav1.astype(np.int32)
-        if (self.ChannelStates[1]) :
-            ret_val['data']['CH2'] = self.wav2.astype(np.int32)
-
-        cur_processor.push_data(ret_val)
+        if (self.ddr_store() == "DIR") :
+            data_type = np.uint16
+        else :
+            data_type = np.uint32   #NOTE!!! FOR DSP, THIS MUST BE np.uint32
+        read_bufs = {}
+        for ch_ind in range(2):
+            if self.ChannelStates[ch_ind]:
+                read_bufs[ch_ind] = np.empty((self.NumRepetitions, self.NumSegments, self.NumSamples), dtype=data_type)
+
+        if hasattr(cur_processor, 'set_expected_repetitions'):
+            cur_processor.set_expected_repetitions(self.NumRepetitions)
+
+        num_blocks = int(np.ceil(self.NumRepetitions / blocksize))
+        with ThreadPoolExecutor(max_workers=1) as block_reader:
+            next_block = block_reader.submit(self._read_block, 0, blocksize, read_bufs)
+            for block_idx in range(num_blocks):
+                cur_block = next_block.result()
+                if block_idx + 1 < num_blocks:
+                    next_block = block_reader.submit(self._read_block, block_idx + 1, blocksize, read_bufs)
+                cur_processor.push_data({
+                        'parameters' : ['repetition', 'segment', 'sample'],
+                        'data' : cur_block,
+                        'misc' : {'SampleRates' : [self.SampleRate]*len(cur_block), 'RawDataType' : np.dtype(data_type).name}
+                    })
 
     def convert_IQ_to_sample(self, inp_i,inp_q,size):
         """
@@ -1392,23 +1440,47 @@ class TaborP2584M_ACQ(InstrumentChannel):
                 dec_blk_ind += 1
             cur_dsp_path = 6
 
-    def _wait_till_DIG_done(self):
-        #Poll for status bit
-        loopcount = 0
-        captured_frame_count = 0
+    def _get_expected_capture_time(self):
+        if self._rep_time_est is None:
+            return self.NumRepetitions * self.DEFAULT_REP_TIME
+        return self.NumRepetitions * self._rep_time_est
+
+    def _wait_till_DIG_done(self, capture_start, expected_time):
+        '''
+        Polls the status of the digitizer until all frames have been captured. The polling starts well before the expected end of the
+        capture (POLL_START_FRACTION) with an exponentially increasing interval so that short captures are caught early while long captures
+        are not flooded with queries. The capture time per repetition is learnt from the polls to refine the expected capture time.
+        '''
+        poll_interval = self.POLL_MIN_INTERVAL
+        time.sleep(max(capture_start + expected_time * self.POLL_START_FRACTION - time.perf_counter(), 0))
+        last_poll_time = None   #Time (since capture_start) of the last poll in which the capture was not done
         is_done = False
-        while not is_done:#captured_frame_count < num_frames:
+        while True:
             resp = self._parent._get_cmd(":DIG:ACQuire:FRAM:STATus?")
+            cur_time = time.perf_counter() - capture_start
             resp_items = resp.split(',')
             is_done = (int(resp_items[1]) == 1)
             captured_frame_count = int(resp_items[3])
-            done = int(resp_items[1])
-            # print(f"done{captured_frame_count}")
-            #print("{0}. {1}".format(done, resp_items))
-            loopcount += 1
-            if loopcount > 1000000 and captured_frame_count == 0:    #As in nothing captured over 100000 check-loops...
-                #print("No Trigger was detected")
+            if is_done:
+                break
+            if captured_frame_count == 0 and cur_time > expected_time + self.NO_TRIGGER_TIMEOUT:
                 assert False, "No trigger detected during the acquisiton sniffing window."
+            last_poll_time = cur_time
+            time.sleep(poll_interval)
+            max_interval = min(self.POLL_MAX_INTERVAL, max(self.POLL_MIN_INTERVAL, max(expected_time, cur_time) * self.POLL_MAX_FRACTION))
+            poll_interval = min(poll_interval * self.POLL_BACKOFF, max_interval)
+
+        #The capture finished between the last two polls. If it already finished on the first poll, only an upper bound is known (the
+        #capture may be much shorter than the now too long previous estimate) - so cap it at DEFAULT_REP_TIME so that the next capture is
+        #polled from early on (and thus timed properly) instead of merely halving the estimate on every capture.
+        if last_poll_time is None:
+            self._rep_time_est = min(cur_time / self.NumRepetitions, self.DEFAULT_REP_TIME)
+        else:
+            cur_rep_time = 0.5 * (last_poll_time + cur_time) / self.NumRepetitions
+            if self._rep_time_est is None or not (1.0/self.REP_TIME_RESET_RATIO <= cur_rep_time / self._rep_time_est <= self.REP_TIME_RESET_RATIO):
+                self._rep_time_est = cur_rep_time
+            else:
+                self._rep_time_est += self.REP_TIME_SMOOTHING * (cur_rep_time - self._rep_time_est)
 
     def _perform_data_capture(self, cur_processor, final_dsp_order, blocksize):
         num_frames = self.NumRepetitions*self.NumSegments
@@ -1416,33 +1488,24 @@ class TaborP2584M_ACQ(InstrumentChannel):
             num_frames = 1
 
         self._parent._chk_err('before')
+        expected_time = self._get_expected_capture_time()
         self._parent._set_cmd(':DIG:INIT', 'ON')
+        capture_start = time.perf_counter()
         self._parent._chk_err('dig:on')
         
         # print('starting')
         # self.func()
-        expected_time = self.NumRepetitions * 5e-6
-        time.sleep(expected_time)
-        self._wait_till_DIG_done()
+        self._wait_till_DIG_done(capture_start, expected_time)
+
+        # Stop the digitizer's capturing machine (to be on the safe side)
+        self._parent._set_cmd(':DIG:INIT', 'OFF')
+        self._parent._chk_err('after actual acquisition.')
 
-        #TODO: Write some blocked caching code here (like with the M4i)...
         # If processor is supplied apply it
-        #The blocks are for the GPU - i.e. it cannot process it all in one go at times...
+        #The blocks are for the CPU/GPU - i.e. it cannot process it all in one go at times...
         if cur_processor and not isinstance(cur_processor, ProcessorFPGA):
-            self.process_block(0, cur_processor, blocksize)
-            block_idx = 1
-            while block_idx*blocksize < self.NumRepetitions*self.NumSegments: # NOTE : some strange logic, perhaps tied to the logic above
-                self.process_block(block_idx, cur_processor, blocksize)
-                block_idx += 1
+            self.process_blocks(cur_processor, blocksize)
             return cur_processor.get_all_data()
-        else:
-            # No processor supplied
-            # done = 0
-            # while not done:
-            #     done = int(self._parent._get_cmd(":DIG:ACQuire:FRAM:STATus?").split(',')[3])
-            # Stop the digitizer's capturing machine (to be on the safe side)
-            self._parent._set_cmd(':DIG:INIT', 'OFF')
-            self._parent._chk_err('after actual acquisition.')
 
     def NormalAVGSignal(self, wav,AvgCount,is_dsp,ADCFS=1000,BINOFFSET=True, sample_integrations_frame_header=False):
         def getAvgDivFactor(AvgCount=1000,is_dsp=False):
@@ -1603,13 +1666,10 @@ class TaborP2584M_ACQ(InstrumentChannel):
         return ret_val
 
     def get_data(self, **kwargs):
-        self.blocksize(self.NumRepetitions)
-        #TODO:
-        #Currently:
-        #  - It starts reading. Once a block-size B has been read, it stops checking
-        #  - Then it reads B frames and processes them. However, it does not process the case where Reps = q*B + r with r=/=0
-        #  - Also, it SHOULD CHECK whether the Tabor has indeed captured m*B frames when processing block m. It assumes that the processing overhead
-        #    exceeds the capture time - MAKE SURE TO IMPLEMENT THIS. For now, the hack is to set B = R
+        #When using a CPU processor:
+        #  - It waits for the capture to complete and then reads the frames in blocks of B repetitions (the last block being partial if
+        #    Reps = q*B + r with r=/=0) - see process_blocks.
+        #  - The next block is read while the current block is pushed into the processor.
         # question is just in the above, it says it reads a block size B, then reads B frames, just a bit confused by terminology, as a thought there would be a certain
         # number of frames within a block?
         #Tentative yes. The processing mostly operates on repetitions. So you usually feed the processor full repetitions 
@@ -1634,7 +1694,7 @@ class TaborP2584M_ACQ(InstrumentChannel):
             self._parent.ACQ.trigger1Source('EXT')
             self._parent.ACQ.trigger2Source('EXT')
 
-        blocksize = min(self.blocksize(), self.NumRepetitions)
+        blocksize = max(min(int(self.blocksize()), self.NumRepetitions), 1)
 
 
         cur_processor = kwargs.get('data_processor', None)
@@ -1711,6 +1771,8 @@ class TaborP2584M_ACQ(InstrumentChannel):
 
 
         ret_val = self._perform_data_capture(cur_processor, final_dsp_order, blocksize)
+        if cur_processor and not isinstance(cur_processor, ProcessorFPGA):
+            return {'data': ret_val}
 
         # if not isinstance(cur_processor, ProcessorFPGA):
         #     return {'data': ret_val}
@@ -1779,6 +1841,8 @@ class TaborP2584M_ACQ(InstrumentChannel):
 
 class Tabor_P2584M(Instrument):
     def __init__(self, name, pxi_chassis: int,  pxi_slot: int, **kwargs):
+        #If True, the instrument is emulated (see teproteus_fake.py) - e.g. to benchmark the ACQ readout without the hardware
+        fake_backend = kwargs.pop('fake_backend', False)
         super().__init__(name, **kwargs) #No address...
         #Currently Tabor doesn't seem to use pxi_chassis in their newer drivers - curious...
 
@@ -1786,7 +1850,10 @@ class Tabor_P2584M(Instrument):
         # for default location (C:\Windows\System32)
         # Change it only if you know what you are doing
         lib_dir_path = None
-        self._admin = TepAdmin(lib_dir_path)
+        if fake_backend:
+            self._admin = TepAdminFake(lib_dir_path)
+        else:
+            self._admin = TepAdmin(lib_dir_path)
         self._admin.open_inst_admin()
         self._inst = self._admin.open_instrument(slot_id=pxi_slot, reset_hot_flag=True)
         assert self._inst != None, "Failed to load the Tabor AWG instrument - check slot ID perhaps or whether the Tabor unit is being used in another Python instance."
@@ -68,6 +68,11 @@ class DummyAWG(Instrument):
         self._sample_rate = 10e9
         self._trigger_edge = 1
 
+        #Emulated waveform memory (per channel) along with the upload statistics
+        self._programmed_data = {}
+        self._uploaded_bytes = 0
+        self._num_sequence_writes = 0
+
         # Output channels added to both the module for snapshots and internal Trigger Sources for the DDG HAL...
         for ch_name in ['CH1', 'CH2', 'CH3', 'CH4']:
             cur_channel = DummyAWGchannel(self, ch_name)
@@ -82,12 +87,22 @@ class DummyAWG(Instrument):
 
     @property
     def AutoCompressionSupport(self):
-        return {'Supported' : True, 'MinSize' : 8, 'Multiple' : 8}
+        return {'Supported' : True, 'MinSize' : 8, 'Multiple' : 8, 'Loops' : True}
 
     @property
     def MemoryRequirements(self):
         return {'MinSize' : 8, 'Multiple' : 8}
 
+    @property
+    def UploadedBytes(self):
+        #Total number of bytes (waveforms and markers) uploaded to the emulated waveform memory
+        return self._uploaded_bytes
+
+    @property
+    def NumSequenceWrites(self):
+        #Total number of times the sequence table (i.e. seq_ids and seq_loops) has been written
+        return self._num_sequence_writes
+
     @property
     def TriggerInputEdge(self):
         return self._trigger_edge
@@ -109,8 +124,42 @@ class DummyAWG(Instrument):
 
     def program_channel(self, chan_id, dict_wfm_data):
         # print(dict_wfm_data['waveforms'][0])
+        self._programmed_data[chan_id] = {'waveforms' : [], 'markers' : []}
+        self._upload_segments(chan_id, dict_wfm_data, range(len(dict_wfm_data['waveforms'])))
+        self._write_sequence(chan_id, dict_wfm_data)
         print("Programmed Dummy AWG!")
-        pass
+
+    def program_channel_delta(self, chan_id, dict_wfm_data, dirty_segs, seq_changed):
+        if chan_id not in self._programmed_data:
+            self.program_channel(chan_id, dict_wfm_data)
+            return
+        self._upload_segments(chan_id, dict_wfm_data, [m for m, x in enumerate(dirty_segs) if x])
+        if seq_changed:
+            self._write_sequence(chan_id, dict_wfm_data)
+        print("Programmed Dummy AWG!")
+
+    def _upload_segments(self, chan_id, dict_wfm_data, seg_inds):
+        cur_mem = self._programmed_data[chan_id]
+        num_segs = len(dict_wfm_data['waveforms'])
+        cur_mem['waveforms'] = (cur_mem['waveforms'] + [None]*num_segs)[:num_segs]
+        cur_mem['markers'] = (cur_mem['markers'] + [None]*num_segs)[:num_segs]
+        for m in seg_inds:
+            cur_mem['waveforms'][m] = np.array(dict_wfm_data['waveforms'][m])
+            cur_mem['markers'][m] = [np.array(x) for x in dict_wfm_data['markers'][m]]
+            self._uploaded_bytes += cur_mem['waveforms'][m].nbytes + sum([x.nbytes for x in cur_mem['markers'][m]])
+
+    def _write_sequence(self, chan_id, dict_wfm_data):
+        self._programmed_data[chan_id]['seq_ids'] = list(dict_wfm_data['seq_ids'])
+        self._programmed_data[chan_id]['seq_loops'] = list(dict_wfm_data.get('seq_loops', [1]*len(dict_wfm_data['seq_ids'])))
+        self._num_sequence_writes += 1
+
+    def get_programmed_waveform(self, chan_id):
+        '''
+        Returns the waveform played by the given channel as reconstructed from the emulated waveform memory and sequence table.
+        '''
+        cur_mem = self._programmed_data[chan_id]
+        seq_ids = np.repeat(cur_mem['seq_ids'], cur_mem['seq_loops'])
+        return np.concatenate([cur_mem['waveforms'][x] for x in seq_ids])
 
     def get_idn(self):
         return {
@@ -2,6 +2,7 @@ from typing import List
 import numpy as np
 import time
 import json
+from concurrent.futures import ThreadPoolExecutor
 from sqdtoolz.Variable import VariablePropertyOneManyTransient
 from sqdtoolz.ExperimentSweeps import ExperimentSweepBase
 
@@ -34,7 +35,7 @@ class Experiment:
             data_file_name = filename
         if data_file_name in self._cur_filewriters:
             return
-        data_file = FileIOWriter(self._file_path + data_file_name + '.h5', store_timestamps=self._store_timestamps)
+        data_file = FileIOWriter(self._file_path + data_file_name + '.h5', store_timestamps=self._store_timestamps, **self._data_file_opts)
         self._cur_filewriters[data_file_name] = data_file
         return data_file, data_file_name + '.h5'
 
@@ -89,6 +90,7 @@ class Experiment:
 
         self._data_file_index = kwargs.get('data_file_index', -1)
         self._store_timestamps = kwargs.get('store_timestamps', True)
+        self._data_file_opts = kwargs.get('data_file_opts', {})
 
         data_file, data_file_name = self._init_data_file('data')
         
@@ -167,40 +169,56 @@ class Experiment:
                     assert isinstance(cur_order, ExperimentSweepBase), "The argument sweep_orders must be specified as a list of ExpSwp* (i.e. ExperimentSweepBase) objects."
                     swp_order = cur_order.get_sweep_indices(swp_order, self._sweep_shape)
 
-                #sweep_vars2 is given as a list of tuples formatted as (parameter, sweep-values in an numpy-array)
-                for m in range(self._sweep_grids.shape[0]):
-                    ind_coord = swp_order[m]
-                    cur_coord = self._sweep_grids[swp_order[m]]
-
-                    self._cur_ind_coord = ind_coord
-                    #Set the values
-                    for ind, cur_val in enumerate(cur_coord):
-                        sweep_vars2[ind][0].set_raw(cur_val)
-
-                    if kill_signal():
-                        break
-                    
-                    #Now prepare the instrument
-                    # self._expt_config.check_conformance() #TODO: Write this
-                    self._expt_config.prepare_instruments()
-                    time.sleep(delay)
-
-                    if kill_signal():
-                        break
-
-                    #TODO: Consider letting other datasets also be temporarily accessible to mid_proces?
-                    cur_raw_data = self._expt_config.get_data()
-                    self._data = cur_raw_data.pop('data')
-                    for x in cur_raw_data:
-                        self._init_data_file(x)
-                        self._cur_filewriters[x].push_datapkt(cur_raw_data, sweep_vars, dset_ind=ind_coord) #TODO: Update documentation on ACQ Data Format - i.e. for auxiliary pieces...
-                    data_file.push_datapkt(self._data, sweep_vars2, sweepEx, dset_ind=ind_coord)
-                    if len(rec_params) > 0:
-                        rec_data_file.push_datapkt(self._prepare_rec_params(rec_params, rec_params_extra), sweep_vars2, sweepEx, dset_ind=ind_coord)
-                    self._sweep_vars = sweep_vars2
-                    self._mid_process()
-                    self._data = None
-                    self._update_progress_bar((ind_coord+1)/self._sweep_grids.shape[0])
+                #In pipelined mode, the data-file writes and _mid_process (i.e. the tail) of point N run on a single worker thread
+                #(thus, preserving their order) while the instruments are being set and acquired for point N+1. The progress-bar ping
+                #(which queries the instruments for the laboratory state) stays on this thread so that only it talks to the instruments.
+                pipelined = kwargs.get('pipelined', False)
+                tail_pool = ThreadPoolExecutor(max_workers=1) if pipelined else None
+                tail_future = None
+                try:
+                    #sweep_vars2 is given as a list of tuples formatted as (parameter, sweep-values in an numpy-array)
+                    for m in range(self._sweep_grids.shape[0]):
+                        ind_coord = swp_order[m]
+                        cur_coord = self._sweep_grids[swp_order[m]]
+
+                        if not pipelined:
+                            self._cur_ind_coord = ind_coord
+                        #Set the values
+                        for ind, cur_val in enumerate(cur_coord):
+                            sweep_vars2[ind][0].set_raw(cur_val)
+
+                        if kill_signal():
+                            break
+                        
+                        #Now prepare the instrument
+                        # self._expt_config.check_conformance() #TODO: Write this
+                        self._expt_config.prepare_instruments()
+                        time.sleep(delay)
+
+                        if kill_signal():
+                            break
+
+                        #TODO: Consider letting other datasets also be temporarily accessible to mid_proces?
+                        cur_raw_data = self._expt_config.get_data()
+                        if len(rec_params) > 0:
+                            cur_rec_data = self._prepare_rec_params(rec_params, rec_params_extra)
+                        else:
+                            cur_rec_data = None
+                        if pipelined:
+                            #Only one tail is kept in flight so that any errors raised in it are propagated on the next point
+                            if tail_future != None:
+                                tail_future.result()
+                            tail_future = tail_pool.submit(self._process_sweep_point, ind_coord, cur_raw_data, cur_rec_data,
+                                                           data_file, rec_data_file if cur_rec_data != None else None, sweep_vars, sweep_vars2, sweepEx)
+                        else:
+                            self._process_sweep_point(ind_coord, cur_raw_data, cur_rec_data,
+                                                      data_file, rec_data_file if cur_rec_data != None else None, sweep_vars, sweep_vars2, sweepEx)
+                        self._update_progress_bar((ind_coord+1)/self._sweep_grids.shape[0])
+                finally:
+                    if tail_pool != None:
+                        tail_pool.shutdown(wait=True)
+                if tail_future != None:
+                    tail_future.result()
 
         #Close all data files
         for cur_file in self._cur_filewriters:
@@ -215,6 +233,23 @@ class Experiment:
 
         return FileIOReader(file_path + data_file_name)
 
+    def _process_sweep_point(self, ind_coord, cur_raw_data, cur_rec_data, data_file, rec_data_file, sweep_vars, sweep_vars2, sweepEx):
+        #Writes the data acquired at the sweep index ind_coord and runs _mid_process on it. The state queried in _mid_process
+        #(e.g. _cur_ind_coord) is set here, so that it stays consistent with the data when running in pipelined mode. In pipelined
+        #mode, this runs on the worker thread and thus, _mid_process must not touch the instruments (or HALs) as the main thread is
+        #concurrently setting and acquiring the next point.
+        self._cur_ind_coord = ind_coord
+        self._data = cur_raw_data.pop('data')
+        for x in cur_raw_data:
+            self._init_data_file(x)
+            self._cur_filewriters[x].push_datapkt(cur_raw_data, sweep_vars, dset_ind=ind_coord) #TODO: Update documentation on ACQ Data Format - i.e. for auxiliary pieces...
+        data_file.push_datapkt(self._data, sweep_vars2, sweepEx, dset_ind=ind_coord)
+        if cur_rec_data != None:
+            rec_data_file.push_datapkt(cur_rec_data, sweep_vars2, sweepEx, dset_ind=ind_coord)
+        self._sweep_vars = sweep_vars2
+        self._mid_process()
+        self._data = None
+
     def _prepare_rec_params(self, rec_params, rec_params_extra):
         ret_data = {
                 'parameters' : [],
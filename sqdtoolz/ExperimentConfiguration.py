@@ -12,6 +12,8 @@ class ExperimentConfiguration:
         #Just register it to the labotarory - doesn't matter if it already exists as everything here needs to be reinitialised
         #to the new configuration anyway...
         lab._register_CONFIG(self)
+        #The state versions of the HALs at their last activation/preparation given as: HAL name -> (HAL, activation version, preparation version)
+        self._prepared_versions = {}
 
         prev_config = kwargs.get('_hidden_config', None)
         if prev_config != None:
@@ -163,7 +165,7 @@ class ExperimentConfiguration:
                     if commit_changes_to_HALsPROCs:
                         for cur_key in kwargs:
                             cur_dict[cur_key] = kwargs[cur_key]
-                        cur_hal._set_current_config(cur_dict, self._lab)
+                        self._push_hal_config(cur_hal, cur_dict)
                     break
             assert found_hal, f"HAL object {cur_dict['Name']} does not exist in the current ExperimentConfiguration object."
         self._settle_currently_used_processors(conf)
@@ -183,6 +185,33 @@ class ExperimentConfiguration:
         #
         self._init_config = conf
 
+    def _push_hal_config(self, cur_hal, cur_dict):
+        #Only push the properties that differ from the live configuration of the HAL. If any differing entry is not a settable property
+        #(e.g. trigger sources or channel configurations), the entire configuration is set via _set_current_config.
+        try:
+            live_dict = cur_hal._get_current_config()
+        except Exception:
+            live_dict = None
+        if not isinstance(live_dict, dict) or set(live_dict.keys()) != set(cur_dict.keys()):
+            cur_hal._set_current_config(cur_dict, self._lab)
+            return
+        changed_keys = [x for x in cur_dict if not self._config_values_equal(live_dict[x], cur_dict[x])]
+        for cur_key in changed_keys:
+            cur_prop = getattr(type(cur_hal), cur_key, None)
+            if not isinstance(cur_prop, property) or cur_prop.fset is None:
+                cur_hal._set_current_config(cur_dict, self._lab)
+                return
+        for cur_key in changed_keys:
+            setattr(cur_hal, cur_key, cur_dict[cur_key])
+
+    @staticmethod
+    def _config_values_equal(val1, val2):
+        try:
+            return bool(val1 == val2)
+        except (ValueError, TypeError):
+            #e.g. configurations holding numpy arrays
+            return False
+
     def map_waveforms(self, wfm_map_obj):
         self._dict_wfm_map = {
             'waveforms' : wfm_map_obj.waveforms,
@@ -265,6 +294,8 @@ class ExperimentConfiguration:
         return ret_trans_vars
 
     def init_instruments(self, **kwargs):
+        #Ensure that all HALs are activated and prepared on the next call to prepare_instruments
+        self._prepared_versions = {}
         cur_spec_targets = []
         #Get all parameters all ExperimentSpecifications will set
         for cur_spec in self._list_spec_names:
@@ -299,23 +330,46 @@ class ExperimentConfiguration:
     def commit(self):
         self.save_config()
 
-    def prepare_instruments(self):
+    def prepare_instruments(self, force = False):
+        '''
+        Activates and prepares the HALs in this configuration. HALs whose state has not changed (as tracked via their property setters)
+        since their last activation/preparation are skipped unless force is True.
+        '''
         #TODO: Write rest of this with error checking
 
         list_hals = self._list_HALs[:]
         if self._hal_ACQ is not None:
             list_hals += [self._hal_ACQ]
 
+        #Find the HALs whose state has changed since the last call...
+        hals_activate = []
+        hals_prepare = []
         for cur_hal in list_hals:
-            if cur_hal is not None and not cur_hal.ManualActivation:
+            if cur_hal is None:
+                continue
+            prev_versions = self._prepared_versions.get(cur_hal.Name)
+            if force or prev_versions is None or prev_versions[0] is not cur_hal:
+                prev_versions = (cur_hal, None, None)
+            cur_ver = cur_hal._get_state_version()
+            if cur_ver is None or cur_ver != prev_versions[1]:
+                hals_activate += [cur_hal]
+            cur_ver = cur_hal._get_prepare_version()
+            if cur_ver is None or cur_ver != prev_versions[2]:
+                hals_prepare += [cur_hal]
+
+        for cur_hal in hals_activate:
+            if not cur_hal.ManualActivation:
                 cur_hal.activate()
         
-        for cur_hal in list_hals:
-            #TODO: Write concurrence/change checks to better optimise AWG...
+        for cur_hal in hals_prepare:
             cur_hal.prepare_initial()
-        for cur_hal in list_hals:
+        for cur_hal in hals_prepare:
             cur_hal.prepare_final()
 
+        #Record the versions AFTER the activation/preparation as said functions may set properties on the HALs
+        for cur_hal in set(hals_activate + hals_prepare):
+            self._prepared_versions[cur_hal.Name] = (cur_hal, cur_hal._get_state_version(), cur_hal._get_prepare_version())
+
     def makesafe_instruments(self):
         list_hals = self._list_HALs[:]
         if self._hal_ACQ is not None:
@@ -323,6 +377,7 @@ class ExperimentConfiguration:
         for cur_hal in list_hals:
             if not cur_hal.ManualActivation:
                 cur_hal.deactivate()
+        self._prepared_versions = {}
 
     def get_data(self):
         #TODO: Pack the data appropriately if using multiple ACQ objects (coordinating their starts/finishes perhaps?)
@@ -38,6 +38,9 @@ class ExpCalibXrotAuto(Experiment):
         
         self.normalise_reps = kwargs.get('normalise_reps', 10)
 
+        #Number of circuits programmed and acquired at once (see QubitGates.run_circuits_direct)
+        self.circuits_per_batch = kwargs.get('circuits_per_batch', 1)
+
         self._gate_calib = gate_calib
         self._sweep_range = kwargs.get('sweep_range', (-0.5,0.5))
         
@@ -65,9 +68,8 @@ class ExpCalibXrotAuto(Experiment):
                 cur_gate = 'X/2'
                 self._qubit_gate_obj.get_qubit_SPEC()['GE X/2-Gate Amplitude'].Value = origAmplXon2 + ampl_off
 
-            for g in self._samples:
-                cur_seq = [cur_gate]*g
-                final_data = self._qubit_gate_obj.run_circuit(cur_seq, self._expt_config, self.load_time, self.readout_time)
+            gate_lists = [[cur_gate]*g for g in self._samples]
+            for final_data in self._qubit_gate_obj.run_circuits(gate_lists, self._expt_config, self.load_time, self.readout_time, circuits_per_batch=self.circuits_per_batch):
                 data_file.push_datapkt(final_data, [(varAmpl, self._ampl_offsets), (varNumG, self._samples)])
             self._update_progress_bar((m+1)/self._ampl_offsets.size)
         data_file.close()
@@ -19,6 +19,7 @@ class ExpRandomisedBenchmarking(Experiment):
     qubit_gate_obj (QubitGatesBase): Qubit gates generation object
     sequence_lengths (np.array[int]): An array of benchmarking sequence lengths
     num_trials (int): The number of unique randomly generated circuits for each sequence length
+    circuits_per_batch (int): (Optional) Number of circuits programmed and acquired at once (see QubitGates.run_circuits_direct). Default is 1.
     
     Outputs
     ---------
@@ -47,6 +48,8 @@ class ExpRandomisedBenchmarking(Experiment):
         self.readout_time = kwargs.get('readout_time', 2e-6)
         
         self.normalise_reps = kwargs.get('normalise_reps', 10)
+
+        self.circuits_per_batch = kwargs.get('circuits_per_batch', 1)
         
         self._gate_set = ['X', 'X/2', '-X/2', 'Y', 'Y/2', '-Y/2']
 
@@ -62,13 +65,16 @@ class ExpRandomisedBenchmarking(Experiment):
         varTrial = VariableInternalTransient('TrialNum')
 
         all_seqs = {}
+        gate_lists = []
         for seq_len in self._sequence_lengths:
             all_seqs[int(seq_len)] = {}
             for trial in range(self._num_trials):
                 cur_seq = self._generate_sequence(seq_len)
-                final_data = self._qubit_gate_obj.run_circuit(cur_seq, self._expt_config, self.load_time, self.readout_time)
-                data_file.push_datapkt(final_data, [(varSeq, self._sequence_lengths), (varTrial, np.arange(self._num_trials))])
+                gate_lists.append(cur_seq)
                 all_seqs[int(seq_len)][int(trial)] = cur_seq
+        #Run the circuits (in batches if applicable) in the same order as they were generated
+        for final_data in self._qubit_gate_obj.run_circuits(gate_lists, self._expt_config, self.load_time, self.readout_time, circuits_per_batch=self.circuits_per_batch):
+            data_file.push_datapkt(final_data, [(varSeq, self._sequence_lengths), (varTrial, np.arange(self._num_trials))])
         with open(file_path + 'RB_Sequences.json', 'w') as outfile:
             json.dump(all_seqs, outfile, indent=4)
         data_file.close()
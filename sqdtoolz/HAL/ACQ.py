@@ -97,6 +97,8 @@ class ACQ(TriggerInputCompatible, TriggerInput, HALbase):
         self._post_processors = list_proc_objs[:]
 
     def get_data(self):
+        if self.data_processor != None:
+            self.data_processor.set_expected_repetitions(self.NumRepetitions)
         ret_data = self._instr_acq.get_data(data_processor = self.data_processor, decision_blocks = self.decision_blocks)
         for cur_proc in self._post_processors:
             cur_proc.push_data(ret_data['data'])
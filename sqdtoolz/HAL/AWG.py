@@ -5,6 +5,47 @@ import matplotlib.patches as patches
 import matplotlib.pyplot as plt
 from sqdtoolz.HAL.WaveformSegments import*
 import scipy.signal
+import collections
+import hashlib
+
+class AWGMarkerEdges:
+    '''
+    Compact (run-length) form of a marker waveform given by its number of points and the [start, end) intervals over which the marker is
+    high. The intervals are given as an (N,2) integer array of sorted and non-overlapping intervals. An unused marker has zero points.
+    '''
+    def __init__(self, num_pts, intervals):
+        self._num_pts = int(num_pts)
+        intervals = np.clip(np.asarray(intervals, dtype=np.int64).reshape(-1,2), 0, self._num_pts)
+        intervals = intervals[intervals[:,1] > intervals[:,0]]
+        #Merge touching intervals so that a given marker waveform always has the same compact form
+        if intervals.shape[0] > 1:
+            new_run = np.concatenate(([True], intervals[1:,0] != intervals[:-1,1]))
+            intervals = np.stack([intervals[new_run,0], intervals[np.concatenate((new_run[1:], [True])),1]], axis=1)
+        self._intervals = intervals
+
+    @classmethod
+    def from_array(cls, mkr_array):
+        cur_high = np.asarray(mkr_array) != 0
+        edges = np.flatnonzero(np.diff(np.concatenate(([False], cur_high, [False])).astype(np.int8)))
+        return cls(cur_high.size, edges.reshape(-1,2))
+
+    @property
+    def NumPts(self):
+        return self._num_pts
+
+    @property
+    def Intervals(self):
+        return self._intervals
+
+    def to_array(self):
+        steps = np.zeros(self._num_pts + 1, dtype=np.int8)
+        steps[self._intervals[:,0]] = 1
+        steps[self._intervals[:,1]] -= 1
+        return np.cumsum(steps[:-1], dtype=np.int8).astype(np.ubyte)
+
+    def update_digest(self, cur_hash):
+        cur_hash.update(f',{self._num_pts},{self._intervals.shape[0]}'.encode())
+        cur_hash.update(self._intervals.tobytes())
 
 class AWGBase(HALbase):
     def __init__(self, hal_name,sample_rate, total_time, global_factor):
@@ -12,9 +53,10 @@ class AWGBase(HALbase):
         self._sample_rate = sample_rate
         self._auto_comp = 'None'
         self._auto_comp_linked = False
-        self._auto_comp_algos = ['None', 'Basic']
+        self._auto_comp_algos = ['None', 'Basic', 'Hashed']
         self._total_time = total_time
         self._global_factor = global_factor
+        self._cur_prog_digests = []
         if not hasattr(self, '_awg_chan_list'):
             self._awg_chan_list = []
 
@@ -23,7 +65,7 @@ class AWGBase(HALbase):
         return self._auto_comp
     @AutoCompression.setter
     def AutoCompression(self, algorithm):
-        assert algorithm in ['None', 'Basic'], f"Unknown algorithm for auto-compression. Allowed algorithms are: {self._auto_comp_algos}"
+        assert algorithm in self._auto_comp_algos, f"Unknown algorithm for auto-compression. Allowed algorithms are: {self._auto_comp_algos}"
         self._auto_comp = algorithm
 
     @property
@@ -80,25 +122,38 @@ class AWGBase(HALbase):
     def _assemble_waveform_raw(self):
         raise NotImplementedError()
 
-    def _check_changes_wfm_data(self, dict_wfm_data, final_wfm, final_mkrs):
-        #Check waveform equality (works for sequenced/autocompressed version as well)
-        prog_wfm = np.concatenate([dict_wfm_data['waveforms'][x] for x in dict_wfm_data['seq_ids']])
-        if not np.array_equal(prog_wfm, final_wfm):
-            return False
-        #Check markers...
-        for m in range(len(final_mkrs)):
-            prog_mkrs = np.concatenate([dict_wfm_data['markers'][x][m] for x in dict_wfm_data['seq_ids']])
-            if not np.array_equal(prog_mkrs, final_mkrs[m]):
-                return False
-        return True
+    def _get_wfm_digest(self, final_wfm, final_mkr_edges):
+        #Digest of the final waveform and its markers (in their compact form) - used to detect changes without comparing against the
+        #programmed arrays
+        cur_hash = hashlib.blake2b(digest_size=16)
+        cur_hash.update(f'{final_wfm.dtype.str},{final_wfm.size}'.encode())
+        cur_hash.update(np.ascontiguousarray(final_wfm).view(np.uint8))
+        for cur_mkr in final_mkr_edges:
+            cur_mkr.update_digest(cur_hash)
+        return cur_hash.digest()
+
+    def _get_segment_dirty_map(self, prev_wfm_data, dict_wfm_data):
+        '''
+        Compares the waveform data to be programmed against the previously programmed waveform data. Returns a tuple (dirty_segs,
+        seq_changed) in which dirty_segs is a list of booleans flagging the segments (in dict_wfm_data['waveforms']) whose waveform or
+        markers have changed (or are new) and seq_changed is True if the sequence (i.e. seq_ids and seq_loops) has changed.
+        '''
+        num_prev_segs = len(prev_wfm_data['waveforms'])
+        dirty_segs = []
+        for m, cur_wfm in enumerate(dict_wfm_data['waveforms']):
+            if m >= num_prev_segs or not np.array_equal(prev_wfm_data['waveforms'][m], cur_wfm):
+                dirty_segs += [True]
+                continue
+            prev_mkrs = prev_wfm_data['markers'][m]
+            cur_mkrs = dict_wfm_data['markers'][m]
+            dirty_segs += [len(prev_mkrs) != len(cur_mkrs) or not all(np.array_equal(prev_mkrs[x], cur_mkrs[x]) for x in range(len(cur_mkrs)))]
+        seq_changed = list(prev_wfm_data['seq_ids']) != list(dict_wfm_data['seq_ids'])
+        seq_changed = seq_changed or list(prev_wfm_data.get('seq_loops', [])) != list(dict_wfm_data.get('seq_loops', []))
+        return dirty_segs, seq_changed
+
     def _extract_marker_segments(self, mkr_list_overall, slice_start, slice_end):
-        cur_mkrs = []
-        for sub_mkr in range(len(mkr_list_overall)):
-            if mkr_list_overall[sub_mkr].size > 0:
-                cur_mkrs += [ mkr_list_overall[sub_mkr][slice_start:slice_end] ]
-            else:
-                cur_mkrs += [ mkr_list_overall[sub_mkr][:] ]    #Copy over the empty array...
-        return cur_mkrs
+        #Empty markers are copied over as is
+        return [x[slice_start:slice_end] if x.size > 0 else x[:] for x in mkr_list_overall]
 
     def _program_auto_comp_basic(self, cur_awg_chan, final_wfm_for_chan, mkr_list):
         #TODO: Add flags for changed/requires-update to ensure that segments in sequence are not unnecessary programmed repeatedly...
@@ -198,6 +253,65 @@ class AWGBase(HALbase):
                     seq_mkrs[cur_ch][-1] = cur_mkrs[cur_ch]
 
         return [{'waveforms' : seq_segs[cur_ch], 'markers' : seq_mkrs[cur_ch], 'seq_ids' : seq_ids} for cur_ch in range(num_channels)]
+    def _program_auto_comp_hashed(self, minSize, final_wfms, final_mkrs, use_loops = False):
+        '''
+        Chops the waveforms (across all given channels - i.e. linked channels share the same sequence) into MinSize chunks (the last
+        chunk absorbs the remaining points) and finds repeated chunks via a dictionary keyed on the raw bytes of the waveform and
+        (bit-packed) marker chunks. If use_loops is True, consecutive repeats of a chunk are given as a single sequence entry with the
+        repeat count listed in 'seq_loops'.
+        '''
+        dS = minSize
+        num_pts = final_wfms[0].size
+        num_main_secs = int(np.floor(num_pts / dS))
+        if num_main_secs > 1:
+            chunk_starts = np.arange(num_main_secs) * dS
+            chunk_ends = np.append(chunk_starts[1:], num_pts)
+        else:
+            chunk_starts, chunk_ends = np.array([0]), np.array([num_pts])
+        #The chunks of equal length (i.e. all but the last chunk if it absorbs extra points) are gathered as rows of raw bytes spanning
+        #the waveform and (bit-packed, non-empty) marker arrays across all channels
+        num_rows = chunk_starts.size if chunk_ends[-1] - chunk_starts[-1] == chunk_ends[0] - chunk_starts[0] else chunk_starts.size - 1
+        row_len = chunk_ends[0] - chunk_starts[0]
+        chunk_rows = []
+        for ind, final_wfm_for_chan in enumerate(final_wfms):
+            chunk_rows += [np.ascontiguousarray(final_wfm_for_chan[:num_rows*row_len]).reshape(num_rows, row_len).view(np.uint8)]
+            chunk_rows += [np.packbits(x[:num_rows*row_len].reshape(num_rows, row_len) != 0, axis=1) for x in final_mkrs[ind] if x.size > 0]
+        chunk_rows = np.concatenate(chunk_rows, axis=1)
+        #Number the unique chunks in the order of their first occurrence
+        dict_chunks = {}
+        chunk_ids = np.array([dict_chunks.setdefault(x.tobytes(), len(dict_chunks)) for x in chunk_rows], dtype=np.int64)
+        seq_chunks = np.unique(chunk_ids, return_index=True)[1]
+        if num_rows < chunk_starts.size:
+            #The last (longer) chunk is always unique
+            seq_chunks = np.append(seq_chunks, num_rows)
+            chunk_ids = np.append(chunk_ids, seq_chunks.size - 1)
+
+        if use_loops:
+            new_entry = np.concatenate(([True], chunk_ids[1:] != chunk_ids[:-1]))
+            seq_ids = chunk_ids[new_entry].tolist()
+            seq_loops = np.diff(np.append(np.flatnonzero(new_entry), chunk_ids.size)).tolist()
+        else:
+            seq_ids = chunk_ids.tolist()
+
+        ret_datas = []
+        for ind, final_wfm_for_chan in enumerate(final_wfms):
+            cur_data = {'waveforms' : [final_wfm_for_chan[chunk_starts[x]:chunk_ends[x]] for x in seq_chunks],
+                        'markers' : [self._extract_marker_segments(final_mkrs[ind], chunk_starts[x], chunk_ends[x]) for x in seq_chunks],
+                        'seq_ids' : seq_ids[:]}
+            if use_loops:
+                cur_data['seq_loops'] = seq_loops[:]
+            ret_datas += [cur_data]
+        return ret_datas
+
+    def _get_state_version(self):
+        #The output channels hold the activation state (i.e. Output)
+        return (super()._get_state_version(), tuple(x._get_state_version() for x in self._awg_chan_list))
+
+    def _get_prepare_version(self):
+        #The waveforms can change via the segments, WFMTs and markers (or their arguments) - so always prepare and let the digests in
+        #prepare_initial skip the programming of unchanged waveforms
+        return None
+
     def activate(self):
         for cur_awg_chan in self._awg_chan_list:
             cur_awg_chan.Output = True
@@ -220,40 +334,42 @@ class AWGBase(HALbase):
             assert num_pts >= mem_params['MinSize'], f"Waveform too short; needs to have at least {mem_params['MinSize']} points."
             assert num_pts % mem_params['Multiple'] == 0, f"Number of points in waveform needs to be a multiple of {mem_params['Multiple']}."
 
-        #Assemble markers
-        final_mkrs = []
+        #Assemble the markers in their compact form (they are only expanded into arrays if the waveforms have to be reprogrammed)
+        final_mkr_edges = []
         for ind, cur_awg_chan in enumerate(self._awg_chan_list):
             if len(cur_awg_chan._awg_mark_list) > 0:
-                mkr_list = [x._assemble_marker_raw() for x in cur_awg_chan._awg_mark_list]
+                mkr_list = [x._assemble_marker_edges() for x in cur_awg_chan._awg_mark_list]
             else:
-                mkr_list = [np.array([])]
-            final_mkrs += [mkr_list]
+                mkr_list = [AWGMarkerEdges(0, [])]
+            final_mkr_edges += [mkr_list]
 
-        #Check if there are any changes in the waveforms - if not, then there's no need to reprogram...
+        #Check if there are any changes in the waveforms (via the digests of the programmed waveforms) - if not, then there's no need to reprogram...
+        self._cur_digests_to_commit = [self._get_wfm_digest(final_wfms[m], final_mkr_edges[m]) for m in range(len(final_wfms))]
+        if len(self._cur_prog_digests) != len(self._cur_prog_waveforms):
+            self._cur_prog_digests = [None]*len(self._cur_prog_waveforms)
         self._dont_reprogram = True
         for m in range(len(self._cur_prog_waveforms)):
-            if self._cur_prog_waveforms[m] is not None:
-                if not self._check_changes_wfm_data(self._cur_prog_waveforms[m], final_wfms[m], final_mkrs[m]):
-                    self._dont_reprogram = False
-                    break
-            else:
+            if self._cur_prog_waveforms[m] is None or self._cur_prog_digests[m] != self._cur_digests_to_commit[m]:
                 self._dont_reprogram = False
                 break
         if self._dont_reprogram:
             return
+        final_mkrs = [[x.to_array() for x in mkr_list] for mkr_list in final_mkr_edges]
 
         #For the case where the sequencing table must be the same for all channels (e.g. channels on the Agilent N8241A), the sequencing is
         #done on all the waveforms across all channels
         if self.AutoCompressionLinkChannels and self.AutoCompression != 'None':
-            assert self.AutoCompression == 'Basic', "Only the \'Basic\' algorithm is currently supported for linked-channel auto-compression."
             self.cur_wfms_to_commit = []
             #Check that the memory requirements are the same across all channels (i.e. typically the same AWG)
             dict_auto_comps = [cur_awg_chan._instr_awg.AutoCompressionSupport for cur_awg_chan in self._awg_chan_list]
             for cur_key in dict_auto_comps[0]:
                 for cur_dict in dict_auto_comps:
                     assert cur_dict[cur_key] == dict_auto_comps[0][cur_key], f"Linked-channel auto-compression requires all channels to have the same {cur_key}."
-            #Perform BASIC compression on all the channels simultaneously...
-            dict_wfm_datas = self._program_auto_comp_basic_linked(dict_auto_comps[0]['MinSize'], final_wfms, final_mkrs)
+            #Perform the compression on all the channels simultaneously...
+            if self.AutoCompression == 'Basic':
+                dict_wfm_datas = self._program_auto_comp_basic_linked(dict_auto_comps[0]['MinSize'], final_wfms, final_mkrs)
+            else:
+                dict_wfm_datas = self._program_auto_comp_hashed(dict_auto_comps[0]['MinSize'], final_wfms, final_mkrs, dict_auto_comps[0].get('Loops', False))
             for ind, cur_awg_chan in enumerate(self._awg_chan_list):
                 dict_wfm_data = dict_wfm_datas[ind]
                 seg_lens = [x.size for x in dict_wfm_data['waveforms']]
@@ -274,6 +390,11 @@ class AWGBase(HALbase):
                     #BASIC COMPRESSION
                     #The basic compression algorithm is to chop up the waveform into its minimum set of bite-sized pieces and to find repetitive aspects
                     dict_wfm_data = self._program_auto_comp_basic(cur_awg_chan, final_wfms[ind], mkr_list)
+                elif self.AutoCompression == 'Hashed':
+                    #HASHED COMPRESSION
+                    #Same chopping as the basic algorithm, but the repeated pieces are found via a dictionary lookup (and consecutive repeats
+                    #are merged into a looped sequence entry if the instrument supports it)
+                    dict_wfm_data = self._program_auto_comp_hashed(dict_auto_comp['MinSize'], [final_wfms[ind]], [mkr_list], dict_auto_comp.get('Loops', False))[0]
                     
                 seg_lens = [x.size for x in dict_wfm_data['waveforms']]
                 cur_awg_chan._instr_awg.prepare_waveform_memory(cur_awg_chan._instr_awg_chan.short_name, seg_lens, raw_data=dict_wfm_data)
@@ -285,12 +406,21 @@ class AWGBase(HALbase):
         """
         if not self._dont_reprogram:
             for ind, cur_awg_chan in enumerate(self._awg_chan_list):
-                cur_awg_chan._instr_awg.program_channel(cur_awg_chan._instr_awg_chan.short_name, self.cur_wfms_to_commit[ind])
+                #Drivers implementing program_channel_delta only upload the segments that have changed since the last programming
+                if self._cur_prog_waveforms[ind] is not None and hasattr(cur_awg_chan._instr_awg, 'program_channel_delta'):
+                    dirty_segs, seq_changed = self._get_segment_dirty_map(self._cur_prog_waveforms[ind], self.cur_wfms_to_commit[ind])
+                    cur_awg_chan._instr_awg.program_channel_delta(cur_awg_chan._instr_awg_chan.short_name, self.cur_wfms_to_commit[ind], dirty_segs, seq_changed)
+                else:
+                    cur_awg_chan._instr_awg.program_channel(cur_awg_chan._instr_awg_chan.short_name, self.cur_wfms_to_commit[ind])
                 #Set it AFTER the programming in case there is an error etc...
                 self._cur_prog_waveforms[ind] = self.cur_wfms_to_commit[ind]
+                self._cur_prog_digests[ind] = self._cur_digests_to_commit[ind]
 
 
 class WaveformAWG(AWGBase, HALbase, TriggerOutputCompatible, TriggerInputCompatible):
+    #Maximum total size (in bytes) of the rendered waveform segments held in the segment cache
+    SEG_CACHE_MAX_BYTES = 64*1024*1024
+
     def __init__(self, hal_name, lab, awg_channel_tuples, sample_rate, total_time=-1, global_factor = 1.0, **kwargs):
         AWGBase.__init__(self, hal_name, sample_rate, total_time, global_factor)
         self._wfm_segment_list = []
@@ -311,6 +441,8 @@ class WaveformAWG(AWGBase, HALbase, TriggerOutputCompatible, TriggerInputCompati
         self._trig_src_pol = 1
         self._lab = lab
         self._cur_prog_waveforms = [None]*len(awg_channel_tuples)
+        self._seg_cache = collections.OrderedDict()
+        self._seg_cache_bytes = 0
         config_dict = kwargs.get('dict_config', None)
         if isinstance(config_dict, dict):
             self._set_current_config(config_dict, lab)
@@ -436,6 +568,10 @@ class WaveformAWG(AWGBase, HALbase, TriggerOutputCompatible, TriggerInputCompati
         return trig_inp_objs
 
     def _get_marker_waveform_from_segments(self, segments):
+        return self._get_marker_edges_from_segments(segments).to_array()
+
+    def _get_marker_edges_from_segments(self, segments):
+        #Returns the marker waveform (in its compact form - i.e. AWGMarkerEdges) that is high over the given segments
         #Temporarily set the Duration of Elastic time-segment...
         elas_seg_ind, elastic_time = self._get_elastic_time_seg_params()
         if elas_seg_ind != -1:
@@ -459,23 +595,24 @@ class WaveformAWG(AWGBase, HALbase, TriggerOutputCompatible, TriggerInputCompati
             else:
                 const_segs += [cur_seg]
 
-        final_wfm = np.zeros(int(np.round(self.NumPts)), dtype=np.ubyte)
+        intervals = []
         cur_ind = 0
         for cur_seg in self._wfm_segment_list:
             cur_len = cur_seg.NumPts(self._sample_rate)
             if cur_len == 0:
                 continue
             if cur_seg.Name in const_segs:
-                final_wfm[cur_ind:cur_ind+cur_len] = 1
+                intervals += [[cur_ind, cur_ind+cur_len]]
             elif cur_seg.Name in dict_segs: #i.e. another segment with children like WFS_Group
-                final_wfm[cur_ind:cur_ind+cur_len] = cur_seg._get_marker_waveform_from_segments(dict_segs[cur_seg.Name], self._sample_rate)
+                cur_edges = AWGMarkerEdges.from_array(cur_seg._get_marker_waveform_from_segments(dict_segs[cur_seg.Name], self._sample_rate))
+                intervals += (cur_edges.Intervals + cur_ind).tolist()
             cur_ind += cur_len
         
         #Reset segment to be elastic
         if elas_seg_ind != -1:
             self._wfm_segment_list[elas_seg_ind].Duration = -1
     
-        return final_wfm
+        return AWGMarkerEdges(int(np.round(self.NumPts)), intervals)
 
     def _get_elastic_time_seg_params(self):
         elastic_segs = []
@@ -602,24 +739,27 @@ class WaveformAWG(AWGBase, HALbase, TriggerOutputCompatible, TriggerInputCompati
         if elas_seg_ind != -1:
             self._wfm_segment_list[elas_seg_ind].Duration = elastic_time
 
-        num_chnls = len(self._awg_chan_list)
-        final_wfms = [np.array([])]*num_chnls
+        num_pts = self.NumPts
+        final_wfms = []
         #Assemble each channel separately
         for cur_ch in range(len(self._awg_chan_list)):
             #Reset any waveform modulation commands for a new sequence construction...
             for cur_wfm_seg in self._wfm_segment_list:
                 cur_wfm_seg.reset_waveform_transforms(self._lab)
+            cur_wfm = np.empty(num_pts)
             t0 = 0
-            #Concatenate the individual waveform segments
+            #Write the individual waveform segments into the preallocated array
             for cur_wfm_seg in self._wfm_segment_list:
                 if cur_wfm_seg.NumPts(self.SampleRate) == 0:
                     continue
-                #TODO: Preallocate - this is a bit inefficient...
-                final_wfms[cur_ch] = np.concatenate((final_wfms[cur_ch], cur_wfm_seg.get_waveform(self._lab, self._sample_rate, t0, cur_ch)))
-                t0 = final_wfms[cur_ch].size
+                seg_wfm = self._get_segment_waveform(cur_wfm_seg, t0, cur_ch)
+                assert t0 + seg_wfm.size <= num_pts, "The sample-rate and segment-lengths yield segment points that exceed the total waveform size. Ensure that there is sufficient freedom in the elastic segment size to compensate."
+                cur_wfm[t0:t0+seg_wfm.size] = seg_wfm
+                t0 += seg_wfm.size
+            assert num_pts == t0, "The sample-rate and segment-lengths yield segment points that exceed the total waveform size. Ensure that there is sufficient freedom in the elastic segment size to compensate."
             #Scale the waveform via the global scale-factor...
-            final_wfms[cur_ch] *= self._global_factor
-            assert self.NumPts == final_wfms[cur_ch].size, "The sample-rate and segment-lengths yield segment points that exceed the total waveform size. Ensure that there is sufficient freedom in the elastic segment size to compensate."
+            cur_wfm *= self._global_factor
+            final_wfms.append(cur_wfm)
         
         #Reset segment to be elastic
         if elas_seg_ind != -1:
@@ -627,6 +767,62 @@ class WaveformAWG(AWGBase, HALbase, TriggerOutputCompatible, TriggerInputCompati
     
         return final_wfms
 
+    def _get_segment_waveform(self, wfm_seg, t0, ch_index):
+        #Rendered segments are cached (read-only) such that unchanged segments are reused across sweeping points
+        cache_key = self._get_segment_cache_key(wfm_seg, t0, ch_index)
+        if cache_key is None:
+            return wfm_seg.get_waveform(self._lab, self._sample_rate, t0, ch_index)
+        if cache_key in self._seg_cache:
+            self._seg_cache.move_to_end(cache_key)
+            seg_wfm, wfmt_states = self._seg_cache[cache_key]
+            #Restore the state of the WFMTs as if the segment had been rendered
+            for cur_wfmt_name, cur_state in wfmt_states:
+                self._lab.WFMT(cur_wfmt_name)._set_waveform_state(cur_state)
+            return seg_wfm
+
+        seg_wfm = np.array(wfm_seg.get_waveform(self._lab, self._sample_rate, t0, ch_index), dtype=np.float64)
+        seg_wfm.flags.writeable = False
+        wfmt_states = tuple((x[0], self._lab.WFMT(x[0])._get_waveform_state()) for x in cache_key[1])
+        if seg_wfm.nbytes <= self.SEG_CACHE_MAX_BYTES:
+            self._seg_cache[cache_key] = (seg_wfm, wfmt_states)
+            self._seg_cache_bytes += seg_wfm.nbytes
+            while self._seg_cache_bytes > self.SEG_CACHE_MAX_BYTES:
+                self._seg_cache_bytes -= self._seg_cache.popitem(last=False)[1][0].nbytes
+        return seg_wfm
+
+    def _get_segment_cache_key(self, wfm_seg, t0, ch_index):
+        #Returns None if the segment cannot be cached (i.e. its configuration is not hashable or its WFMTs do not expose their state)
+        wfmt_names = sorted(set(x.wfmt_name for x in wfm_seg._get_WFMT_args()))
+        wfmt_keys = []
+        for cur_wfmt_name in wfmt_names:
+            cur_wfmt = self._lab.WFMT(cur_wfmt_name)
+            cur_state = cur_wfmt._get_waveform_state()
+            if cur_state is None:
+                return None
+            try:
+                wfmt_keys.append((cur_wfmt_name, self._get_hashable_config(cur_wfmt._get_current_config()), cur_state))
+            except (AttributeError, TypeError, NotImplementedError):
+                return None
+        try:
+            seg_key = self._get_hashable_config(wfm_seg._get_current_config())
+        except (AttributeError, TypeError, NotImplementedError):
+            return None
+        return (seg_key, tuple(wfmt_keys), self._sample_rate, t0, ch_index)
+
+    @staticmethod
+    def _get_hashable_config(obj):
+        if isinstance(obj, dict):
+            return tuple((x, WaveformAWG._get_hashable_config(obj[x])) for x in sorted(obj.keys()))
+        if isinstance(obj, (list, tuple)):
+            return ('list',) + tuple(WaveformAWG._get_hashable_config(x) for x in obj)
+        if isinstance(obj, np.ndarray):
+            #Use a digest so that large arrays (e.g. in WFS_Arbitrary) do not bloat the key
+            return ('ndarray', obj.dtype.str, obj.shape, hashlib.blake2b(np.ascontiguousarray(obj).tobytes(), digest_size=16).digest())
+        if isinstance(obj, np.generic):
+            return obj.item()
+        hash(obj)
+        return obj
+
 
 class AWGOutputChannel(TriggerInput, LockableProperties):
     def __init__(self, lab, instr_awg_name, channel_name, ch_index, parent_awg_waveform, sample_rate):
@@ -946,19 +1142,28 @@ class AWGOutputTrigger(TriggerOutput, TriggerInput, LockableProperties):
             self._marker_trig_length = 0
 
     def _assemble_marker_raw(self):
+        if self._marker_status == 'Arbitrary':
+            return self._marker_arb_array
+        return self._assemble_marker_edges().to_array()
+
+    def _assemble_marker_edges(self):
+        '''
+        Returns the marker waveform in its compact form (i.e. AWGMarkerEdges) without assembling the marker array where possible.
+        '''
         if self._marker_status == 'None':
-            return np.array([], dtype=np.ubyte)
+            return AWGMarkerEdges(0, [])
 
         if self._marker_status == 'Trigger':
-            final_wfm = np.zeros(int(np.round(self._parent_waveform_obj.NumPts)), dtype=np.ubyte) + 1 - self._marker_pol
+            num_pts = int(np.round(self._parent_waveform_obj.NumPts))
             start_pt = int(np.round(self._marker_trig_delay * self._parent_waveform_obj._sample_rate))
             end_pt = int(np.round((self._marker_trig_delay + self._marker_trig_length) * self._parent_waveform_obj._sample_rate))
-            final_wfm[start_pt:end_pt+1] = self._marker_pol
-            return final_wfm
+            if self._marker_pol == 1:
+                return AWGMarkerEdges(num_pts, [[start_pt, end_pt+1]])
+            return AWGMarkerEdges(num_pts, [[0, start_pt], [end_pt+1, num_pts]])
         elif self._marker_status == 'Arbitrary':
-            return self._marker_arb_array
+            return AWGMarkerEdges.from_array(self._marker_arb_array)
         elif self._marker_status == 'Segments':
-            return self._parent_waveform_obj._get_marker_waveform_from_segments(self._marker_seg_list)
+            return self._parent_waveform_obj._get_marker_edges_from_segments(self._marker_seg_list)
 
     def get_raw_trigger_waveform(self):
         return self._assemble_marker_raw()
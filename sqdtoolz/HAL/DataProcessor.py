@@ -35,6 +35,10 @@ class DataProcessor:
     def get_all_data(self):
         raise NotImplementedError()
 
+    def set_expected_repetitions(self, num_reps):
+        #Optional hint (given before pushing the data packets) on the total number of repetitions to be pushed before get_all_data
+        pass
+
     def ready(self):
         raise NotImplementedError()
 
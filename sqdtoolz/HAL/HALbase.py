@@ -65,6 +65,19 @@ class HALbase(LockableProperties):
         for cur_prop in list_prop_names:
             ret_dict[cur_prop] = getattr(self, cur_prop)
 
+    def _get_state_version(self):
+        '''
+        Returns a stamp that changes whenever the state of the HAL changes (i.e. on setting any of its properties). It is used to skip the
+        activation and preparation of unchanged HALs. Returning None marks the HAL as always requiring activation and preparation.
+        '''
+        return super()._get_state_version()
+
+    def _get_prepare_version(self):
+        '''
+        Same as _get_state_version, but only used when deciding whether to run prepare_initial and prepare_final.
+        '''
+        return self._get_state_version()
+
     def activate(self):
         pass
 
@@ -1,3 +1,9 @@
+import itertools
+
+#Global counter used to stamp the objects on setting an attribute (a global counter ensures that a newly created object never shares a
+#stamp with a previous object that happened to reside at the same memory address)
+_state_versions = itertools.count(1)
+
 class LockableProperties:
     def __init__(self):
         self._locked_props = []
@@ -7,7 +13,11 @@ class LockableProperties:
             super().__setattr__(prop, value)
         elif not prop in self._locked_props:
             super().__setattr__(prop, value)
-    
+        else:
+            return
+        #Track changes to the object's state (e.g. used to skip the preparation of unchanged HALs)
+        object.__setattr__(self, '_state_version', next(_state_versions))
+
     def _property_lock(self, prop):
         if not hasattr(self, '_locked_props'):
             self._locked_props = []
@@ -19,4 +29,10 @@ class LockableProperties:
         except ValueError:
             pass
     def _property_lock_clearall(self):
-        self._locked_props.clear()
\ No newline at end of file
+        self._locked_props.clear()
+
+    def _get_state_version(self):
+        '''
+        Returns a stamp that changes whenever an attribute (or property) of this object is set.
+        '''
+        return getattr(self, '_state_version', 0)
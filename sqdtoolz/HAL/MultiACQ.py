@@ -2,8 +2,8 @@ from sqdtoolz.HAL.ACQ import ACQ
 from sqdtoolz.HAL.HALbase import HALbase
 from sqdtoolz.Drivers.ACQ_ETH_FPGA import ETHFPGA
 from sqdtoolz.HAL.TriggerPulse import Trigger, TriggerInput
-from multiprocessing.pool import ThreadPool
-from functools import partial
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import threading
 import logging
 import time
 
@@ -20,31 +20,56 @@ class MultiACQ(ACQ):
                 assert type(instr) == ETHFPGA, f'{type(instr)} are not supported yet. Some more functions need to be implemented.'
                 self._instr_acqs.append(instr)
             self._instr_acq = self._instr_acqs[0]
-            self._tp = ThreadPool(processes=len(instr_acq_names))
+            self._tp = ThreadPoolExecutor(max_workers=len(instr_acq_names))
+            self._timeout = None
+            #Acquisition calls abandoned by a previous get_data (e.g. on a timeout) given as {handle : instrument index}
+            self._stale_handles = {}
         assert type(trigger) == Trigger
         self.set_trigger_source(trigger)
 
+    def _acquire_instr(self, inst, issued_event):
+        #The card is armed remotely within its (blocking) acquisition call - so the event only marks that the call is being issued
+        issued_event.set()
+        return inst._acquire()
+
+    def _check_stale_acquisitions(self):
+        #A card left running by a previous call (e.g. after a timeout) is still busy on the same connection - so wait (up to the
+        #timeout) for its acquisition call to return before starting a new acquisition
+        if len(self._stale_handles) > 0:
+            wait(self._stale_handles.keys(), timeout=self.Timeout)
+        self._stale_handles = {x : self._stale_handles[x] for x in self._stale_handles if not x.done()}
+        assert len(self._stale_handles) == 0, f"Cannot start a new acquisition as the ACQ instruments {[self._instr_ids[x] for x in self._stale_handles.values()]} are still running an acquisition abandoned by a previous call."
+
     def get_data(self, **kwargs):
         cur_processor = kwargs.pop('data_processor', self.data_processor)
+        self._check_stale_acquisitions()
         self.get_trigger_source().TrigEnable = False
         
         for inst in self._instr_acqs:
             inst._start(**kwargs)
 
-        datas = []
-        handles = []
-        for inst in self._instr_acqs:
-            handles.append(self._tp.apply_async(inst._acquire))
-
-        self.get_trigger_source().TrigEnable = True
+        #Only enable the trigger once the acquisition calls of all cards have been issued. Note that this does not guarantee that the
+        #cards have been armed by the time the trigger is enabled (the arming is not observable from here).
+        issued_events = [threading.Event() for x in self._instr_acqs]
+        handles = {self._tp.submit(self._acquire_instr, inst, issued_events[i]) : i for i, inst in enumerate(self._instr_acqs)}
+        try:
+            for i, cur_event in enumerate(issued_events):
+                assert cur_event.wait(self.Timeout), f"Timed out while starting the acquisition on the ACQ instrument {self._instr_ids[i]}."
+            self.get_trigger_source().TrigEnable = True
 
-        for handle in handles:
-            while not handle.ready():
-                time.sleep(10e-3)
-            datas.append(handle.get())
-
-        for i, inst in enumerate(self._instr_acqs):
-            datas[i] = inst._stop(datas[i], **kwargs)
+            #Process the data of every card as soon as it arrives (errors in the acquisitions are raised via result())
+            datas = [None]*len(self._instr_acqs)
+            pending = set(handles.keys())
+            deadline = None if self.Timeout is None else time.monotonic() + self.Timeout
+            while len(pending) > 0:
+                done, pending = wait(pending, timeout=None if deadline is None else max(deadline - time.monotonic(), 0), return_when=FIRST_COMPLETED)
+                assert len(done) > 0, f"Timed out while acquiring data from the ACQ instruments: {[self._instr_ids[handles[x]] for x in pending]}."
+                for cur_handle in done:
+                    i = handles[cur_handle]
+                    datas[i] = self._instr_acqs[i]._stop(cur_handle.result(), **kwargs)
+        except BaseException:
+            self._stale_handles = {x : handles[x] for x in handles if not x.done()}
+            raise
 
         final_data_pkt = {}
         final_data_pkt['data'] = {}
@@ -81,6 +106,19 @@ class MultiACQ(ACQ):
             inst.ChannelStates = ch_states[counter:counter+num_channels]
             counter += num_channels
 
+    @property
+    def Timeout(self):
+        '''
+        Maximum time (in seconds) to wait for each card to return its data after enabling the trigger (None to wait indefinitely). Note that
+        a card that timed out (or was still running when another card failed) keeps acquiring until its acquisition call returns. The next
+        call to get_data waits (up to Timeout) for it to finish and raises an assertion if it is still running.
+        '''
+        return self._timeout
+    @Timeout.setter
+    def Timeout(self, timeout_seconds):
+        assert timeout_seconds is None or timeout_seconds > 0, "The timeout must be positive (or None)."
+        self._timeout = timeout_seconds
+
     @property
     def NumSamples(self):
         return self._instr_acq.NumSamples
@@ -139,7 +177,7 @@ class MultiACQ(ACQ):
             'TriggerSource' : self._get_trig_src_params_dict(),
             'Processor' : proc_name
             }
-        self.pack_properties_to_dict(['NumSamples', 'NumSegments', 'NumRepetitions', 'SampleRate', 'InputTriggerEdge', 'ChannelStates'], ret_dict)
+        self.pack_properties_to_dict(['NumSamples', 'NumSegments', 'NumRepetitions', 'SampleRate', 'InputTriggerEdge', 'ChannelStates', 'Timeout'], ret_dict)
         return ret_dict
 
     def _set_current_config(self, dict_config, lab):
@@ -149,6 +187,7 @@ class MultiACQ(ACQ):
         self.NumRepetitions = dict_config['NumRepetitions']
         self.SampleRate = dict_config['SampleRate']
         self.InputTriggerEdge = dict_config['InputTriggerEdge']
+        self.Timeout = dict_config.get('Timeout', None)
         default_channel_states = []
         for inst in self._instr_acqs:
             num_channels = inst.AvailableChannels
@@ -22,9 +22,9 @@ class CPU_AmpPhs(ProcNodeCPU):
         init_keys = [x for x in data_pkt['data'].keys()]
         ch_keys = [init_keys[x] for x in self.channels]
         if self.discard_inputs:
-            dataIQs = [data_pkt['data'].pop(x) for x in ch_keys]
+            dataIQs = [self.promote_raw(data_pkt['data'].pop(x)) for x in ch_keys]
         else:
-            dataIQs = [data_pkt['data'][x] for x in ch_keys]
+            dataIQs = [self.promote_raw(data_pkt['data'][x]) for x in ch_keys]
         sample_rates = data_pkt['misc'].pop('SampleRates', None)
         new_sample_rates = []
         for x in range(int(len(self.channels)/2)):
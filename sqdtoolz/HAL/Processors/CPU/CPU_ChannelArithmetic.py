@@ -41,7 +41,7 @@ class CPU_ChannelArithmetic(ProcNodeCPU):
         else:
             cur_data1 = data_pkt['data'][ch_key1]
             cur_data2 = data_pkt['data'][ch_key2]
-        data_pkt['data'][f'{ch_key1}_{self.operation}_{ch_key2}'] = opsMap[self.operation](cur_data1, cur_data2)
+        data_pkt['data'][f'{ch_key1}_{self.operation}_{ch_key2}'] = opsMap[self.operation](self.promote_raw(cur_data1), self.promote_raw(cur_data2))
 
         sample_rates = data_pkt['misc'].pop('SampleRates', None)
         assert sample_rates[self.channels[0]] == sample_rates[self.channels[1]], 'Sample rates of channels being added are not the same'
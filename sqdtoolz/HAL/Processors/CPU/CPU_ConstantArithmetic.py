@@ -21,6 +21,7 @@ class CPU_ConstantArithmetic(ProcNodeCPU):
         return cls(config_dict['Constant'], config_dict['Operation'], config_dict['Channels'])
 
     def perform_arithmetic(self, data, operation, constant):
+        data = self.promote_raw(data)
         if operation == '+':
             data += constant
         elif operation == '-':
@@ -20,8 +20,8 @@ class CPU_DDC(ProcNodeCPU):
 
         #Process DDC on a per-channel basis
         init_keys = [x for x in data_pkt['data'].keys()]
-        if len(self._ddc_cossin_arrays) == 0:
-            self._ddc_cossin_arrays = [(0, 0, 0, None, None) for x in init_keys]
+        if len(self._ddc_cossin_arrays) < len(init_keys):
+            self._ddc_cossin_arrays = self._ddc_cossin_arrays + [(0, 0, 0, None, None)]*(len(init_keys)-len(self._ddc_cossin_arrays))
         init_sample_rates = data_pkt['misc'].pop('SampleRates', None)
         final_sample_rates = []
         for ch_ind, cur_ch in enumerate(init_keys):
@@ -30,14 +30,16 @@ class CPU_DDC(ProcNodeCPU):
             sample_rate = init_sample_rates[ch_ind]
 
             if ddc_frequency != None and ddc_frequency != 0:
-                if self._ddc_cossin_arrays[ch_ind][0] != num_samples or self._ddc_cossin_arrays[ch_ind][1] != sample_rate or self._ddc_cossin_arrays[ch_ind][2] != ddc_frequency:
+                cur_cossin = self._ddc_cossin_arrays[ch_ind]
+                if cur_cossin[0] != num_samples or cur_cossin[1] != sample_rate or cur_cossin[2] != ddc_frequency:
                     omega = 2*np.pi*ddc_frequency/sample_rate
-                    self._ddc_cossin_arrays[ch_ind] = (
+                    cur_cossin = (
                         num_samples, sample_rate, ddc_frequency, 2.0*np.cos(omega*np.arange(num_samples)), -2.0*np.sin(omega*np.arange(num_samples)) )
+                    self._ddc_cossin_arrays[ch_ind] = cur_cossin
                 #Perform the actual DDC...
                 cur_data_cpu = data_pkt['data'].pop(cur_ch)
-                data_pkt['data'][f'{cur_ch}_I'] = np.multiply(cur_data_cpu, self._ddc_cossin_arrays[ch_ind][3])
-                data_pkt['data'][f'{cur_ch}_Q'] = np.multiply(cur_data_cpu, self._ddc_cossin_arrays[ch_ind][4])
+                data_pkt['data'][f'{cur_ch}_I'] = np.multiply(cur_data_cpu, cur_cossin[3])
+                data_pkt['data'][f'{cur_ch}_Q'] = np.multiply(cur_data_cpu, cur_cossin[4])
                 final_sample_rates += [sample_rate]*2
                 del cur_data_cpu    #Perhaps necessary - well it's no time for caution...
             else:
@@ -0,0 +1,142 @@
+from sqdtoolz.HAL.Processors.ProcessorCPU import*
+from sqdtoolz.HAL.Processors.CPU.CPU_FIR import CPU_FIR
+import numpy as np
+
+class CPU_DDCFIRDecimate(ProcNodeCPU):
+    def __init__(self, ddc_freqs, fir_specs = [{'Type' : 'low', 'Taps' : 40, 'fc' : 10e6, 'Win' : 'hamming'}], deci_fac = 1):
+        '''
+        Fused version of the pipeline: CPU_DDC(ddc_freqs) -> CPU_FIR(fir_specs) -> CPU_Decimation('sample', deci_fac). It gives the
+        same output, but only computes the filtered samples that remain after the decimation (via a polyphase decomposition of the
+        FIR filter) without allocating the intermediate full-rate I and Q arrays.
+
+        Inputs:
+            - ddc_freqs - Per-channel list of DDC frequencies as given in CPU_DDC (channels with None or 0 are not downconverted)
+            - fir_specs - Per-channel list of FIR filter specifications as given in CPU_FIR. As with the unfused pipeline, it is indexed
+                          across the channels after the DDC (e.g. the channels 'ch1_I', 'ch1_Q', 'ch2_I', 'ch2_Q' for 2 input channels).
+            - deci_fac  - Decimation factor (i.e. number of samples to skip across) along the 'sample' axis
+        '''
+        self._ddc_freqs = ddc_freqs
+        self._fir_specs = fir_specs
+        self._deci_fac = int(deci_fac)
+        assert self._deci_fac > 0, "The decimation factor must be a positive integer."
+        #A data store of current cosine|sine arrays used for DDC with each entry formatted as: (num-samples, sample-rate, ddc-frequency, cosine-array, sine-array)
+        self._ddc_cossin_arrays = []
+        #A data store of current polyphase filter matrices with each entry formatted as: (sample-rate, type, taps, window, cutoff, polyphase-matrix)
+        self._fir_arrays = []
+
+    @classmethod
+    def fromConfigDict(cls, config_dict):
+        return cls(config_dict['Frequencies'], config_dict['FIRspecs'], config_dict['DecimationFactor'])
+
+    def process_data(self, data_pkt, **kwargs):
+        assert 'misc' in data_pkt, "The data packet does not have miscellaneous data under the key 'misc'"
+        assert 'SampleRates' in data_pkt['misc'], "The data packet does not have SampleRate under the entry 'misc'"
+        assert data_pkt['parameters'][-1] == 'sample', "The fused DDC-FIR-decimation stage requires 'sample' to be the last parameter in the dataset."
+
+        init_keys = [x for x in data_pkt['data'].keys()]
+        assert len(self._ddc_freqs) >= len(init_keys), f"The dataset has more channels ({len(init_keys)}) than specified number of DDC frequencies ({len(self._ddc_freqs)})."
+
+        #Output channels are ordered as in CPU_DDC - i.e. the channels that are not downconverted followed by the I/Q pairs
+        ddc_chs = [(self._ddc_freqs[m] != None and self._ddc_freqs[m] != 0) for m in range(len(init_keys))]
+        final_keys = [x for m, x in enumerate(init_keys) if not ddc_chs[m]]
+        for m, x in enumerate(init_keys):
+            if ddc_chs[m]:
+                final_keys += [f'{x}_I', f'{x}_Q']
+        assert len(self._fir_specs) >= len(final_keys), f"The dataset has more channels ({len(final_keys)}) than specified number of FIR filters ({len(self._fir_specs)})."
+        if len(self._ddc_cossin_arrays) < len(init_keys):
+            self._ddc_cossin_arrays = self._ddc_cossin_arrays + [(0, 0, 0, None, None)]*(len(init_keys)-len(self._ddc_cossin_arrays))
+        if len(self._fir_arrays) < len(final_keys):
+            self._fir_arrays = self._fir_arrays + [(None, None, None, None, None, None)]*(len(final_keys)-len(self._fir_arrays))
+
+        init_data = data_pkt.pop('data')
+        init_sample_rates = data_pkt['misc'].pop('SampleRates', None)
+        final_data = {}
+        final_sample_rates = {}
+        for ch_ind, cur_ch in enumerate(init_keys):
+            cur_data = init_data.pop(cur_ch)
+            num_samples = cur_data.shape[-1]
+            sample_rate = init_sample_rates[ch_ind]
+            if ddc_chs[ch_ind]:
+                ddc_frequency = self._ddc_freqs[ch_ind]
+                cur_cossin = self._ddc_cossin_arrays[ch_ind]
+                if cur_cossin[0] != num_samples or cur_cossin[1] != sample_rate or cur_cossin[2] != ddc_frequency:
+                    omega = 2*np.pi*ddc_frequency/sample_rate
+                    cur_cossin = (
+                        num_samples, sample_rate, ddc_frequency, 2.0*np.cos(omega*np.arange(num_samples)), -2.0*np.sin(omega*np.arange(num_samples)) )
+                    self._ddc_cossin_arrays[ch_ind] = cur_cossin
+                cur_outputs = [(f'{cur_ch}_I', cur_cossin[3]), (f'{cur_ch}_Q', cur_cossin[4])]
+            else:
+                cur_outputs = [(cur_ch, None)]
+            #Reuse the same full-rate buffer across the I and Q outputs
+            cur_buf = None
+            for cur_out_ch, cur_mixer in cur_outputs:
+                cur_poly = self._get_polyphase_filter(final_keys.index(cur_out_ch), sample_rate, num_samples)
+                num_taps = cur_poly[2]
+                pad_left, pad_right = num_taps - 1 - num_taps//2, num_taps//2
+                num_out = -(-num_samples // self._deci_fac)
+                buf_len = self._deci_fac * max(num_out + cur_poly[5].shape[0] - 1, -(-(num_samples + num_taps - 1) // self._deci_fac))
+                buf_shape = cur_data.shape[:-1] + (buf_len,)
+                if cur_buf is None or cur_buf.shape != buf_shape:
+                    cur_buf = np.empty(buf_shape, dtype=np.result_type(cur_data.dtype, np.float64))
+                self._fill_buffer(cur_buf, cur_data, cur_mixer, pad_left, pad_right)
+                final_data[cur_out_ch] = self._apply_polyphase(cur_buf, cur_poly[5], num_out)
+                final_sample_rates[cur_out_ch] = sample_rate / float(self._deci_fac)
+            del cur_buf
+            del cur_data    #Perhaps necessary - well it's no time for caution...
+
+        data_pkt['data'] = {x : final_data[x] for x in final_keys}
+        data_pkt['misc']['SampleRates'] = [final_sample_rates[x] for x in final_keys]
+        return data_pkt
+
+    def _get_polyphase_filter(self, out_ind, sample_rate, num_samples):
+        filter_type = self._fir_specs[out_ind]['Type']
+        taps = self._fir_specs[out_ind]['Taps']
+        if taps is None:
+            taps = num_samples
+        window = self._fir_specs[out_ind]['Win']
+        cutoff = self._fir_specs[out_ind]['fc']
+        if cutoff is None:
+            cutoff = 1/num_samples
+        cur_fir = self._fir_arrays[out_ind]
+        if cur_fir[0] != sample_rate or cur_fir[1] != filter_type or \
+           cur_fir[2] != taps or cur_fir[3] != window or cur_fir[4] != cutoff:
+            #Arrange the (time-reversed) filter into a (num-phases x deci_fac) matrix in which row q holds the taps q*deci_fac to (q+1)*deci_fac-1
+            fir_coeffs = CPU_FIR.design_fir(sample_rate, filter_type, taps, window, cutoff)[::-1]
+            num_phases = -(-taps // self._deci_fac)
+            poly_mat = np.zeros(num_phases*self._deci_fac)
+            poly_mat[:taps] = fir_coeffs
+            cur_fir = (sample_rate, filter_type, taps, window, cutoff, poly_mat.reshape(num_phases, self._deci_fac))
+            self._fir_arrays[out_ind] = cur_fir
+        return cur_fir
+
+    def _fill_buffer(self, buf, data, mixer, pad_left, pad_right):
+        #Writes the mixed data into the buffer along with the same (symmetric) edge-padding as used in scipy.ndimage.convolve1d
+        num_samples = data.shape[-1]
+        mid = buf[..., pad_left:pad_left+num_samples]
+        if mixer is None:
+            np.copyto(mid, data)
+        else:
+            np.multiply(data, mixer, out=mid)
+        if pad_left <= num_samples and pad_right <= num_samples:
+            buf[..., :pad_left] = mid[..., :pad_left][..., ::-1]
+            buf[..., pad_left+num_samples:pad_left+num_samples+pad_right] = mid[..., num_samples-pad_right:][..., ::-1]
+        else:
+            #Filters longer than the trace require multiple reflections...
+            buf[..., :pad_left+num_samples+pad_right] = np.pad(mid, [(0,0)]*(mid.ndim-1) + [(pad_left,pad_right)], mode='symmetric')
+        buf[..., pad_left+num_samples+pad_right:] = 0
+
+    def _apply_polyphase(self, buf, poly_mat, num_out):
+        #The m-th output sample is given by: sum_q buf[(m+q)*deci_fac : (m+q+1)*deci_fac] . poly_mat[q]
+        buf_blocks = buf.reshape(buf.shape[:-1] + (-1, self._deci_fac))
+        ret_data = buf_blocks[..., 0:num_out, :] @ poly_mat[0]
+        for q in range(1, poly_mat.shape[0]):
+            ret_data += buf_blocks[..., q:q+num_out, :] @ poly_mat[q]
+        return ret_data
+
+    def _get_current_config(self):
+        return {
+            'Type'  : self.__class__.__name__,
+            'Frequencies' : self._ddc_freqs[:],
+            'FIRspecs' : self._fir_specs,
+            'DecimationFactor' : self._deci_fac
+        }
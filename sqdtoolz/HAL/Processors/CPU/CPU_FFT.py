@@ -10,6 +10,8 @@ class CPU_FFT(ProcNodeCPU):
             - ind_IQ - Tuple of the IQ indices. Default is 0 and 1 (i.e. assuming first and second channels are I and Q).
         '''
         self._ind_IQ = ind_IQ
+        #Data store of the current frequencies formatted as: (num-samples, sample-rate, frequencies)
+        self._freqs = (0, 0, None)
 
     @classmethod
     def fromConfigDict(cls, config_dict):
@@ -26,14 +28,22 @@ class CPU_FFT(ProcNodeCPU):
         if len(cur_chs) == 1:
             cur_iq_data_complex = cur_iq_arrays[0]
         else:
-            cur_iq_data_complex = cur_iq_arrays[0] + 1j*cur_iq_arrays[1]
+            #Fill the complex array directly to avoid the temporary array from 1j*Q
+            cur_iq_data_complex = np.empty(cur_iq_arrays[0].shape, dtype=np.result_type(cur_iq_arrays[0].dtype, cur_iq_arrays[1].dtype, np.complex64))
+            cur_iq_data_complex.real = cur_iq_arrays[0]
+            cur_iq_data_complex.imag = cur_iq_arrays[1]
         
         #Calculate FFT over the last inner-most axis/index:
         num_samples = cur_iq_data_complex.shape[-1]
         #Assuming that the sample rates are the same across both channels!
         sample_rate = data_pkt['misc']['SampleRates'][0]
 
-        freqs = np.fft.fftfreq(num_samples, 1.0/sample_rate)
+        cur_freqs = self._freqs
+        if cur_freqs[0] != num_samples or cur_freqs[1] != sample_rate:
+            cur_freqs = (num_samples, sample_rate, np.fft.fftfreq(num_samples, 1.0/sample_rate))
+            cur_freqs[2].flags.writeable = False
+            self._freqs = cur_freqs
+        freqs = cur_freqs[2]
         arr_fft = np.fft.fft(cur_iq_data_complex)
 
         data_pkt['data']['fft_real'] = np.real(arr_fft)
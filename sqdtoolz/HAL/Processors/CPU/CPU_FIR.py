@@ -2,9 +2,18 @@ from sqdtoolz.HAL.Processors.ProcessorCPU import*
 import numpy as np
 import scipy.ndimage
 import scipy.signal
+import collections
+import threading
 
 class CPU_FIR(ProcNodeCPU):
-    def __init__(self, fir_specs = [{'Type' : 'low', 'Taps' : 40, 'fc' : 10e6, 'Win' : 'hamming'}]):
+    #Filters with more taps than this threshold use FFT-based convolution when the method is 'auto'
+    FFT_TAPS_THRESHOLD = 32
+    #Maximum number of filters held in the (process-wide) filter design cache
+    DESIGN_CACHE_SIZE = 64
+    _design_cache = collections.OrderedDict()
+    _design_cache_lock = threading.Lock()
+
+    def __init__(self, fir_specs = [{'Type' : 'low', 'Taps' : 40, 'fc' : 10e6, 'Win' : 'hamming'}], mode = 'reflect', method = 'auto'):
         '''
         A general FIR filter applied across different channels in the input dataset.
 
@@ -13,14 +22,24 @@ class CPU_FIR(ProcNodeCPU):
             - Taps - Number of taps to use in the FIR filter
             - fc   - Cutoff frequency of the filter
             - Win  - The filter window (e.g. 'hamming') as fed into the function scipy.signal.firwin
+
+        The optional inputs are:
+            - mode   - Boundary handling of the convolution given as either:
+                        - 'reflect' - output is the same size as the input with the signal reflected (half-sample symmetric) at the edges
+                        - 'same'    - output is the same size as the input with the signal zero-padded at the edges
+                        - 'valid'   - output only contains the samples in which the filter fully overlaps the signal (i.e. Taps-1 fewer samples)
+            - method - Convolution method given as 'direct', 'fft' (overlap-add/FFT convolution) or 'auto' (uses 'fft' for filters with
+                       more than FFT_TAPS_THRESHOLD taps)
         '''
+        assert mode in ['reflect', 'same', 'valid'], "The mode must be 'reflect', 'same' or 'valid'."
+        assert method in ['direct', 'fft', 'auto'], "The method must be 'direct', 'fft' or 'auto'."
         self._fir_specs = fir_specs
-        #A data store of current fir_filter_specs
-        self._fir_arrays = []
+        self._mode = mode
+        self._method = method
 
     @classmethod
     def fromConfigDict(cls, config_dict):
-        return cls(config_dict['FIRspecs'])
+        return cls(config_dict['FIRspecs'], config_dict.get('Mode', 'reflect'), config_dict.get('Method', 'auto'))
 
     def process_data(self, data_pkt, **kwargs):
         assert 'misc' in data_pkt, "The data packet does not have miscellaneous data under the key 'misc'"
@@ -28,40 +47,110 @@ class CPU_FIR(ProcNodeCPU):
 
         assert len(self._fir_specs) >= len(data_pkt['data'].keys()), f"The dataset has more channels ({len(data_pkt['data'].keys())}) than specified number of FIR filters ({len(self._fir_specs)})."
 
-        #Process FIR on a per-channel basis
+        #Group the channels with the same filter and data shape so that they are filtered together
         init_keys = [x for x in data_pkt['data'].keys()]
-        if len(self._fir_arrays) == 0:
-            self._fir_arrays = [(None, None, None, None, None, None) for x in init_keys]
+        ch_groups = {}
         for ch_ind, cur_ch in enumerate(init_keys):
-            cur_data_gpu = data_pkt['data'][cur_ch]
+            cur_data = data_pkt['data'][cur_ch]
             sample_rate = data_pkt['misc']['SampleRates'][ch_ind]
             filter_type = self._fir_specs[ch_ind]['Type']
             taps = self._fir_specs[ch_ind]['Taps']
             if taps is None:
-                taps = cur_data_gpu.shape[-1]
+                taps = cur_data.shape[-1]
             window = self._fir_specs[ch_ind]['Win']
             cutoff = self._fir_specs[ch_ind]['fc']
             if cutoff is None:
-                cutoff = 1/cur_data_gpu.shape[-1]
-            if self._fir_arrays[ch_ind][0] != sample_rate or self._fir_arrays[ch_ind][1] != filter_type or \
-               self._fir_arrays[ch_ind][2] != taps or self._fir_arrays[ch_ind][3] != window or self._fir_arrays[ch_ind][4] != cutoff:
-                nyq_rate = sample_rate*0.5
-                freq_cutoff_norm = cutoff/nyq_rate
-                if filter_type == 'low':
-                    fir_coeffs = np.array(scipy.signal.firwin(taps, freq_cutoff_norm, window=window))
-                else:
-                    fir_coeffs = 1.0 - np.array(scipy.signal.firwin(taps, freq_cutoff_norm, window=window))
-                self._fir_arrays[ch_ind] = (sample_rate,filter_type,taps,window,cutoff, fir_coeffs)
-            data_pkt['data'][cur_ch] = self.apply_fir(cur_data_gpu, self._fir_arrays[ch_ind][5])
-            del cur_data_gpu #Perhaps necessary - well it's no time for caution...
+                cutoff = 1/cur_data.shape[-1]
+            fir_coeffs = self.design_fir(sample_rate, filter_type, taps, window, cutoff)
+            cur_key = (id(fir_coeffs), cur_data.shape, cur_data.dtype)
+            if cur_key not in ch_groups:
+                ch_groups[cur_key] = (fir_coeffs, [])
+            ch_groups[cur_key][1].append(cur_ch)
+
+        for fir_coeffs, cur_chs in ch_groups.values():
+            if self._use_fft(fir_coeffs):
+                filt_data = self.apply_fir_fft([data_pkt['data'][x] for x in cur_chs], fir_coeffs)
+                for m, cur_ch in enumerate(cur_chs):
+                    data_pkt['data'][cur_ch] = filt_data[m]
+                del filt_data
+            else:
+                for cur_ch in cur_chs:
+                    data_pkt['data'][cur_ch] = self.apply_fir(data_pkt['data'][cur_ch], fir_coeffs)
 
         return data_pkt
 
+    @classmethod
+    def design_fir(cls, sample_rate, filter_type, taps, window, cutoff):
+        #The filter coefficients are cached across all channels and processors (the returned arrays are read-only)
+        if isinstance(window, list):
+            window = tuple(window)
+        cur_key = (sample_rate, filter_type, taps, window, cutoff)
+        with cls._design_cache_lock:
+            if cur_key in cls._design_cache:
+                cls._design_cache.move_to_end(cur_key)
+                return cls._design_cache[cur_key]
+        nyq_rate = sample_rate*0.5
+        freq_cutoff_norm = cutoff/nyq_rate
+        if filter_type == 'low':
+            fir_coeffs = np.array(scipy.signal.firwin(taps, freq_cutoff_norm, window=window))
+        else:
+            fir_coeffs = 1.0 - np.array(scipy.signal.firwin(taps, freq_cutoff_norm, window=window))
+        fir_coeffs.flags.writeable = False
+        with cls._design_cache_lock:
+            fir_coeffs = cls._design_cache.setdefault(cur_key, fir_coeffs)
+            while len(cls._design_cache) > cls.DESIGN_CACHE_SIZE:
+                cls._design_cache.popitem(last=False)
+        return fir_coeffs
+
+    def _use_fft(self, fir_coeffs):
+        if self._method == 'auto':
+            return fir_coeffs.size > self.FFT_TAPS_THRESHOLD
+        return self._method == 'fft'
+
+    def _get_padding(self, num_taps):
+        #Padding of the signal such that a 'valid' convolution gives the same alignment as in scipy.ndimage.convolve1d
+        if self._mode == 'valid':
+            return 0, 0
+        return num_taps - 1 - num_taps//2, num_taps//2
+
     def apply_fir(self, data, fir_coeffs):
-        return scipy.ndimage.convolve1d(data, fir_coeffs)
+        data = self.promote_raw(data)
+        if self._mode == 'reflect':
+            return scipy.ndimage.convolve1d(data, fir_coeffs)
+        ret_data = scipy.ndimage.convolve1d(data, fir_coeffs, mode='constant', cval=0.0)
+        if self._mode == 'valid':
+            pad_left = fir_coeffs.size - 1 - fir_coeffs.size//2
+            ret_data = ret_data[..., pad_left:pad_left + max(data.shape[-1] - fir_coeffs.size + 1, 0)]
+        return ret_data
+
+    def apply_fir_fft(self, data_arrays, fir_coeffs):
+        #Filters a list of equally-shaped arrays in one FFT convolution by writing them (with the edge padding) into a single array
+        num_taps = fir_coeffs.size
+        pad_left, pad_right = self._get_padding(num_taps)
+        num_samples = data_arrays[0].shape[-1]
+        padded = np.zeros((len(data_arrays),) + data_arrays[0].shape[:-1] + (num_samples + pad_left + pad_right,), dtype=np.result_type(data_arrays[0].dtype, np.float64))
+        for m, cur_data in enumerate(data_arrays):
+            if self._mode == 'reflect':
+                if pad_left <= num_samples and pad_right <= num_samples:
+                    padded[m, ..., pad_left:pad_left+num_samples] = cur_data
+                    padded[m, ..., :pad_left] = cur_data[..., :pad_left][..., ::-1]
+                    padded[m, ..., pad_left+num_samples:] = cur_data[..., num_samples-pad_right:][..., ::-1]
+                else:
+                    #Filters longer than the trace require multiple reflections...
+                    padded[m] = np.pad(cur_data, [(0,0)]*(cur_data.ndim-1) + [(pad_left,pad_right)], mode='symmetric')
+            else:
+                padded[m, ..., pad_left:pad_left+num_samples] = cur_data
+        if num_taps > padded.shape[-1]:
+            return np.zeros(padded.shape[:-1] + (0,))
+        kernel = fir_coeffs.reshape((1,)*(padded.ndim-1) + (num_taps,))
+        if num_taps * 8 >= padded.shape[-1]:
+            return scipy.signal.fftconvolve(padded, kernel, mode='valid', axes=-1)
+        return scipy.signal.oaconvolve(padded, kernel, mode='valid', axes=-1)
 
     def _get_current_config(self):
         return {
             'Type'  : self.__class__.__name__,
-            'FIRspecs' : self._fir_specs
+            'FIRspecs' : self._fir_specs,
+            'Mode' : self._mode,
+            'Method' : self._method
         }
@@ -23,9 +23,9 @@ class CPU_Integrate(ProcNodeCPU):
         axis_num = data_pkt['parameters'].index(self._param_name)
         assert (not end_stage) or axis_num > 0, "Cannot and should not take the mean across the first variable unless it is in the end-stages."
 
-        #Process sums on a per-channel basis
+        #Process sums on a per-channel basis (raw integer samples are summed in float64 so that long sums cannot overflow)
         for ch_ind, cur_ch in enumerate(data_pkt['data'].keys()):
-            data_pkt['data'][cur_ch] = np.sum(data_pkt['data'][cur_ch], axis=axis_num)
+            data_pkt['data'][cur_ch] = np.sum(self.promote_raw(data_pkt['data'][cur_ch]), axis=axis_num)
 
         #Remove the parameter as it no longer exists after the averaging...
         data_pkt['parameters'].pop(axis_num)
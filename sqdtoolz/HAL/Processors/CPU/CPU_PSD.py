@@ -0,0 +1,165 @@
+from sqdtoolz.HAL.Processors.ProcessorCPU import*
+import numpy as np
+import scipy.signal
+import threading
+
+class CPU_PSD(ProcNodeCPU):
+    #Maximum number of samples (across all windowed segments) transformed at a time
+    BATCH_SAMPLES = 2**22
+
+    def __init__(self, seg_len, overlap = 0.5, window = 'hann', ind_IQ = (0,1), average_reps = False, scaling = 'density'):
+        '''
+        Estimates the Power-Spectral-Density of a given trace of time values via Welch's method. That is, the trace is split into
+        (overlapping) windowed segments whose periodograms are averaged. See: https://en.wikipedia.org/wiki/Welch%27s_method.
+
+        Inputs:
+            - seg_len - Number of samples in every segment (i.e. the number of frequency points in the spectrum)
+            - overlap - Fraction of the segment length by which the adjacent segments overlap (must be in [0,1)).
+            - window  - The window (e.g. 'hann') as fed into the function scipy.signal.get_window
+            - ind_IQ  - Tuple of the IQ indices. Default is 0 and 1 (i.e. assuming first and second channels are I and Q).
+            - average_reps - If True, the spectra are also averaged across the first parameter (e.g. repetition) with a running
+                             accumulator (i.e. only the average spectrum is retained while the data packets are pushed).
+            - scaling - Either 'density' for the power spectral density (V^2/Hz) or 'spectrum' for the power spectrum (V^2).
+        '''
+        assert seg_len > 0, "The segment length must be a positive integer."
+        assert overlap >= 0 and overlap < 1, "The overlap must be a fraction in [0,1)."
+        assert scaling in ['density', 'spectrum'], "The scaling must be 'density' or 'spectrum'."
+        self._seg_len = int(seg_len)
+        self._overlap = overlap
+        self._window = window
+        self._ind_IQ = ind_IQ
+        self._average_reps = average_reps
+        self._scaling = scaling
+        #Data store of the current window and frequencies formatted as: (sample-rate, one-sided, window-array, scale-array, frequencies)
+        self._win_arrays = (None, None, None, None, None)
+        self._lock = threading.Lock()
+        self._reset_stats()
+
+    @classmethod
+    def fromConfigDict(cls, config_dict):
+        return cls(config_dict['SegmentLength'], config_dict['Overlap'], config_dict['Window'], config_dict['IQindices'],
+                   config_dict['AverageRepetitions'], config_dict['Scaling'])
+
+    @property
+    def IsAccumulator(self):
+        return self._average_reps
+
+    def process_data(self, data_pkt, **kwargs):
+        if self._average_reps:
+            #Used when run as an end-stage - i.e. on the entire collated dataset
+            self.accumulate_data(data_pkt)
+            return self.finalise_data()
+        return self._calc_psd(data_pkt)
+
+    def accumulate_data(self, data_pkt):
+        data_pkt = self._calc_psd(data_pkt)
+        cur_psd = data_pkt['data']['psd']
+        cur_count = cur_psd.shape[0]
+        if cur_count == 0:
+            return
+        cur_sum = np.sum(cur_psd, axis=0)
+        with self._lock:
+            if self._count == 0:
+                self._template = data_pkt
+                self._template['parameters'] = data_pkt['parameters'][1:]
+                self._template['data'] = {}
+                self._psd_sum = cur_sum
+            else:
+                self._psd_sum = self._psd_sum + cur_sum
+            self._count += cur_count
+
+    def finalise_data(self):
+        with self._lock:
+            if self._count == 0:
+                self._reset_stats()
+                return None
+            ret_data = self._template
+            ret_data['data']['psd'] = self._psd_sum / self._count
+            ret_data['misc']['Count'] = self._count
+            self._reset_stats()
+        return ret_data
+
+    def _reset_stats(self):
+        self._count = 0
+        self._psd_sum = None
+        self._template = None
+
+    def _get_window(self, sample_rate, one_sided):
+        cur_win = self._win_arrays
+        if cur_win[0] != sample_rate or cur_win[1] != one_sided:
+            win = scipy.signal.get_window(self._window, self._seg_len)
+            if self._scaling == 'density':
+                scale = 1.0 / (sample_rate * np.sum(win**2))
+            else:
+                scale = 1.0 / np.sum(win)**2
+            if one_sided:
+                freqs = np.fft.rfftfreq(self._seg_len, 1.0/sample_rate)
+                #Fold the power of the negative frequencies onto the positive frequencies (i.e. all bins bar DC and Nyquist)
+                scale = np.full(freqs.size, 2*scale)
+                scale[0] /= 2
+                if self._seg_len % 2 == 0:
+                    scale[-1] /= 2
+            else:
+                freqs = np.fft.fftfreq(self._seg_len, 1.0/sample_rate)
+                scale = np.full(freqs.size, scale)
+            freqs.flags.writeable = False
+            cur_win = (sample_rate, one_sided, win, scale, freqs)
+            self._win_arrays = cur_win
+        return cur_win
+
+    def _calc_psd(self, data_pkt):
+        cur_chs = [x for x in data_pkt['data'].keys()]
+        assert len(cur_chs) == 2 or len(cur_chs) == 1, "The incoming data-packet must either have 1 channel or 2 channels (for I and Q)."
+
+        cur_iq_arrays = []
+        for m in range(len(cur_chs)):
+            cur_iq_arrays.append( data_pkt['data'].pop(cur_chs[self._ind_IQ[m]]) )
+        one_sided = len(cur_chs) == 1
+
+        #Calculate the PSD over the last inner-most axis/index:
+        num_samples = cur_iq_arrays[0].shape[-1]
+        assert num_samples >= self._seg_len, f"The segment length ({self._seg_len}) is longer than the trace ({num_samples} samples)."
+        #Assuming that the sample rates are the same across both channels!
+        sample_rate = data_pkt['misc']['SampleRates'][0]
+        cur_win = self._get_window(sample_rate, one_sided)
+        win = cur_win[2]
+
+        #Segment the traces (as views) and transform them in batches to limit the size of the temporary arrays
+        seg_step = max(self._seg_len - int(self._overlap*self._seg_len), 1)
+        segs = [np.lib.stride_tricks.sliding_window_view(x, self._seg_len, axis=-1)[..., ::seg_step, :] for x in cur_iq_arrays]
+        num_segs = segs[0].shape[-2]
+        batch_size = max(self.BATCH_SAMPLES // (self._seg_len * max(int(np.prod(segs[0].shape[:-2])), 1)), 1)
+        psd = np.zeros(segs[0].shape[:-2] + (cur_win[4].size,))
+        for m in range(0, num_segs, batch_size):
+            if one_sided:
+                arr_fft = np.fft.rfft(segs[0][..., m:m+batch_size, :] * win)
+            else:
+                cur_segs = np.empty(segs[0][..., m:m+batch_size, :].shape, dtype=np.result_type(segs[0].dtype, segs[1].dtype, np.complex64))
+                np.multiply(segs[0][..., m:m+batch_size, :], win, out=cur_segs.real)
+                np.multiply(segs[1][..., m:m+batch_size, :], win, out=cur_segs.imag)
+                arr_fft = np.fft.fft(cur_segs, axis=-1)
+                del cur_segs
+            psd += np.sum(arr_fft.real**2 + arr_fft.imag**2, axis=-2)
+            del arr_fft
+        psd *= cur_win[3] / num_segs
+
+        data_pkt['data']['psd'] = psd
+
+        data_pkt['parameters'][-1] = 'fft_frequency'
+        if 'parameter_values' in data_pkt:
+            data_pkt['parameter_values']['fft_frequency'] = cur_win[4]
+        else:
+            data_pkt['parameter_values'] = {'fft_frequency' : cur_win[4]}
+
+        return data_pkt
+
+    def _get_current_config(self):
+        return {
+            'Type'  : self.__class__.__name__,
+            'SegmentLength' : self._seg_len,
+            'Overlap' : self._overlap,
+            'Window' : self._window,
+            'IQindices' : self._ind_IQ,
+            'AverageRepetitions' : self._average_reps,
+            'Scaling' : self._scaling
+        }
@@ -0,0 +1,119 @@
+from sqdtoolz.HAL.Processors.ProcessorCPU import*
+import numpy as np
+import threading
+
+class CPU_RunningMean(ProcNodeCPU):
+    def __init__(self, index_parameter_name = 'repetition'):
+        '''
+        Averages each channel across the first parameter (e.g. repetition) with a running accumulator that is updated with every
+        pushed data packet. Thus, unlike CPU_Mean, it can be placed in the main pipeline (the final mean is emitted on get_all_data)
+        without having to retain all data packets. The number of accumulated entries is given in 'misc' under the key 'Count'.
+
+        Inputs:
+            - index_parameter_name - Name of the parameter in which to average across (must be the first parameter).
+        '''
+        self._param_name = index_parameter_name
+        self._track_var = False
+        self._lock = threading.Lock()
+        self._reset_stats()
+
+    @classmethod
+    def fromConfigDict(cls, config_dict):
+        return cls(config_dict['Parameter'])
+
+    @property
+    def IsAccumulator(self):
+        return True
+
+    def process_data(self, data_pkt, **kwargs):
+        #Used when run as an end-stage - i.e. on the entire collated dataset
+        self.accumulate_data(data_pkt)
+        return self.finalise_data()
+
+    def accumulate_data(self, data_pkt):
+        assert self._param_name in data_pkt['parameters'], f"The indexing parameter '{self._param_name}' is not in the current dataset."
+        assert data_pkt['parameters'].index(self._param_name) == 0, f"Running statistics can only be accumulated across the first parameter in the dataset - not '{self._param_name}'."
+
+        #Calculate the statistics of the current packet (outside the lock)
+        cur_count = None
+        cur_stats = {}
+        for cur_ch in data_pkt['data'].keys():
+            cur_data = data_pkt['data'][cur_ch]
+            cur_count = cur_data.shape[0]
+            if cur_count == 0:
+                return
+            cur_mean = np.mean(cur_data, axis=0)
+            #The squared deviations are taken as magnitudes so that complex channels yield a real variance (as in np.var)
+            cur_m2 = np.sum(np.abs(cur_data - cur_mean)**2, axis=0) if self._track_var else None
+            cur_stats[cur_ch] = (cur_mean, cur_m2)
+        if cur_count == None:
+            return
+
+        #Merge with the running statistics (Chan et al. pairwise update of Welford's algorithm)
+        with self._lock:
+            if self._count == 0:
+                self._template = {x : data_pkt[x] for x in data_pkt if x != 'data'}
+                self._template['parameters'] = data_pkt['parameters'][1:]
+                if 'misc' in data_pkt:
+                    self._template['misc'] = data_pkt['misc'].copy()
+                #Accumulate in (at least) double precision
+                self._stats = {x : tuple(None if y is None else np.array(y, dtype=np.result_type(y, np.float64)) for y in cur_stats[x]) for x in cur_stats}
+                self._count = cur_count
+                return
+            assert list(cur_stats.keys()) == list(self._stats.keys()), "The data packets must have the same channels when accumulating running statistics."
+            new_count = self._count + cur_count
+            for cur_ch in cur_stats:
+                run_mean, run_m2 = self._stats[cur_ch]
+                delta = cur_stats[cur_ch][0] - run_mean
+                run_mean += delta * (cur_count / new_count)
+                if self._track_var:
+                    run_m2 += cur_stats[cur_ch][1] + np.abs(delta)**2 * (self._count * cur_count / new_count)
+            self._count = new_count
+
+    def finalise_data(self):
+        with self._lock:
+            if self._count == 0:
+                self._reset_stats()
+                return None
+            ret_data = self._template
+            ret_data['data'] = self._get_output_channels()
+            if 'misc' not in ret_data:
+                ret_data['misc'] = {}
+            ret_data['misc']['Count'] = self._count
+            self._reset_stats()
+        return ret_data
+
+    def _get_output_channels(self):
+        return {x : self._stats[x][0] for x in self._stats}
+
+    def _reset_stats(self):
+        self._count = 0
+        self._stats = {}
+        self._template = None
+
+    def _get_current_config(self):
+        return {
+            'Type'  : self.__class__.__name__,
+            'Parameter' : self._param_name
+        }
+
+class CPU_RunningMeanVariance(CPU_RunningMean):
+    def __init__(self, index_parameter_name = 'repetition'):
+        '''
+        Calculates the mean and variance of each channel across the first parameter (e.g. repetition) with a running accumulator
+        (via Welford's algorithm) that is updated with every pushed data packet. Thus, unlike CPU_MeanVariance, it can be placed in
+        the main pipeline without having to retain all data packets. The output channels are named as in CPU_MeanVariance while the
+        number of accumulated entries is given in 'misc' under the key 'Count'.
+
+        Inputs:
+            - index_parameter_name - Name of the parameter in which to average across (must be the first parameter).
+        '''
+        super().__init__(index_parameter_name)
+        self._track_var = True
+
+    def _get_output_channels(self):
+        ret_data = {}
+        for cur_ch in self._stats:
+            ret_data[f'{cur_ch}_{self._param_name}_Mean'] = self._stats[cur_ch][0]
+            ret_data[f'{cur_ch}_{self._param_name}_Var'] = self._stats[cur_ch][1] / self._count
+        return ret_data
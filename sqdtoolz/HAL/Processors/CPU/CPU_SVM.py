@@ -0,0 +1,65 @@
+from sqdtoolz.HAL.Processors.ProcessorCPU import ProcNodeCPU
+from sqdtoolz.HAL.DecisionBlock import DecisionBlock
+import numpy as np
+
+class CPU_SVM(ProcNodeCPU):
+    def __init__(self, channels, eqns, discard_inputs=False):
+        '''
+        Classifies the shots of IQ-pairs via line inequalities (i.e. the same half-plane equations as used in the DEC_SVM decision block
+        on FPGA-based ACQ instruments). The state of a given shot is given as an integer in which bit i is set if the shot (I,Q)
+        satisfies the i-th equation: a*I + b*Q > c.
+
+        Inputs:
+            - channels    - Indices denoting IQ-pairs. List/tuple size must be divisible by 2
+            - eqns        - List of the equations for every IQ-pair. The equations for a given IQ-pair are given as either a list of
+                            tuples (a,b,c) or a DEC_SVM object.
+            - discard_inputs - If True, the inputs channels will be deleted after inserting the new state channel for each IQ-pair.
+        '''
+        assert len(channels) % 2 == 0, 'Can only process N IQ-pairs - i.e. must give an even number of indices.'
+        assert len(eqns) == len(channels) // 2, 'Must supply a set of equations for every IQ-pair.'
+        self.channels = channels
+        self._eqns = []
+        for cur_eqns in eqns:
+            if isinstance(cur_eqns, DecisionBlock):
+                cur_eqns = cur_eqns.get_params()['Equations']
+            for x in cur_eqns:
+                assert (isinstance(x, list) or isinstance(x, tuple)) and len(x) == 3, "Equations in eqns must be given as a list of tuples (a,b,c) where ax+by>c"
+            assert len(cur_eqns) <= 63, "Can only supply up to 63 equations per IQ-pair."
+            self._eqns.append([list(x) for x in cur_eqns])
+        self.discard_inputs = discard_inputs
+
+    @classmethod
+    def fromConfigDict(cls, config_dict):
+        return cls(config_dict['Channels'], config_dict['Equations'], config_dict['DiscardInputs'])
+
+    def process_data(self, data_pkt, **kwargs):
+        init_keys = [x for x in data_pkt['data'].keys()]
+        ch_keys = [init_keys[x] for x in self.channels]
+        dataIQs = [self.promote_raw(data_pkt['data'][x]) for x in ch_keys]
+        if self.discard_inputs:
+            for x in set(ch_keys):
+                data_pkt['data'].pop(x)
+        sample_rates = data_pkt['misc'].pop('SampleRates', [])
+        new_sample_rates = []
+        for x in range(int(len(self.channels)/2)):
+            states = np.zeros(dataIQs[2*x].shape, dtype=np.int64)
+            for ind, (a,b,c) in enumerate(self._eqns[x]):
+                states |= (a*dataIQs[2*x] + b*dataIQs[2*x+1] > c).astype(np.int64) << ind
+            data_pkt['data'][f'State_{ch_keys[2*x]}{ch_keys[2*x+1]}'] = states
+            if len(sample_rates) > 0:
+                new_sample_rates += [sample_rates[self.channels[2*x]]]
+        if len(sample_rates) > 0:
+            if self.discard_inputs:
+                sample_rates = [sample_rates[x] for x in range(len(sample_rates)) if not x in self.channels]
+            sample_rates += new_sample_rates
+        data_pkt['misc']['SampleRates'] = sample_rates
+
+        return data_pkt
+
+    def _get_current_config(self):
+        return {
+            'Type'  : self.__class__.__name__,
+            'Channels' : self.channels,
+            'Equations' : self._eqns,
+            'DiscardInputs' : self.discard_inputs
+        }
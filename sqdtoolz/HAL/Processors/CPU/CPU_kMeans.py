@@ -1,49 +1,166 @@
 from sqdtoolz.HAL.Processors.ProcessorCPU import ProcNodeCPU
-try:
-    from pomegranate.kmeans import Kmeans
-except ModuleNotFoundError:
-    pass
 import numpy as np
+import threading
 
 class CPU_kMeans(ProcNodeCPU):
-    def __init__(self, k, index_parameter_name):
+    #Number of shots over which the distances to the centroids are calculated at a time
+    BATCH_SIZE = 2**20
+
+    def __init__(self, k, index_parameter_name, mode = 'fit', centroids = None, max_iters = 100, num_inits = 4, seed = None):
         '''
-        Perfoms kmeans using the kmeans functions in the pomegranate class
+        Classifies every shot (i.e. the point formed by the values across all channels) into one of k states via k-means clustering.
+        The states are given in a new channel 'State'.
 
         Inputs:
-            - index_parameter_name - which is the iteration index
             - k   - number of classes
+            - index_parameter_name - which is the iteration index
+            - mode - Either:
+                        - 'fit' - fits the centroids on the first data packet and then only classifies subsequent data packets
+                        - 'minibatch' - incrementally updates the centroids with every data packet (i.e. mini-batch k-means)
+                        - 'refit' - fits new centroids on every data packet
+            - centroids - (Optional) initial centroids given as a list of k points (one value per channel). In the 'fit' mode, these
+                          are used directly without fitting.
+            - max_iters - Maximum number of iterations when fitting the centroids
+            - num_inits - Number of random initialisations when fitting the centroids (the fit with the smallest total squared distance
+                          between the shots and their centroids is kept)
+            - seed      - (Optional) seed for the random initialisation (k-means++) of the centroids
         '''
+        assert mode in ['fit', 'minibatch', 'refit'], "The mode must be 'fit', 'minibatch' or 'refit'."
+        assert max_iters > 0, "The maximum number of iterations must be positive."
+        assert num_inits > 0, "The number of initialisations must be positive."
         self.k = k
         self._param_name = index_parameter_name
+        self._mode = mode
+        self._max_iters = max_iters
+        self._num_inits = num_inits
+        self._seed = seed
+        self._lock = threading.Lock()
+        self.Centroids = centroids
 
     @classmethod
     def fromConfigDict(cls, config_dict):
-        return cls(config_dict['k'], config_dict['Parameter'])
+        return cls(config_dict['k'], config_dict['Parameter'], config_dict.get('Mode', 'fit'), config_dict.get('Centroids', None),
+                   config_dict.get('MaxIterations', 100), config_dict.get('NumInits', 4), config_dict.get('Seed', None))
+
+    @property
+    def Centroids(self):
+        '''
+        Current centroids as a (k x number of channels) array (None if not yet fitted). Set to None to refit on the next data packet.
+        '''
+        return self._centroids
+    @Centroids.setter
+    def Centroids(self, centroids):
+        with self._lock:
+            if centroids is None:
+                self._centroids = None
+            else:
+                self._centroids = np.array(centroids, dtype=np.float64)
+                assert self._centroids.ndim == 2 and self._centroids.shape[0] == self.k, f"The centroids must be given as a list of {self.k} points."
+            self._counts = np.zeros(self.k)
 
     def process_data(self, data_pkt, **kwargs):
         # assert len(data_pkt['parameters']) == 1, "kmeans must be run on the innermost parameter."
-        assert data_pkt['parameters'].index(self._param_name) == len(data_pkt['parameters'])-1, "kmeans must be run on the innermost parameter."
         assert self._param_name in data_pkt['parameters'], f"The indexing parameter '{self._param_name}' is not in the current dataset."
+        assert data_pkt['parameters'].index(self._param_name) == len(data_pkt['parameters'])-1, "kmeans must be run on the innermost parameter."
 
-        data = np.vstack([data_pkt['data'][ch] for ch in data_pkt['data']]).T
-
-        model = Kmeans.from_samples(self.k, data)
+        data_shape = next(iter(data_pkt['data'].values())).shape
+        data = np.stack([np.ravel(data_pkt['data'][ch]) for ch in data_pkt['data']], axis=-1).astype(np.float64)
 
-        # for ch_ind, cur_ch in enumerate(data_pkt['data'].keys()):
-        #     data_pkt['data'][cur_ch] = model.centroids[:,ch_ind]
-        
-        data_pkt['data']['State'] = model.predict(data)
-        #Process means on a per-channel basis
+        if self._mode == 'refit':
+            centroids, states = self._fit(data)
+        else:
+            with self._lock:
+                if self._centroids is None:
+                    self._centroids, states = self._fit(data)
+                    self._counts = np.bincount(states, minlength=self.k).astype(np.float64)
+                elif self._mode == 'minibatch':
+                    states = self._classify(data, self._centroids)
+                    self._update_centroids(data, states)
+                else:
+                    centroids = self._centroids
+                    states = None
+            if states is None:
+                #Classify outside the lock as the centroids are fixed in the 'fit' mode
+                states = self._classify(data, centroids)
 
-        #Remove the parameter as it no longer exists after the averaging...
-        # data_pkt['parameters'] = ['cluster']
+        data_pkt['data']['State'] = states.reshape(data_shape)
 
         return data_pkt
-    
+
+    def _classify(self, data, centroids):
+        assert data.shape[1] == centroids.shape[1], f"The number of channels ({data.shape[1]}) does not match the dimension of the centroids ({centroids.shape[1]})."
+        states = np.empty(data.shape[0], dtype=np.int64)
+        for m in range(0, data.shape[0], self.BATCH_SIZE):
+            states[m:m+self.BATCH_SIZE] = np.argmin(self._get_sqr_dists(data[m:m+self.BATCH_SIZE], centroids), axis=1)
+        return states
+
+    def _get_sqr_dists(self, data, centroids):
+        #Accumulate over the channels to keep the temporary arrays at (shots x k)
+        dists = np.zeros((data.shape[0], centroids.shape[0]))
+        for f in range(data.shape[1]):
+            dists += (data[:, f, None] - centroids[None, :, f])**2
+        return dists
+
+    def _get_cluster_sums(self, data, states):
+        counts = np.bincount(states, minlength=self.k).astype(np.float64)
+        sums = np.stack([np.bincount(states, weights=data[:,f], minlength=self.k) for f in range(data.shape[1])], axis=-1)
+        return counts, sums
+
+    def _init_centroids(self, data, rng):
+        #k-means++ initialisation
+        centroids = data[rng.integers(data.shape[0])][None,:]
+        min_dists = self._get_sqr_dists(data, centroids)[:,0]
+        for m in range(1, self.k):
+            tot_dist = np.sum(min_dists)
+            if tot_dist > 0:
+                new_ind = rng.choice(data.shape[0], p=min_dists/tot_dist)
+            else:
+                new_ind = rng.integers(data.shape[0])
+            centroids = np.vstack([centroids, data[new_ind]])
+            min_dists = np.minimum(min_dists, self._get_sqr_dists(data, data[new_ind][None,:])[:,0])
+        return centroids
+
+    def _fit(self, data):
+        assert data.shape[0] >= self.k, f"Need at least {self.k} shots to fit {self.k} centroids."
+        rng = np.random.default_rng(self._seed)
+        best_fit = (np.inf, None, None)
+        for m in range(self._num_inits):
+            centroids, states = self._fit_single(data, self._init_centroids(data, rng))
+            cur_inertia = np.sum((data - centroids[states])**2)
+            if cur_inertia < best_fit[0]:
+                best_fit = (cur_inertia, centroids, states)
+        return best_fit[1], best_fit[2]
+
+    def _fit_single(self, data, centroids):
+        states = None
+        for m in range(self._max_iters):
+            new_states = self._classify(data, centroids)
+            if states is not None and np.array_equal(new_states, states):
+                break
+            states = new_states
+            counts, sums = self._get_cluster_sums(data, states)
+            #Empty clusters retain their previous centroid
+            centroids = np.where(counts[:,None] > 0, sums / np.maximum(counts, 1)[:,None], centroids)
+        return centroids, new_states
+
+    def _update_centroids(self, data, states):
+        #Mini-batch k-means update - i.e. every centroid moves towards the mean of its newly assigned shots with a learning rate
+        #given by the inverse of the total number of shots assigned to it thus far
+        counts, sums = self._get_cluster_sums(data, states)
+        self._counts += counts
+        mask = counts > 0
+        centroids = self._centroids.copy()
+        centroids[mask] += (sums[mask] - counts[mask,None]*centroids[mask]) / self._counts[mask,None]
+        self._centroids = centroids
+
     def _get_current_config(self):
         return {
             'Type'  : self.__class__.__name__,
             'k': self.k,
-            'Parameter' : self._param_name
+            'Parameter' : self._param_name,
+            'Mode' : self._mode,
+            'Centroids' : None if (self._centroids is None or self._mode == 'refit') else self._centroids.tolist(),
+            'MaxIterations' : self._max_iters,
+            'NumInits' : self._num_inits,
+            'Seed' : self._seed
         }
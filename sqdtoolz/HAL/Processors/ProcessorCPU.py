@@ -4,15 +4,46 @@ import queue
 import numpy as np
 
 class ProcNodeCPU:
+    '''
+    Base class for the CPU processing stages. When the ProcessorCPU streams with NumWorkers > 0, several data packets may go through
+    process_data and accumulate_data on the same stage at the same time. Thus, any state cached on the stage (e.g. DDC/window arrays
+    rebuilt when the sample rate changes) must be read into a local reference once and replaced as a whole rather than modified in
+    place, while any state mutated per packet (e.g. the running accumulators) must be guarded by a lock.
+    '''
     def __init__(self):
         pass
 
     def process_data(self, data_pkt, **kwargs):
         raise NotImplementedError()
 
+    @property
+    def IsAccumulator(self):
+        '''
+        Accumulator stages (e.g. reductions across repetitions) fold every data packet into a running state (via accumulate_data)
+        instead of returning a processed data packet. The final data packet is emitted via finalise_data once all data packets have
+        been pushed. The remaining stages in the main pipeline are then run on this final data packet.
+        '''
+        return False
+
+    def accumulate_data(self, data_pkt):
+        raise NotImplementedError()
+
+    def finalise_data(self):
+        raise NotImplementedError()
+
     def _get_current_config(self):
         raise NotImplementedError()
 
+    @staticmethod
+    def promote_raw(data):
+        '''
+        Returns integer data arrays (e.g. raw int16/uint16 ADC samples handed over as views of the readout buffers) converted to float64
+        so that arithmetic on them neither wraps around nor overflows. Other arrays are returned as they are.
+        '''
+        if isinstance(data, np.ndarray) and data.dtype.kind in 'iu':
+            return data.astype(np.float64)
+        return data
+
 from sqdtoolz.HAL.Processors.CPU.CPU_AmpPhs import*
 from sqdtoolz.HAL.Processors.CPU.CPU_DDC import*
 from sqdtoolz.HAL.Processors.CPU.CPU_FIR import*
@@ -21,6 +52,7 @@ from sqdtoolz.HAL.Processors.CPU.CPU_Max import*
 from sqdtoolz.HAL.Processors.CPU.CPU_Mean import*
 from sqdtoolz.HAL.Processors.CPU.CPU_Variance import*
 from sqdtoolz.HAL.Processors.CPU.CPU_MeanVariance import*
+from sqdtoolz.HAL.Processors.CPU.CPU_RunningStats import*
 from sqdtoolz.HAL.Processors.CPU.CPU_Duplicate import*
 from sqdtoolz.HAL.Processors.CPU.CPU_Slice import*
 from sqdtoolz.HAL.Processors.CPU.CPU_Rename import*
@@ -28,23 +60,29 @@ from sqdtoolz.HAL.Processors.CPU.CPU_ChannelArithmetic import*
 from sqdtoolz.HAL.Processors.CPU.CPU_ConstantArithmetic import*
 from sqdtoolz.HAL.Processors.CPU.CPU_MeanBlock import*
 from sqdtoolz.HAL.Processors.CPU.CPU_kMeans import*
+from sqdtoolz.HAL.Processors.CPU.CPU_SVM import*
 from sqdtoolz.HAL.Processors.CPU.CPU_Decimation import*
+from sqdtoolz.HAL.Processors.CPU.CPU_DDCFIRDecimate import*
 
 from sqdtoolz.HAL.Processors.CPU.CPU_FFT import*
 from sqdtoolz.HAL.Processors.CPU.CPU_ESD import*
+from sqdtoolz.HAL.Processors.CPU.CPU_PSD import*
 
 
 class ProcessorCPU(DataProcessor):
-    def __init__(self, proc_name, lab, pipeline_main = [], pipeline_end = []):
+    def __init__(self, proc_name, lab, pipeline_main = [], pipeline_end = [], num_workers = 0):
         super().__init__(proc_name, lab)
-        self.tp_CPU = ThreadPool(processes=1)
-        self.cur_async_handle = None
-
         self.pipeline = pipeline_main
         self.pipeline_end = pipeline_end
         self.cur_data_queue = queue.Queue()
         self.cur_data_processed = []
 
+        self._reset_accumulation()
+
+        self.tp_CPU = None
+        self.cur_async_handles = []
+        self.NumWorkers = num_workers
+
     @classmethod
     def fromConfigDict(cls, config_dict, lab):
         pipeline_main = []
@@ -61,66 +99,178 @@ class ProcessorCPU(DataProcessor):
             cur_proc_type = globals()[cur_proc_type]
             new_proc = cur_proc_type.fromConfigDict(cur_proc)
             pipeline_end.append(new_proc)
-        return cls(config_dict['Name'], lab, pipeline_main, pipeline_end)
+        return cls(config_dict['Name'], lab, pipeline_main, pipeline_end, config_dict.get('NumWorkers', 0))
+
+    @property
+    def NumWorkers(self):
+        '''
+        Number of worker threads used to stream the data packets through the main pipeline as they are pushed. If zero, the main
+        pipeline is run serially on all data packets when calling get_all_data.
+        The pipeline stages must then be thread-safe as described in ProcNodeCPU.
+        '''
+        return self._num_workers
+    @NumWorkers.setter
+    def NumWorkers(self, num_workers):
+        assert isinstance(num_workers, (int, np.integer)) and num_workers >= 0, "The number of workers must be a non-negative integer."
+        #Finish any packets still being processed on the current workers
+        self._wait_for_workers()
+        if self.tp_CPU != None:
+            self.tp_CPU.close()
+            self.tp_CPU = None
+        self._num_workers = int(num_workers)
+        if self._num_workers > 0:
+            self.tp_CPU = ThreadPool(processes=self._num_workers)
+
+    def set_expected_repetitions(self, num_reps):
+        self._expected_reps = num_reps
 
     def push_data(self, data_pkt):
-        self.cur_data_queue.put(data_pkt)
-        #Start a new thread - otherwise, the thread will automatically check and pop the new array for processing
-        # if self.cur_async_handle == None:
-        #     self.cur_async_handle = self.tp_CPU.apply_async(self._process_all)
-        # elif self.cur_async_handle.ready():
-        #     self.cur_async_handle = self.tp_CPU.apply_async(self._process_all)
-        # self._process_all()
+        in_reps = self._get_num_reps(data_pkt)
+        if self._num_workers > 0:
+            #Start processing the packet on the workers immediately - the handles are kept in the pushed order to preserve the packet order
+            self.cur_async_handles.append((in_reps, self.tp_CPU.apply_async(self._process_pkt, (data_pkt,))))
+            #Collate the packets that have already been processed so that they are not held in memory
+            while len(self.cur_async_handles) > 0 and self.cur_async_handles[0][1].ready():
+                cur_reps, cur_handle = self.cur_async_handles.pop(0)
+                self._store_processed(cur_reps, cur_handle.get())
+        else:
+            self.cur_data_queue.put((in_reps, data_pkt))
 
     def get_all_data(self):
-        #Wait until ready
-        # while not self.ready():
-        #     continue
-        #Empty the queue just in case...
+        #Wait for the tail of the streamed packets and empty the queue just in case...
+        self._wait_for_workers()
         self._process_all()
 
-        if len(self.cur_data_processed) == 0:
-            return None
-
-        #Concatenate the individual data packets
-        ret_data = self.cur_data_processed[0]
-        #Loop through each channel
-        for cur_ch in ret_data['data'].keys():
-            #For each channel, take the associated data array from each cached processed data
-            dataarrays = [cur_data['data'][cur_ch] for cur_data in self.cur_data_processed]
-            #Concatenate the data arrays while checking if the result is a singleton...
-            if type(dataarrays[0]) is np.ndarray:
-                ret_data['data'][cur_ch] = np.concatenate( dataarrays )
-            else:
-                assert len(dataarrays) == 1, "There is some operation (e.g. average across all repetitions) that produces a singleton. Processing is pipelined and not global. Ensure that such operations are added using add_stage_end instead of add_stage."
-                #Should only arrive here if it happens to be one repetition for example (i.e. on passing through all packets, it is still a single singleton)
-                ret_data['data'][cur_ch] = dataarrays[0]
+        #Gather the collated packets (the preallocated arrays hold the first packets, while any remaining packets are listed after)
+        if self._acc_pkt != None:
+            if self._acc_data != None:
+                self._acc_pkt['data'] = {x : (self._acc_data[x] if self._acc_ind == self._acc_total else self._acc_data[x][:self._acc_ind]) for x in self._acc_data}
+            self.cur_data_processed.insert(0, self._acc_pkt)
+        self._reset_accumulation()
+
+        acc_stage_ind = next((m for m, x in enumerate(self.pipeline) if x.IsAccumulator), -1)
+        if acc_stage_ind >= 0:
+            #The data packets were folded into the accumulator stage - so run the remaining stages on its final data packet
+            ret_data = self.pipeline[acc_stage_ind].finalise_data()
+            if ret_data == None:
+                return None
+            for cur_proc in self.pipeline[acc_stage_ind+1:]:
+                if cur_proc.IsAccumulator:
+                    cur_proc.accumulate_data(ret_data)
+                    ret_data = cur_proc.finalise_data()
+                else:
+                    ret_data = cur_proc.process_data(ret_data)
+        else:
+            if len(self.cur_data_processed) == 0:
+                return None
+
+            #Concatenate the individual data packets
+            ret_data = self.cur_data_processed[0]
+            #Loop through each channel
+            for cur_ch in ret_data['data'].keys():
+                #For each channel, take the associated data array from each cached processed data
+                dataarrays = [cur_data['data'][cur_ch] for cur_data in self.cur_data_processed]
+                #Concatenate the data arrays while checking if the result is a singleton...
+                if len(dataarrays) == 1:
+                    ret_data['data'][cur_ch] = dataarrays[0]
+                elif type(dataarrays[0]) is np.ndarray:
+                    ret_data['data'][cur_ch] = np.concatenate( dataarrays )
+                else:
+                    assert False, "There is some operation (e.g. average across all repetitions) that produces a singleton. Processing is pipelined and not global. Ensure that such operations are added using add_stage_end instead of add_stage."
 
         #Run the processes that are to occur on the entire collated dataset
         for cur_proc in self.pipeline_end:
             ret_data = cur_proc.process_data(ret_data, end_stage=True)
 
-        if len(self.cur_data_processed) > 1:
-            for cur_arr in self.cur_data_processed[1:]:
-                del cur_arr
         self.cur_data_processed = []
 
         return ret_data
 
     def ready(self):
-        if self.cur_async_handle == None:
-            return True
-        return self.cur_async_handle.ready()
+        return all(x[1].ready() for x in self.cur_async_handles)
+
+    def _get_num_reps(self, data_pkt):
+        if len(data_pkt['parameters']) > 0 and data_pkt['parameters'][0] == 'repetition':
+            cur_arr = next(iter(data_pkt['data'].values()))
+            if isinstance(cur_arr, np.ndarray) and cur_arr.ndim > 0:
+                return cur_arr.shape[0]
+        return None
+
+    def _reset_accumulation(self):
+        self._expected_reps = None
+        self._acc_pkt = None
+        self._acc_data = None
+        self._acc_ind = 0
+        self._acc_total = 0
+
+    def _store_processed(self, in_reps, data_pkt):
+        #Collates the processed packets - writing them directly into preallocated arrays (one per channel) when the total number of
+        #repetitions is known (see set_expected_repetitions). Otherwise, the packets are listed and concatenated in get_all_data.
+        if data_pkt == None:
+            return  #The packet was folded into an accumulator stage
+        if len(self.cur_data_processed) > 0:
+            self.cur_data_processed.append(data_pkt)
+            return
+        if self._acc_pkt == None:
+            #Hold onto the first packet - so that no copies are made if it happens to be the only packet
+            self._acc_pkt = data_pkt
+            self._acc_in_reps = in_reps
+            return
+        if self._acc_data == None and not self._init_preallocation():
+            self.cur_data_processed.append(data_pkt)
+            return
+        cur_reps = self._get_num_reps(data_pkt)
+        if cur_reps != None and self._acc_ind + cur_reps <= self._acc_total and list(data_pkt['data'].keys()) == list(self._acc_data.keys()):
+            if all(data_pkt['data'][x].shape[1:] == self._acc_data[x].shape[1:] and data_pkt['data'][x].dtype == self._acc_data[x].dtype for x in self._acc_data):
+                for cur_ch in self._acc_data:
+                    self._acc_data[cur_ch][self._acc_ind:self._acc_ind+cur_reps] = data_pkt['data'][cur_ch]
+                self._acc_ind += cur_reps
+                return
+        #The packet does not fit into the preallocated arrays - so list the already collated data and continue by concatenation
+        self._acc_pkt['data'] = {x : self._acc_data[x][:self._acc_ind] for x in self._acc_data}
+        self.cur_data_processed = [self._acc_pkt, data_pkt]
+        self._acc_pkt = None
+        self._acc_data = None
+
+    def _init_preallocation(self):
+        #The total number of processed repetitions is inferred from the ratio of output to input repetitions in the first packet
+        if self._expected_reps == None or self._acc_in_reps == None or self._acc_in_reps == 0:
+            return False
+        out_reps = self._get_num_reps(self._acc_pkt)
+        if out_reps == None or (out_reps * self._expected_reps) % self._acc_in_reps != 0:
+            return False
+        for cur_arr in self._acc_pkt['data'].values():
+            if not isinstance(cur_arr, np.ndarray) or cur_arr.ndim != len(self._acc_pkt['parameters']) or cur_arr.shape[0] != out_reps:
+                return False
+        self._acc_total = (out_reps * self._expected_reps) // self._acc_in_reps
+        self._acc_data = {}
+        for cur_ch, cur_arr in self._acc_pkt['data'].items():
+            self._acc_data[cur_ch] = np.empty((self._acc_total,) + cur_arr.shape[1:], dtype=cur_arr.dtype)
+            self._acc_data[cur_ch][:out_reps] = cur_arr
+        self._acc_ind = out_reps
+        self._acc_pkt['data'] = {}
+        return True
+
+    def _wait_for_workers(self):
+        #Collect the streamed packets in the order that they were pushed (any errors raised in the workers are raised here)
+        cur_handles = self.cur_async_handles
+        self.cur_async_handles = []
+        for cur_reps, cur_handle in cur_handles:
+            self._store_processed(cur_reps, cur_handle.get())
+
+    def _process_pkt(self, cur_data):
+        #Run the processes
+        for cur_proc in self.pipeline:
+            if cur_proc.IsAccumulator:
+                cur_proc.accumulate_data(cur_data)
+                return None
+            cur_data = cur_proc.process_data(cur_data)
+        return cur_data
 
     def _process_all(self):
         while not self.cur_data_queue.empty():
-            cur_data = self.cur_data_queue.get()
-            
-            #Run the processes
-            for cur_proc in self.pipeline:
-                cur_data = cur_proc.process_data(cur_data)
-            
-            self.cur_data_processed.append(cur_data)
+            cur_reps, cur_data = self.cur_data_queue.get()
+            self._store_processed(cur_reps, self._process_pkt(cur_data))
 
 
     def reset_pipeline(self):
@@ -138,6 +288,7 @@ class ProcessorCPU(DataProcessor):
     def __str__(self):
         cur_str = f"Name: {self.Name}\n"
         cur_str += f"Type: {self.__class__.__name__}\n"
+        cur_str += f"Worker Threads: {self.NumWorkers}\n"
         cur_str += f"Main Pipeline:\n"
         for cur_pipe in self.pipeline:
             cur_data = cur_pipe._get_current_config()
@@ -155,7 +306,8 @@ class ProcessorCPU(DataProcessor):
             'Name' : self.Name,
             'Type'  : self.__class__.__name__,
             'Pipeline' : [x._get_current_config() for x in self.pipeline],
-            'PipelineEnd' : [x._get_current_config() for x in self.pipeline_end]
+            'PipelineEnd' : [x._get_current_config() for x in self.pipeline_end],
+            'NumWorkers' : self.NumWorkers
         }
 
     def _set_current_config(self, dict_config, lab):
@@ -174,3 +326,4 @@ class ProcessorCPU(DataProcessor):
             cur_proc_type = globals()[cur_proc_type]
             new_proc = cur_proc_type.fromConfigDict(cur_proc)
             self.pipeline_end.append(new_proc)
+        self.NumWorkers = dict_config.get('NumWorkers', 0)
@@ -126,6 +126,10 @@ class SOFTpid(HALbase):
             self._tempsMeas = []
             self.last_time = time.time()
 
+    def _get_state_version(self):
+        #The control loop must be run on every activation
+        return None
+
     def activate(self):
         assert self._data_file != None, "Check the Experiment class or its derived class. It should run init_instruments to initialise the Software PID controller."
 
@@ -37,6 +37,12 @@ class WaveformSegmentBase(LockableProperties):
     def get_WFMT(self):
         return self._transform_func
 
+    def _get_WFMT_args(self):
+        #Returns all WFMT arguments used when rendering this segment (including those of any child segments)
+        if self._transform_func:
+            return [self._transform_func]
+        return []
+
     def reset_waveform_transforms(self, lab):
         if self._transform_func:
             return lab.WFMT(self._transform_func.wfmt_name).initialise_for_new_waveform()
@@ -262,6 +268,12 @@ class WFS_Group(WaveformSegmentBase):
         
         return final_wfm
 
+    def _get_WFMT_args(self):
+        ret_list = WaveformSegmentBase._get_WFMT_args(self)
+        for cur_wfm_seg in self._wfm_segs:
+            ret_list += cur_wfm_seg._get_WFMT_args()
+        return ret_list
+
     def _get_current_config(self):
         cur_dict = WaveformSegmentBase._get_current_config(self)
         cur_dict['Duration'] = self._abs_time
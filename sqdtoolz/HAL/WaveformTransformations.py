@@ -1,4 +1,5 @@
 import numpy as np
+import collections
 from sqdtoolz.HAL.LockableProperties import LockableProperties
 class WaveformTransformationArgs:
     def __init__(self, wfmt_name, kwargs):
@@ -70,6 +71,16 @@ class WaveformTransformation(LockableProperties):
     def modify_waveform(self, wfm_pts, fs, t0_ind, ch_index, **kwargs):
         raise NotImplementedError()
 
+    def _get_waveform_state(self):
+        '''
+        Returns the (hashable) internal state carried across segments while assembling a waveform. The default of None implies that the
+        state is unknown and thus, segments using this WFMT are never cached when assembling waveforms.
+        '''
+        return None
+
+    def _set_waveform_state(self, state):
+        pass
+
     def __str__(self):
         cur_dict = self._get_current_config()
         cur_str = ""
@@ -87,8 +98,14 @@ class WaveformTransformation(LockableProperties):
         raise NotImplementedError()
 
 class WFMT_ModulationIQ(WaveformTransformation):
+    #Maximum total size (in bytes) of the complex carrier tables held in the carrier cache
+    CARRIER_CACHE_MAX_BYTES = 16*1024*1024
+
     def __init__(self, name, lab, iq_frequency, **kwargs):
         super().__init__(name)
+        #Cache of the complex carriers exp(2j*pi*f*t) keyed by (fs, frequency, length) - shared by the I and Q channels and across phases
+        self._carrier_tables = collections.OrderedDict()
+        self._carrier_tables_bytes = 0
         if lab._register_WFMT(self):
             self._iq_frequency = iq_frequency
             self._iq_amplitude = kwargs.get('iq_amplitude', 1.0)   #Given as the raw output voltage (should usually set the envelopes to unity amplitude in this case)
@@ -164,6 +181,12 @@ class WFMT_ModulationIQ(WaveformTransformation):
     def initialise_for_new_waveform(self):
         self._cur_t0 = 0.0
 
+    def _get_waveform_state(self):
+        return (self._cur_t0,)
+
+    def _set_waveform_state(self, state):
+        self._cur_t0 = state[0]
+
     def modify_waveform(self, wfm_pts, fs, t0_ind, ch_index, **kwargs):
         t0 = t0_ind / fs
 
@@ -184,13 +207,36 @@ class WFMT_ModulationIQ(WaveformTransformation):
             else:
                 cur_t_off = -kwargs.get('phase_segment') / (2*np.pi*self.IQFrequency)
 
-        t_vals = np.arange(wfm_pts.size) / fs + t0 - self._cur_t0 - cur_t_off
+        assert ch_index == 0 or ch_index == 1, "Channel Index must be 0 or 1 for I or Q respectively."
+        cur_carrier = self._get_carrier(wfm_pts.size, fs, t0 - self._cur_t0 - cur_t_off, ch_index)
         if ch_index == 0:   #I-Channel
-            return wfm_pts * self.IQAmplitude * np.cos(2 * np.pi * self.IQFrequency * t_vals) + self.IQdcOffset[0]
-        elif ch_index == 1: #Q-Channel
-            return wfm_pts * self.IQAmplitude * self.IQAmplitudeFactor * np.sin(2 * np.pi * self.IQFrequency * t_vals + self.IQPhaseOffset) + self.IQdcOffset[1]
+            return wfm_pts * self.IQAmplitude * cur_carrier + self.IQdcOffset[0]
+        else:               #Q-Channel
+            return wfm_pts * self.IQAmplitude * self.IQAmplitudeFactor * cur_carrier + self.IQdcOffset[1]
+
+    def _get_carrier(self, num_pts, fs, t_offset, ch_index):
+        '''
+        Returns the I carrier cos(2*pi*f*t) (ch_index = 0) or the Q carrier sin(2*pi*f*t + IQPhaseOffset) (ch_index = 1) where
+        t = np.arange(num_pts)/fs + t_offset. The carrier is computed by rotating the cached complex carrier exp(2j*pi*f*np.arange(num_pts)/fs)
+        by the phase offsets.
+        '''
+        table_key = (fs, self.IQFrequency, num_pts)
+        if table_key in self._carrier_tables:
+            self._carrier_tables.move_to_end(table_key)
+            cur_table = self._carrier_tables[table_key]
         else:
-            assert False, "Channel Index must be 0 or 1 for I or Q respectively."
+            cur_table = np.exp(2j * np.pi * self.IQFrequency * (np.arange(num_pts) / fs))
+            if cur_table.nbytes <= self.CARRIER_CACHE_MAX_BYTES:
+                self._carrier_tables[table_key] = cur_table
+                self._carrier_tables_bytes += cur_table.nbytes
+                while self._carrier_tables_bytes > self.CARRIER_CACHE_MAX_BYTES:
+                    self._carrier_tables_bytes -= self._carrier_tables.popitem(last=False)[1].nbytes
+
+        #Apply the phase as a complex rotation: cos(x+phase) and sin(x+phase+phi) are the real and imaginary parts respectively
+        phase = 2 * np.pi * self.IQFrequency * t_offset
+        if ch_index == 0:
+            return (cur_table * np.exp(1j * phase)).real
+        return (cur_table * np.exp(1j * (phase + self.IQPhaseOffset))).imag
 
     def _get_current_config(self):
         ret_dict = {}
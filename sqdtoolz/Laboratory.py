@@ -26,6 +26,8 @@ import os
 import time
 import numpy as np
 import sys
+import threading
+import copy
 
 class customJSONencoder(json.JSONEncoder):
     def default(self, obj):
@@ -36,7 +38,164 @@ class customJSONencoder(json.JSONEncoder):
             return int(obj)
         return json.JSONEncoder.default(self, obj)
 
+class LabStateSnapshot:
+    #Minimum time (in seconds) between the snapshots requested via request_snapshot
+    MIN_INTERVAL = 1.0
+    #Number of attempts (and the delay in seconds between them) to replace a state file that is held open by another process
+    REPLACE_RETRIES = 5
+    REPLACE_RETRY_DELAY = 0.02
+
+    def __init__(self, lab):
+        '''
+        Writes the current state of the Laboratory (i.e. _last_state.txt, _last_vars.txt and _last_exp_configs.txt) into its save-directory.
+
+        The configurations of all objects are gathered on the calling thread (as they may query instruments), but only those that have
+        changed since the last snapshot are serialised again. The serialisation and the (atomic) file writes are run on a background
+        thread for the (rate-limited) snapshots requested via request_snapshot, while write_snapshot writes them immediately.
+        '''
+        self._lab = lab
+        #Cache of the JSON fragments of every object given as: (file, section, name) -> (config, JSON fragment)
+        self._fragments = {}
+        self._last_request = None
+        self._pending = None
+        self._worker = None
+        self._worker_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        #Snapshot indices to ensure that an older snapshot never overwrites a newer one
+        self._cur_index = 0
+        self._last_written = -1
+
+    def request_snapshot(self):
+        cur_time = time.time()
+        if self._last_request is not None and cur_time - self._last_request < self.MIN_INTERVAL:
+            return
+        self._last_request = cur_time
+        cur_snapshot = self._collect()
+        with self._worker_lock:
+            self._pending = cur_snapshot
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run_worker, daemon=True)
+                self._worker.start()
+
+    def write_snapshot(self):
+        self._write(self._collect())
+
+    def flush(self):
+        '''
+        Blocks until all the snapshots requested via request_snapshot have been written (or dropped on a failed write).
+        '''
+        while True:
+            with self._worker_lock:
+                cur_worker = self._worker
+            if cur_worker is None:
+                return
+            cur_worker.join()
+
+    def _run_worker(self):
+        while True:
+            with self._worker_lock:
+                cur_snapshot = self._pending
+                self._pending = None
+                if cur_snapshot is None:
+                    self._worker = None
+                    return
+            try:
+                self._write(cur_snapshot)
+            except Exception as e:
+                #Drop this snapshot, but carry on with any pending snapshots (the worker must only exit via the check above, otherwise
+                #request_snapshot would keep queuing snapshots that are never written)
+                print(f"Warning: Could not write the laboratory state snapshot: {e}")
+
+    def _collect(self):
+        #Returns the snapshot as a list of files given as (file name, [(fragment key, config, cached JSON fragment or None), ...])
+        lab = self._lab
+        ret_files = []
+        if lab.UpdateStateEnabled:
+            cur_entries = [(('_last_state.txt', 'ActiveInstruments', ''), list(lab._activated_instruments))]
+            for cur_section, cur_objs in [('HALs', lab._hal_objs), ('PROCs', lab._processors), ('WFMTs', lab._waveform_transforms), ('SPECs', lab._specifications)]:
+                cur_entries += [(('_last_state.txt', cur_section, x), cur_objs[x]._get_current_config()) for x in cur_objs]
+            ret_files.append(('_last_state.txt', cur_entries))
+            ret_files.append(('_last_vars.txt', [(('_last_vars.txt', '', x), lab._variables[x]._get_current_config()) for x in lab._variables]))
+        ret_files.append(('_last_exp_configs.txt', [(('_last_exp_configs.txt', '', x), lab._expt_configs[x].get_config()) for x in lab._expt_configs]))
+
+        self._cur_index += 1
+        ret_snapshot = []
+        for cur_file, cur_entries in ret_files:
+            cur_list = []
+            for cur_key, cur_config in cur_entries:
+                cur_cached = self._fragments.get(cur_key)
+                if cur_cached is not None and self._configs_equal(cur_cached[0], cur_config):
+                    cur_list.append((cur_key, None, cur_cached[1]))
+                else:
+                    #Copy the configuration as it is serialised later on the background thread
+                    cur_list.append((cur_key, copy.deepcopy(cur_config), None))
+            ret_snapshot.append((cur_file, cur_list))
+        return (self._cur_index, ret_snapshot)
+
+    @staticmethod
+    def _configs_equal(config1, config2):
+        try:
+            return bool(config1 == config2)
+        except (ValueError, TypeError):
+            #e.g. configurations holding numpy arrays
+            return False
+
+    def _get_fragment(self, cur_key, cur_config):
+        cur_file, cur_section, cur_name = cur_key
+        if cur_file == '_last_vars.txt':
+            #Same format as in Laboratory.save_variables
+            cur_frag = f"\"{cur_name}\" : {json.dumps(cur_config, cls=customJSONencoder)}"
+        elif cur_file == '_last_exp_configs.txt':
+            cur_frag = f"{json.dumps(cur_name)} : {json.dumps(cur_config, indent=4, cls=customJSONencoder)}"
+        else:
+            cur_frag = json.dumps(cur_config, indent=4, cls=customJSONencoder)
+        self._fragments[cur_key] = (cur_config, cur_frag)
+        return cur_frag
+
+    def _write(self, cur_snapshot):
+        cur_index, cur_files = cur_snapshot
+        with self._write_lock:
+            if cur_index < self._last_written:
+                return
+            for cur_file, cur_list in cur_files:
+                cur_frags = [(x[0], x[2] if x[2] is not None else self._get_fragment(x[0], x[1])) for x in cur_list]
+                if cur_file == '_last_state.txt':
+                    cur_text = '{\n"ActiveInstruments" : ' + cur_frags[0][1]
+                    for cur_section in ['HALs', 'PROCs', 'WFMTs', 'SPECs']:
+                        cur_text += f',\n"{cur_section}" : [\n' + ',\n'.join(x[1] for x in cur_frags if x[0][1] == cur_section) + '\n]'
+                    cur_text += '\n}\n'
+                else:
+                    cur_text = '{\n' + ',\n'.join(x[1] for x in cur_frags) + '\n}\n'
+                #Write atomically so that a cold reload never reads a partially written file
+                cur_path = self._lab._save_dir + cur_file
+                with open(cur_path + '.tmp', 'w') as outfile:
+                    outfile.write(cur_text)
+                self._replace_file(cur_path + '.tmp', cur_path, cur_text)
+            self._last_written = cur_index
+
+    def _replace_file(self, tmp_path, cur_path, cur_text):
+        #On Windows, the replacement fails while another process (e.g. the ExperimentViewer) has the file open - so retry briefly
+        for m in range(self.REPLACE_RETRIES):
+            try:
+                os.replace(tmp_path, cur_path)
+                return
+            except PermissionError:
+                time.sleep(self.REPLACE_RETRY_DELAY)
+        #Fall back onto writing the file in place (like before the atomic writes)
+        try:
+            with open(cur_path, 'w') as outfile:
+                outfile.write(cur_text)
+        except OSError as e:
+            print(f"Warning: Could not write {cur_path}: {e}")
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+
 class Laboratory:
+    #Fraction of the progress over which the weighting of the dT/dP values doubles when estimating the time left
+    ETA_WEIGHT_SCALE = 0.25
+
     def __init__(self, instr_config_file, save_dir, using_VS_Code=False):
         if instr_config_file == "":
             self._station = qc.Station()
@@ -64,6 +223,7 @@ class Laboratory:
         self._waveform_transforms = {}
         self._activated_instruments = []
         self._update_state = True
+        self._state_snapshot = LabStateSnapshot(self)
 
     @property
     def UpdateStateEnabled(self):
@@ -569,10 +729,8 @@ class Laboratory:
         return ret_str
 
     def update_state(self):
-        if self.UpdateStateEnabled:
-            self.save_laboratory_config(self._save_dir, '_last_state.txt')
-            self.save_variables(self._save_dir, '_last_vars.txt')
-        self.save_experiment_configs(self._save_dir, '_last_exp_configs.txt')   #This is just a JSON transfer...
+        #Writes _last_state.txt and _last_vars.txt (if UpdateStateEnabled) and _last_exp_configs.txt immediately
+        self._state_snapshot.write_snapshot()
     def open_browser(self):
         cur_dir = os.path.dirname(os.path.realpath(__file__)).replace('\\','/')
         drive = cur_dir[0:2]
@@ -608,32 +766,23 @@ class Laboratory:
     def _update_progress_bar(self, val_pct=0, reset=False):
         if reset:
             self._time_stamp_begin = time.time()
-            self._time_stamps = [(0,0),]
+            #Running state of the time-estimate given as: last percentage, last time-stamp, sum of weights and sum of weighted dT/dP
+            self._eta_state = [0, self._time_stamp_begin, 0.0, 0.0]
             self._prog_bar_str = ''
             return
 
-        self._time_stamps += [(val_pct, time.time())]
-
-        ts = np.array([x[1] for x in self._time_stamps])
-        pcts = np.array([x[0] for x in self._time_stamps])
-        
-        dTs = ts - self._time_stamp_begin
-        dTs[0] = 0
-        dTs = dTs[1:]-dTs[:-1]
-        #
-        dPcts = pcts[1:]-pcts[:-1]
-        #
-        dTbydPs = dTs/dPcts
-
-        #Take an exponential distribution of the dT/dP (i.e. recent ones have a higher weighting) when taking the average: <dT/dP>
-        self._time_stamps[-1][0]
-        init_weight = 0.5
-        
-        if val_pct > 0:
-            total_weight = np.sum(0.5*np.exp(-pcts[1:] * np.log(init_weight)/val_pct))
-            average_weight = np.sum(dTbydPs * 0.5*np.exp(-pcts[1:] * np.log(init_weight)/val_pct) / total_weight)
-            #
-            time_left = average_weight*(1-val_pct)
+        cur_time = time.time()
+        #Take an exponentially weighted average of the dT/dP (i.e. recent ones have a higher weighting) when taking the average: <dT/dP>
+        #Here, the weight doubles every ETA_WEIGHT_SCALE of the progress so that the running sums are updated in O(1) time per ping.
+        last_pct, last_time, sum_weights, sum_weighted = self._eta_state
+        if val_pct > last_pct:
+            cur_weight = 2.0**(val_pct / self.ETA_WEIGHT_SCALE)
+            sum_weights += cur_weight
+            sum_weighted += cur_weight * (cur_time - last_time) / (val_pct - last_pct)
+            self._eta_state = [val_pct, cur_time, sum_weights, sum_weighted]
+
+        if val_pct > 0 and sum_weights > 0:
+            time_left = sum_weighted / sum_weights * (1-val_pct)
             if time_left > 60:
                 time_left = f"Est. time left: {(time_left/60.0):.2f}mins"
             else:
@@ -641,7 +790,7 @@ class Laboratory:
         else:
             time_left = ""
 
-        total_time = ts[-1] - self._time_stamp_begin
+        total_time = cur_time - self._time_stamp_begin
         if total_time > 60:
             total_time = f"Total time: {(total_time/60.0):.2f}mins"
         else:
@@ -654,5 +803,6 @@ class Laboratory:
 
         self._prog_bar_str = self._printProgressBar(int(val_pct*100), 100, suffix=f"{total_time}, {time_left}", prev_str=self._prog_bar_str, printEnd = prog_bar_char, using_vs_code=self._using_VS_Code)
 
-        #Use the progress-bar ping as an opportunity to dump the current state of the instruments if update is enabled...
-        self.update_state()
+        #Use the progress-bar ping as an opportunity to dump the current state of the instruments if update is enabled (rate-limited and
+        #written on a background thread)...
+        self._state_snapshot.request_snapshot()
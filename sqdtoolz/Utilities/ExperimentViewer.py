@@ -6,6 +6,8 @@ from tkinter import ttk
 import os
 import json
 import sys
+import copy
+import time
 
 from numpy import isin
 from sqdtoolz.Utilities.Miscellaneous import Miscellaneous
@@ -323,11 +325,19 @@ class ExperimentViewer:
             for ind, cur_list in enumerate(cur_list):
                 self.entries[ind].set_list(cur_list)
     
-    def __init__(self, path):
+    #Interval (in seconds) at which the state files are checked for changes
+    POLL_INTERVAL = 0.2
+    #Maximum number of dashboard refreshes per second
+    MAX_REFRESH_RATE = 2.0
+
+    def __init__(self, path, poll_interval=POLL_INTERVAL, max_refresh_rate=MAX_REFRESH_RATE):
         self.root = tk.Tk()
         self.root.wm_title("SQDToolz experiment visualisation tool")
 
         self._path = path
+        self._poll_interval = poll_interval
+        assert max_refresh_rate > 0, "The maximum refresh rate must be positive."
+        self._min_refresh_interval = 1.0 / max_refresh_rate
 
         tabControl = ttk.Notebook(self.root)        
         self.tab_dashboard = ttk.Frame(tabControl)
@@ -517,200 +527,221 @@ class ExperimentViewer:
                     continue
                 self.trvw_expts.insert(tree_folder_date, "end", text=cur_data_folder, tags=[cur_path_data])
 
-        cur_exp_params = []
-        while True:
-            try:
-                self.root.update()
-            except:
-                #Application destroyed...
-                return
-    
-            #Reset Kill-Switch if applicable
-            if os.path.exists(self._path + 'HALT.txt'):
-                self.btn_kill['text'] = 'Kill Experiment (Signal Sent)'
-            else:
-                self.btn_kill['text'] = 'Kill Experiment'
-
-            #Read JSON file for latest configuration...
-            file_state = self._path + "_last_state.txt"
-            if not os.path.isfile(file_state):
-                continue
-            try:    #Needs try-catch as the file may be written to while being read - abort/ignore if it's being updated...
-                with open(file_state) as json_file:
-                    data = json.load(json_file)
-            except:
-                continue
-
-            file_exp_params = self._path + "_cur_exp.json"
-            if os.path.isfile(file_exp_params):
-                try:    #Needs try-catch as the file may be written to while being read - abort/ignore if it's being updated...
-                    with open(file_exp_params) as json_file:
-                        exp_param_data = json.load(json_file)
-                    cur_exp_params = f"Configuration: {exp_param_data['Configuration']}\n"
-                    cur_exp_params += "Specifications:"
-                    if len(exp_param_data['SPECs']) > 0:
-                        cur_exp_params += "\n"
-                        for cur_spec in exp_param_data['SPECs']:
-                            cur_exp_params += f"   {cur_spec}\n"
-                    cur_exp_params = [(cur_exp_params[:-1], 'white')]
-                except:
-                    pass
-            else:
-                cur_exp_params = [('Idle', 'white')]
-
-            #Process the HALs...
-            cur_ddgs = []
-            cur_acqs = []
-            cur_mws = []
-            cur_sws = []
-            cur_volts = []
-            cur_attens = []
-            cur_wfms = []
-            for cur_hal in data['HALs']:
-                cur_str = ""
-                cur_list = []
-                for cur_key in cur_hal:
-                    if isinstance(cur_hal[cur_key], str) or isinstance(cur_hal[cur_key], float) or isinstance(cur_hal[cur_key], int) or isinstance(cur_hal[cur_key], bool):
-                        cur_str += f"{cur_key}: {Miscellaneous.get_units(cur_hal[cur_key])}\n"
-                    elif cur_key == "WaveformSegments": #Custom processing for AWG waveforms...
-                        # cur_str += "Segments:\n"
-                        for cur_seg in cur_hal[cur_key]:
-                            if "Value" in cur_seg:
-                                ampl_val = Miscellaneous.get_units(cur_seg["Value"])
-                            elif "Amplitude" in cur_seg:
-                                ampl_val = Miscellaneous.get_units(cur_seg["Amplitude"])
+        self._file_cache = {}
+        self._cur_exp_params = [('Idle', 'white')]
+        self._pending_state = True
+        self._pending_vars = True
+        self._last_refresh = 0.0
+        self.root.after(0, self._poll_files)
+        self.root.mainloop()
+
+    def _read_json_if_changed(self, file_name):
+        '''
+        Returns (changed, data) for the given JSON file in the save-directory - only parsing it if its modification time or size has changed
+        since the last read. The data is None if the file does not exist (or has never been read successfully).
+        '''
+        cur_path = self._path + file_name
+        prev_stamp, prev_data = self._file_cache.get(file_name, (None, None))
+        try:
+            cur_stat = os.stat(cur_path)
+        except OSError:
+            self._file_cache[file_name] = (None, None)
+            return prev_stamp != None, None
+        cur_stamp = (cur_stat.st_mtime_ns, cur_stat.st_size)
+        if cur_stamp == prev_stamp:
+            return False, prev_data
+        try:    #Needs try-catch as the file may be written to while being read - abort/ignore if it's being updated (it is reread on the next poll)...
+            with open(cur_path) as json_file:
+                cur_data = json.load(json_file)
+        except:
+            return False, prev_data
+        self._file_cache[file_name] = (cur_stamp, cur_data)
+        return True, cur_data
+
+    def _poll_files(self):
+        #Reset Kill-Switch if applicable
+        if os.path.exists(self._path + 'HALT.txt'):
+            kill_text = 'Kill Experiment (Signal Sent)'
+        else:
+            kill_text = 'Kill Experiment'
+        if self.btn_kill['text'] != kill_text:
+            self.btn_kill['text'] = kill_text
+
+        #Only the files that have changed are parsed (the data is cached) while the dashboard refreshes are rate-limited
+        changed_state, data_state = self._read_json_if_changed("_last_state.txt")
+        changed_exp, exp_param_data = self._read_json_if_changed("_cur_exp.json")
+        changed_vars, data_vars = self._read_json_if_changed("_last_vars.txt")
+        self._pending_state |= changed_state or changed_exp
+        self._pending_vars |= changed_vars
+
+        if time.monotonic() - self._last_refresh >= self._min_refresh_interval:
+            if self._pending_state and data_state != None:
+                if exp_param_data != None:
+                    try:
+                        cur_exp_params = f"Configuration: {exp_param_data['Configuration']}\n"
+                        cur_exp_params += "Specifications:"
+                        if len(exp_param_data['SPECs']) > 0:
+                            cur_exp_params += "\n"
+                            for cur_spec in exp_param_data['SPECs']:
+                                cur_exp_params += f"   {cur_spec}\n"
+                        self._cur_exp_params = [(cur_exp_params[:-1], 'white')]
+                    except:
+                        pass
+                elif not os.path.isfile(self._path + "_cur_exp.json"):
+                    self._cur_exp_params = [('Idle', 'white')]
+                self._update_state_dashboard(copy.deepcopy(data_state), self._cur_exp_params)
+                self._pending_state = False
+                self._last_refresh = time.monotonic()
+            if self._pending_vars and data_vars != None:
+                self._update_vars_dashboard(data_vars)
+                self._pending_vars = False
+                self._last_refresh = time.monotonic()
+
+        self.dash_SPECs.column("#0", width=self.frame_dash_left.winfo_width(), minwidth=0, stretch=tk.NO)
+        self.trvw_expts.column("#0", width=self.expts_frame_left.winfo_width(), minwidth=0, stretch=tk.NO)
+        self.root.after(int(self._poll_interval*1000), self._poll_files)
+
+    def _update_state_dashboard(self, data, cur_exp_params):
+        #Process the HALs...
+        cur_ddgs = []
+        cur_acqs = []
+        cur_mws = []
+        cur_sws = []
+        cur_volts = []
+        cur_attens = []
+        cur_wfms = []
+        for cur_hal in data['HALs']:
+            cur_str = ""
+            cur_list = []
+            for cur_key in cur_hal:
+                if isinstance(cur_hal[cur_key], str) or isinstance(cur_hal[cur_key], float) or isinstance(cur_hal[cur_key], int) or isinstance(cur_hal[cur_key], bool):
+                    cur_str += f"{cur_key}: {Miscellaneous.get_units(cur_hal[cur_key])}\n"
+                elif cur_key == "WaveformSegments": #Custom processing for AWG waveforms...
+                    # cur_str += "Segments:\n"
+                    for cur_seg in cur_hal[cur_key]:
+                        if "Value" in cur_seg:
+                            ampl_val = Miscellaneous.get_units(cur_seg["Value"])
+                        elif "Amplitude" in cur_seg:
+                            ampl_val = Miscellaneous.get_units(cur_seg["Amplitude"])
+                        else:
+                            ampl_val = ""
+                        #Trim the WFS_ in the Type...
+                        cur_list.append((f'\t{cur_seg["Name"]}, [{cur_seg["Type"][4:]}], {Miscellaneous.get_units(cur_seg["Duration"])}s, {ampl_val}\n', 'white'))
+                elif cur_key == "triggers": #Custom processing for DDG pulses...
+                    for cur_output in cur_hal[cur_key]:
+                        cur_dict = cur_hal[cur_key][cur_output]
+                        cur_strTrig = cur_output + ": "
+                        if "TrigPulseLength" in cur_dict:
+                            cur_strTrig += Miscellaneous.get_units(cur_dict["TrigPulseLength"]) + "s,"
+                        if "TrigPulseDelay" in cur_dict:
+                            if float(cur_dict["TrigPulseDelay"]) > 0:
+                                cur_strTrig += Miscellaneous.get_units(cur_dict["TrigPulseDelay"]) + "s dly,"
+                        col='white'
+                        if "TrigEnable" in cur_dict:
+                            if cur_dict["TrigEnable"]:
+                                col = '#80ff80'
+                            else:
+                                col = '#ffafaf'
+                        if "TrigPolarity" in cur_dict:
+                            if float(cur_dict["TrigPolarity"]) == 1:
+                                cur_strTrig += "POS"
                             else:
-                                ampl_val = ""
-                            #Trim the WFS_ in the Type...
-                            cur_list.append((f'\t{cur_seg["Name"]}, [{cur_seg["Type"][4:]}], {Miscellaneous.get_units(cur_seg["Duration"])}s, {ampl_val}\n', 'white'))
-                    elif cur_key == "triggers": #Custom processing for DDG pulses...
-                        for cur_output in cur_hal[cur_key]:
-                            cur_dict = cur_hal[cur_key][cur_output]
-                            cur_strTrig = cur_output + ": "
-                            if "TrigPulseLength" in cur_dict:
-                                cur_strTrig += Miscellaneous.get_units(cur_dict["TrigPulseLength"]) + "s,"
-                            if "TrigPulseDelay" in cur_dict:
-                                if float(cur_dict["TrigPulseDelay"]) > 0:
-                                    cur_strTrig += Miscellaneous.get_units(cur_dict["TrigPulseDelay"]) + "s dly,"
-                            col='white'
-                            if "TrigEnable" in cur_dict:
-                                if cur_dict["TrigEnable"]:
-                                    col = '#80ff80'
-                                else:
-                                    col = '#ffafaf'
-                            if "TrigPolarity" in cur_dict:
-                                if float(cur_dict["TrigPolarity"]) == 1:
-                                    cur_strTrig += "POS"
-                                else:
-                                    cur_strTrig += "NEG"
-                            cur_list.append((cur_strTrig,col))
+                                cur_strTrig += "NEG"
+                        cur_list.append((cur_strTrig,col))
                 
-                #Get state-colours based on the Output key...
-                cur_on_key = ''
-                if 'Output' in cur_hal:
-                    cur_on_key = 'Output'
-                elif 'output' in cur_hal:
-                    cur_on_key = 'output'
-                if cur_on_key != '':
-                    if cur_hal[cur_on_key] == True or cur_hal[cur_on_key] == 'ON':
-                        col = '#80ff80'
-                    else:
-                        col = '#ffafaf'
+            #Get state-colours based on the Output key...
+            cur_on_key = ''
+            if 'Output' in cur_hal:
+                cur_on_key = 'Output'
+            elif 'output' in cur_hal:
+                cur_on_key = 'output'
+            if cur_on_key != '':
+                if cur_hal[cur_on_key] == True or cur_hal[cur_on_key] == 'ON':
+                    col = '#80ff80'
                 else:
-                    col = 'white'
-
-                if cur_hal['Type'] == 'DDG':
-                    cur_ddgs += [(cur_str[:-1], col, cur_list)]    #:-1 is to remove the last \n
-                if cur_hal['Type'] == 'ACQ':
-                    cur_acqs += [(cur_str[:-1], col, cur_list)]    #:-1 is to remove the last \n
-                if cur_hal['Type'] == 'GENmwSource':
-                    cur_mws += [(cur_str[:-1], col)]    #:-1 is to remove the last \n
-                if cur_hal['Type'] == 'GENswitch':
-                    cur_sws += [(cur_str[:-1], col)]    #:-1 is to remove the last \n
-                if cur_hal['Type'] == 'GENswitchTrig':
-                    cur_sws += [(cur_str[:-1], col)]    #:-1 is to remove the last \n
-                if cur_hal['Type'] == 'GENvoltSource':
-                    cur_volts += [(cur_str[:-1], col)]    #:-1 is to remove the last \n
-                if cur_hal['Type'] == 'GENatten':
-                    cur_attens += [(cur_str[:-1], col)]    #:-1 is to remove the last \n
-                if cur_hal['Type'] == 'WaveformAWG':
-                    cur_wfms += [(cur_str[:-1], col, cur_list)]    #:-1 is to remove the last \n
-
-            cur_procs = []
-            for cur_proc in data['PROCs']:
-                cur_str = ""
-                cur_list = []
-                for cur_key in cur_proc:
-                    if isinstance(cur_proc[cur_key], str):
-                        cur_str += f"{cur_key}: {Miscellaneous.get_units(cur_proc[cur_key])}\n"
-                    elif isinstance(cur_proc[cur_key], list):
-                        cur_list.append((cur_key + ":", 'white'))
-                        for cur_pipe in cur_proc[cur_key]:
-                            #Basically it'll show the type and the parameter values... Taking name out first as the module could randomly place Type somewhere else...
-                            leName = cur_pipe.pop('Type')
-                            cur_list.append(("   " + leName + ", " + self._whittle_dict(cur_pipe), 'white'))
-                cur_procs += [(cur_str[:-1], 'white', cur_list)]
-
-            cur_wfmts = []
-            for cur_wfmt in data['WFMTs']:
-                cur_str = ""
-                for cur_key in cur_wfmt:
-                    if isinstance(cur_wfmt[cur_key], str) or isinstance(cur_wfmt[cur_key], float) or isinstance(cur_wfmt[cur_key], int) or isinstance(cur_wfmt[cur_key], bool):
-                        cur_str += f"{cur_key}: {Miscellaneous.get_units(cur_wfmt[cur_key])}\n"
+                    col = '#ffafaf'
+            else:
                 col = 'white'
-                cur_wfmts += [(cur_str[:-1], col)]
 
-            cur_elems_in_view = {self.dash_SPECs.item(child)['text'] : child for child in self.dash_SPECs.get_children()}
-            self.dash_SPECs.column("#0", width=self.frame_dash_left.winfo_width(), minwidth=0, stretch=tk.NO)
-            for cur_spec in data['SPECs']:
-                if cur_spec['Name'] in cur_elems_in_view:
-                    tree_cur_spec = cur_elems_in_view[cur_spec['Name']]
-                else:
-                    tree_cur_spec = self.dash_SPECs.insert("", "end", text=cur_spec['Name'])
+            if cur_hal['Type'] == 'DDG':
+                cur_ddgs += [(cur_str[:-1], col, cur_list)]    #:-1 is to remove the last \n
+            if cur_hal['Type'] == 'ACQ':
+                cur_acqs += [(cur_str[:-1], col, cur_list)]    #:-1 is to remove the last \n
+            if cur_hal['Type'] == 'GENmwSource':
+                cur_mws += [(cur_str[:-1], col)]    #:-1 is to remove the last \n
+            if cur_hal['Type'] == 'GENswitch':
+                cur_sws += [(cur_str[:-1], col)]    #:-1 is to remove the last \n
+            if cur_hal['Type'] == 'GENswitchTrig':
+                cur_sws += [(cur_str[:-1], col)]    #:-1 is to remove the last \n
+            if cur_hal['Type'] == 'GENvoltSource':
+                cur_volts += [(cur_str[:-1], col)]    #:-1 is to remove the last \n
+            if cur_hal['Type'] == 'GENatten':
+                cur_attens += [(cur_str[:-1], col)]    #:-1 is to remove the last \n
+            if cur_hal['Type'] == 'WaveformAWG':
+                cur_wfms += [(cur_str[:-1], col, cur_list)]    #:-1 is to remove the last \n
+
+        cur_procs = []
+        for cur_proc in data['PROCs']:
+            cur_str = ""
+            cur_list = []
+            for cur_key in cur_proc:
+                if isinstance(cur_proc[cur_key], str):
+                    cur_str += f"{cur_key}: {Miscellaneous.get_units(cur_proc[cur_key])}\n"
+                elif isinstance(cur_proc[cur_key], list):
+                    cur_list.append((cur_key + ":", 'white'))
+                    for cur_pipe in cur_proc[cur_key]:
+                        #Basically it'll show the type and the parameter values... Taking name out first as the module could randomly place Type somewhere else...
+                        leName = cur_pipe.pop('Type')
+                        cur_list.append(("   " + leName + ", " + self._whittle_dict(cur_pipe), 'white'))
+            cur_procs += [(cur_str[:-1], 'white', cur_list)]
+
+        cur_wfmts = []
+        for cur_wfmt in data['WFMTs']:
+            cur_str = ""
+            for cur_key in cur_wfmt:
+                if isinstance(cur_wfmt[cur_key], str) or isinstance(cur_wfmt[cur_key], float) or isinstance(cur_wfmt[cur_key], int) or isinstance(cur_wfmt[cur_key], bool):
+                    cur_str += f"{cur_key}: {Miscellaneous.get_units(cur_wfmt[cur_key])}\n"
+            col = 'white'
+            cur_wfmts += [(cur_str[:-1], col)]
+
+        cur_elems_in_view = {self.dash_SPECs.item(child)['text'] : child for child in self.dash_SPECs.get_children()}
+        for cur_spec in data['SPECs']:
+            if cur_spec['Name'] in cur_elems_in_view:
+                tree_cur_spec = cur_elems_in_view[cur_spec['Name']]
+            else:
+                tree_cur_spec = self.dash_SPECs.insert("", "end", text=cur_spec['Name'])
                 
-                cur_attrs = {self.dash_SPECs.item(x)['tags'][0] : x for x in self.dash_SPECs.get_children(tree_cur_spec)}
-                for cur_key in cur_spec['Entries']:
-                    dest = cur_spec['Entries'][cur_key]['Destination']
-                    if len(dest) > 0:
-                        dest = f"({dest[0][1]}: {dest[0][0]})"
-                    else:
-                        dest = ""
-                    cur_str = f"{cur_key}: {Miscellaneous.get_units(cur_spec['Entries'][cur_key]['Value'])} {dest}"
-                    if cur_key in cur_attrs:
-                        self.dash_SPECs.item(cur_attrs[cur_key], text=cur_str, tags=[cur_key])
-                    else:
-                        self.dash_SPECs.insert(tree_cur_spec, "end", text=cur_str, tags=[cur_key])
-
-            #Setup the dashboard of labels...
-            self.dash_DDGs.set_simple_label_list(cur_ddgs)
-            self.dash_MWs.set_simple_labels(cur_mws)
-            self.dash_ACQs.set_simple_labels(cur_acqs)
-            self.dash_PROCs.set_simple_label_list(cur_procs)
-            self.dash_VOLTs.set_simple_labels(cur_volts)
-            self.dash_SWs.set_simple_labels(cur_sws)
-            self.dash_ATTENs.set_simple_labels(cur_attens)
-            self.dash_WFMs.set_simple_label_list(cur_wfms)
-            self.dash_WFMTs.set_simple_labels(cur_wfmts)
-            self.dash_EXPparams.set_simple_labels(cur_exp_params)
-
-            self.trvw_expts.column("#0", width=self.expts_frame_left.winfo_width(), minwidth=0, stretch=tk.NO)
-
-            #Read JSON file for latest variables...
-            file_state = self._path + "_last_vars.txt"
-            if not os.path.isfile(file_state):
-                continue
-            try:    #Needs try-catch as the file may be written to while being read - abort/ignore if it's being updated...
-                with open(file_state) as json_file:
-                    data = json.load(json_file)
-            except:
-                continue
-
-            cur_vars = []
-            for cur_var in data:
-                cur_vars += [f"{cur_var}: {Miscellaneous.get_units(data[cur_var]['Value'])}\n"]
-            # self.dash_VARs.set_simple_labels([(cur_str[:-1], 'white')])
-            self.dash_VARs.set_simple_list([cur_vars])
-
+            cur_attrs = {self.dash_SPECs.item(x)['tags'][0] : x for x in self.dash_SPECs.get_children(tree_cur_spec)}
+            for cur_key in cur_spec['Entries']:
+                dest = cur_spec['Entries'][cur_key]['Destination']
+                if len(dest) > 0:
+                    dest = f"({dest[0][1]}: {dest[0][0]})"
+                else:
+                    dest = ""
+                cur_str = f"{cur_key}: {Miscellaneous.get_units(cur_spec['Entries'][cur_key]['Value'])} {dest}"
+                if cur_key in cur_attrs:
+                    self.dash_SPECs.item(cur_attrs[cur_key], text=cur_str, tags=[cur_key])
+                else:
+                    self.dash_SPECs.insert(tree_cur_spec, "end", text=cur_str, tags=[cur_key])
+
+        #Setup the dashboard of labels...
+        self.dash_DDGs.set_simple_label_list(cur_ddgs)
+        self.dash_MWs.set_simple_labels(cur_mws)
+        self.dash_ACQs.set_simple_labels(cur_acqs)
+        self.dash_PROCs.set_simple_label_list(cur_procs)
+        self.dash_VOLTs.set_simple_labels(cur_volts)
+        self.dash_SWs.set_simple_labels(cur_sws)
+        self.dash_ATTENs.set_simple_labels(cur_attens)
+        self.dash_WFMs.set_simple_label_list(cur_wfms)
+        self.dash_WFMTs.set_simple_labels(cur_wfmts)
+        self.dash_EXPparams.set_simple_labels(cur_exp_params)
+
+    def _update_vars_dashboard(self, data):
+        cur_vars = []
+        for cur_var in data:
+            cur_vars += [f"{cur_var}: {Miscellaneous.get_units(data[cur_var]['Value'])}\n"]
+        # self.dash_VARs.set_simple_labels([(cur_str[:-1], 'white')])
+        self.dash_VARs.set_simple_list([cur_vars])
 
     def _get_units(self, val):
         if isinstance(val, float) or isinstance(val, int):
@@ -859,7 +890,10 @@ class ExperimentViewer:
 if __name__ == '__main__':
     if len(sys.argv) >= 2:
         print(sys.argv[1])
-        ExperimentViewer(sys.argv[1]).main_loop()
+        if len(sys.argv) >= 3:
+            ExperimentViewer(sys.argv[1], max_refresh_rate=float(sys.argv[2])).main_loop()
+        else:
+            ExperimentViewer(sys.argv[1]).main_loop()
 
     # ExperimentViewer(r'mySaves/').main_loop()
 a=0
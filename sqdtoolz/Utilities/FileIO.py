@@ -4,6 +4,8 @@ import json
 from h5py._hl.files import File
 import numpy as np
 import itertools
+import concurrent.futures
+import time
 import xarray as xr
 
 from datetime import datetime
@@ -15,11 +17,35 @@ from numpy.core.fromnumeric import argsort
 from sqdtoolz.Variable import VariableBase, VariableInternalTransient
 
 class FileIOWriter:
+    #Target size (in bytes) of the HDF5 chunks when grouping multiple small data packets into one chunk
+    CHUNK_TARGET_BYTES = 64*1024
+    #Maximum size (in bytes) of the HDF5 chunks when splitting a large data packet across multiple chunks
+    CHUNK_MAX_BYTES = 1024*1024
+    #Maximum size (in bytes) of the in-memory cache of recently pushed data packets (served in query_data)
+    CACHE_MAX_BYTES = 64*1024*1024
+
     def __init__(self, filepath, **kwargs):
         self._filepath = filepath
         self._hf = None
         self._data_array_shape = None
         self.store_timestamps = kwargs.get('store_timestamps', True)
+        #Write-back buffer settings - by default, every data packet is written and flushed immediately.
+        self._flush_points = kwargs.get('flush_points', 1)
+        self._flush_time = kwargs.get('flush_time', None)
+        assert isinstance(self._flush_points, (int, np.integer)) and self._flush_points >= 1, "The argument flush_points must be a positive integer."
+        assert self._flush_time == None or self._flush_time >= 0, "The argument flush_time must be given as a non-negative number of seconds (or None)."
+        #HDF5 storage settings
+        compression = kwargs.get('compression', 'gzip')
+        if compression == 'none':
+            compression = None
+        assert compression in [None, 'gzip', 'lzf'], "The argument compression must be None/'none', 'gzip' or 'lzf'."
+        self._compression = compression
+        self._compression_level = kwargs.get('compression_level', None)
+        assert self._compression_level == None or self._compression == 'gzip', "The argument compression_level is only supported for gzip compression."
+        self._chunk_packets = kwargs.get('chunk_packets', None)
+        #Number of the most recently pushed data packets held in memory to serve query_data without reading the HDF5 file
+        self._cache_packets = kwargs.get('cache_packets', 16)
+        assert isinstance(self._cache_packets, (int, np.integer)) and self._cache_packets >= 0, "The argument cache_packets must be a non-negative integer."
 
     def _get_dataset_sizes(self, sweep_vars, data_pkt):
         random_dataset = next(iter(data_pkt['data'].values()))
@@ -42,6 +68,7 @@ class FileIOWriter:
     def _init_hdf5(self, sweep_vars, data_pkt, sweepEx = {}):
         if self._hf == None:
             self._datapkt_size, param_sizes, self._data_array_shape = self._get_dataset_sizes(sweep_vars, data_pkt)
+            self._num_outer_axes = len(sweep_vars)
             #
             if os.path.isfile(self._filepath):
                 self._hf = h5py.File(self._filepath, 'a', libver='latest')
@@ -79,23 +106,84 @@ class FileIOWriter:
 
                 arr_size = int(np.prod(np.array(self._data_array_shape, dtype=np.int64)))
                 self._num_cols = len(data_pkt['data'].keys())
-                arr = np.zeros((arr_size, self._num_cols))
-                arr[:] = np.nan
+                chunk_rows = self._get_chunk_rows()
+                #The unwritten entries are simply given by the fill-value (i.e. NaN) instead of writing a full array of NaNs
                 #TODO: Change this if allowing resizing on other sweeping axes...
-                max_shape = list(arr.shape)
-                max_shape[0] = None
-                self._dset = self._hf.create_dataset("data", data=arr, compression="gzip", maxshape=max_shape)
+                self._dset = self._hf.create_dataset("data", shape=(arr_size, self._num_cols), dtype=np.float64, fillvalue=np.nan,
+                                                     chunks=(chunk_rows, self._num_cols), maxshape=(None, self._num_cols),
+                                                     compression=self._compression, compression_opts=self._compression_level)
                 self._dset_ind = 0
                 #Time-stamps (usually length 27 bytes)
                 if self.store_timestamps:
                     self._ts_len = len( np.datetime_as_string(np.datetime64(datetime.now()),timezone='UTC').encode('utf-8') )
-                    arr = np.array([np.datetime64()]*arr_size, dtype=f'S{self._ts_len}')
                     #TODO: Change this if allowing resizing on other sweeping axes...
-                    max_shape = list(arr.shape)
-                    max_shape[0] = None
-                    self._dsetTS = self._hf.create_dataset("timeStamps", data=arr, compression="gzip", maxshape=max_shape)
+                    self._dsetTS = self._hf.create_dataset("timeStamps", shape=(arr_size,), dtype=f'S{self._ts_len}',
+                                                           fillvalue=np.array([np.datetime64()], dtype=f'S{self._ts_len}')[0],
+                                                           chunks=(chunk_rows,), maxshape=(None,),
+                                                           compression=self._compression, compression_opts=self._compression_level)
                 
                 self._hf.swmr_mode = True
+                self._init_buffer()
+
+    def _get_chunk_rows(self):
+        #Chunks are aligned to the data packet size - i.e. either an integer number of small packets or an integer fraction of a large packet
+        row_bytes = 8*self._num_cols
+        pkt_bytes = self._datapkt_size*row_bytes
+        if self._chunk_packets != None:
+            chunk_rows = int(self._chunk_packets*self._datapkt_size)
+        elif pkt_bytes <= self.CHUNK_TARGET_BYTES:
+            chunk_rows = int(self.CHUNK_TARGET_BYTES // pkt_bytes) * self._datapkt_size
+        else:
+            num_splits = int(np.ceil(pkt_bytes / self.CHUNK_MAX_BYTES))
+            chunk_rows = int(np.ceil(self._datapkt_size / num_splits))
+        return int(max(1, chunk_rows))
+
+    def _init_buffer(self):
+        #Preallocated staging arrays for the write-back buffer
+        self._buf_data = np.empty((self._flush_points*self._datapkt_size, self._num_cols))
+        if self.store_timestamps:
+            self._buf_ts = np.empty(self._flush_points, dtype=f'S{self._ts_len}')
+        self._buf_inds = []
+        self._buf_last_flush = time.time()
+        #Ring cache of the recently pushed data packets (slot -> dataset packet index and dataset packet index -> slot)
+        num_slots = int(min(self._cache_packets, self.CACHE_MAX_BYTES // (8*self._num_cols*self._datapkt_size)))
+        self._cache_data = np.empty((num_slots, self._datapkt_size, self._num_cols))
+        self._cache_slot_inds = np.full(num_slots, -1, dtype=np.int64)
+        self._cache_map = {}
+        self._cache_next_slot = 0
+
+    def _cache_packet(self, dset_ind):
+        #Returns the cache slot into which to write the given data packet (None if caching is disabled)
+        if self._cache_data.shape[0] == 0:
+            return None
+        if dset_ind in self._cache_map:
+            return self._cache_map[dset_ind]
+        slot = self._cache_next_slot
+        self._cache_next_slot = (slot + 1) % self._cache_data.shape[0]
+        self._cache_map.pop(self._cache_slot_inds[slot], None)
+        self._cache_slot_inds[slot] = dset_ind
+        self._cache_map[dset_ind] = slot
+        return slot
+
+    def _flush_buffer(self):
+        if len(self._buf_inds) == 0:
+            return
+        #Group the buffered packets into contiguous runs of dataset indices so that each run is written as one slice
+        run_start = 0
+        for m in range(1, len(self._buf_inds)+1):
+            if m < len(self._buf_inds) and self._buf_inds[m] == self._buf_inds[m-1] + 1:
+                continue
+            dset_start = self._buf_inds[run_start]*self._datapkt_size
+            dset_end = (self._buf_inds[m-1]+1)*self._datapkt_size
+            self._dset[dset_start:dset_end] = self._buf_data[run_start*self._datapkt_size : m*self._datapkt_size]
+            if self.store_timestamps:
+                self._dsetTS[dset_start:dset_end] = np.repeat(self._buf_ts[run_start:m], self._datapkt_size)
+            run_start = m
+        self._buf_inds = []
+        self._buf_last_flush = time.time()
+        if self.store_timestamps:
+            self._dsetTS.flush()
+        self._dset.flush()
 
     def push_datapkt(self, data_pkt, sweep_vars, sweepEx = {}, dset_ind = -1):
         self._init_hdf5(sweep_vars, data_pkt, sweepEx)
@@ -121,43 +209,60 @@ class FileIOWriter:
             cur_dset_ind = dset_ind
         else:
             cur_dset_ind = self._dset_ind
-        cur_data = np.vstack([data_pkt['data'][x].flatten() for x in self._meas_chs]).T
-        self._dset[cur_dset_ind*self._datapkt_size : (cur_dset_ind+1)*self._datapkt_size] = cur_data
+        #Stage the packet (column by column) into the write-back buffer
+        buf_ind = len(self._buf_inds)
+        for m, cur_ch in enumerate(self._meas_chs):
+            self._buf_data[buf_ind*self._datapkt_size : (buf_ind+1)*self._datapkt_size, m] = np.ravel(data_pkt['data'][cur_ch])
+        cache_slot = self._cache_packet(cur_dset_ind)
+        if cache_slot != None:
+            self._cache_data[cache_slot] = self._buf_data[buf_ind*self._datapkt_size : (buf_ind+1)*self._datapkt_size]
         if self.store_timestamps:
             #Trick taken from here: https://stackoverflow.com/questions/68443753/datetime-storing-in-hd5-database
-            utc_strs = np.repeat(np.datetime_as_string(np.datetime64(datetime.now()),timezone='UTC').encode('utf-8'), cur_data.shape[0])
-            self._dsetTS[cur_dset_ind*self._datapkt_size : (cur_dset_ind+1)*self._datapkt_size] = utc_strs
-            self._dsetTS.flush()
+            self._buf_ts[buf_ind] = np.datetime_as_string(np.datetime64(datetime.now()),timezone='UTC').encode('utf-8')
+        self._buf_inds += [cur_dset_ind]
         self._dset_ind += 1
-        self._dset.flush()
+        #Write-back to the HDF5 file when the buffer is full or when the flush interval has elapsed (bounding the latency for SWMR readers)
+        if len(self._buf_inds) >= self._flush_points or (self._flush_time != None and time.time() - self._buf_last_flush >= self._flush_time):
+            self._flush_buffer()
     
     def query_data(self, slice_indices):
         #Given as a LIST of arrays
         assert len(slice_indices) <= len(self._data_array_shape), f"Number of slice indices {len(slice_indices)} must correspond to shape of stored array {len(self._data_array_shape)}"
         #Pad out remaining indices as [:]...
-        if len(slice_indices) < len(self._data_array_shape):
-            slice_indices = list(slice_indices)
-            for m in range(len(slice_indices), len(self._data_array_shape)):
-                slice_indices += [np.arange(self._data_array_shape[m])]
-
-        #Doing this as ravel_multi_index is too primitive...
-        data_inds = np.array([])
-        for m in range(len(slice_indices)-1,-1,-1):
-            if m == len(slice_indices)-1:
-                fac = 1
-                data_inds = np.array(slice_indices[m])
-            else:
-                fac = np.prod(self._data_array_shape[m+1:])
-                data_inds = [fac*np.array(slice_indices[m])+x for x in data_inds]
-                data_inds = np.ndarray.flatten(np.array(data_inds))
-
-        #data_inds = np.ravel_multi_index(slice_indices, self._data_array_shape)
-        data_inds = np.sort(data_inds)
-        ret_data = self._dset[data_inds]    #Second index = #columns or #dep_params
-        return ret_data.reshape(tuple([np.array(x).size for x in slice_indices]+[ret_data.shape[1]]))
+        slice_indices = [np.sort(np.ravel(np.array(x, dtype=np.int64))) for x in slice_indices]
+        for m in range(len(slice_indices), len(self._data_array_shape)):
+            slice_indices += [np.arange(self._data_array_shape[m])]
+        ret_shape = tuple([x.size for x in slice_indices]+[self._num_cols])
+        if 0 in ret_shape:
+            return np.zeros(ret_shape)
+
+        #Serve the query from the cache of recent data packets if it holds all the requested packets
+        outer_inds = slice_indices[:self._num_outer_axes]
+        pkt_strides = [int(np.prod(self._data_array_shape[m+1:self._num_outer_axes], dtype=np.int64)) for m in range(self._num_outer_axes)]
+        pkt_inds = np.zeros(tuple(x.size for x in outer_inds), dtype=np.int64)
+        for m, cur_inds in enumerate(outer_inds):
+            pkt_inds = pkt_inds + (cur_inds*pkt_strides[m]).reshape((1,)*m + (-1,) + (1,)*(len(outer_inds)-m-1))
+        cache_slots = [self._cache_map.get(x, -1) for x in np.ravel(pkt_inds)]
+        if len(cache_slots) > 0 and min(cache_slots) >= 0:
+            pkt_shape = tuple(self._data_array_shape[self._num_outer_axes:])
+            ret_data = self._cache_data[cache_slots].reshape(pkt_inds.shape + pkt_shape + (self._num_cols,))
+            if len(pkt_shape) > 0:
+                ret_data = ret_data[(np.s_[:],)*len(outer_inds) + np.ix_(*slice_indices[self._num_outer_axes:]) + (np.s_[:],)]
+            return ret_data.reshape(ret_shape)
+
+        #Otherwise read the requested hyperslabs from the HDF5 file (the left-most axis may have been resized)
+        self._flush_buffer()
+        dset_shape = [int(self._dset.shape[0] // np.prod(self._data_array_shape[1:], dtype=np.int64))] + list(self._data_array_shape[1:])
+        lazy_arr = FileIOLazyArray(self._dset, [None]*len(dset_shape), [np.arange(x) for x in dset_shape], self._meas_chs)
+        return lazy_arr[tuple(slice_indices)].reshape(ret_shape)
+
+    def flush(self):
+        if self._hf:
+            self._flush_buffer()
 
     def close(self):
         if self._hf:
+            self._flush_buffer()
             self._hf.close()
             self._hf = None
             self._data_array_shape = None
@@ -189,7 +294,8 @@ class FileIOWriter:
         for m in range(len(dep_param_names)):
             grp_meas.create_dataset(dep_param_names[m], data=np.hstack([m]))
         arr_size = int(np.prod(data_array.shape)/data_array.shape[-1])
-        hf.create_dataset("data", data=data_array.reshape((arr_size, len(dep_param_names))), compression="gzip")
+        #Setting compression=None stores the data contiguously so that it can be memory-mapped (see FileIOReader.get_lazy_array)
+        hf.create_dataset("data", data=data_array.reshape((arr_size, len(dep_param_names))), compression=kwargs.get('compression', 'gzip'))
         hf.close()
 
 class FileIODatalogger:
@@ -215,6 +321,169 @@ class FileIODatalogger:
             self._filewriter.close()
         self._filewriter = None
 
+class FileIOLazyArray:
+    #Selections along the partially sliced axis with gaps (in indices) larger than this are read as separate HDF5 slices
+    MAX_READ_GAP = 8
+
+    def __init__(self, dset, param_names, param_vals, dep_params, mmap_path = None):
+        '''
+        N-D view (indexed as: parameters..., dependent-parameter) onto the flat data array in an SQDToolz HDF5 file. Data is only read
+        from the file upon slicing - either via numpy-style indexing (e.g. arr[3, :, 1:10, 0]) or by parameter values via sel. Note
+        that index arrays on different axes select independently (i.e. outer indexing like np.ix_) rather than being broadcast together.
+
+        Inputs:
+            - dset        - The HDF5 dataset holding the flat (num-points x num-dependent-parameters) data array
+            - param_names - List of the parameter names
+            - param_vals  - List of the parameter values (1D arrays)
+            - dep_params  - List of the dependent parameter names
+            - mmap_path   - (Optional) path of the HDF5 file to memory-map the dataset (only for contiguous uncompressed datasets)
+        '''
+        self._dset = dset
+        self.param_names = param_names
+        self.param_vals = param_vals
+        self.dep_params = dep_params
+        self.shape = tuple([len(x) for x in param_vals] + [len(dep_params)])
+        self.dtype = dset.dtype
+        self._mmap = None
+        if mmap_path != None:
+            offset = dset.id.get_offset()
+            assert dset.chunks is None and dset.compression is None and offset != None, "Can only memory-map contiguous uncompressed datasets."
+            self._mmap = np.memmap(mmap_path, dtype=dset.dtype, mode='r', offset=offset, shape=dset.shape).reshape(self.shape)
+
+    @property
+    def ndim(self):
+        return len(self.shape)
+
+    @property
+    def IsMemoryMapped(self):
+        return self._mmap is not None
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __array__(self, dtype=None, copy=None):
+        return np.asarray(self[...], dtype=dtype)
+
+    def __getitem__(self, key):
+        axes_inds, drop_axes = self._normalise_key(key)
+        if self._mmap is not None:
+            ret_data = self._mmap[np.ix_(*axes_inds)]
+        else:
+            ret_data = self._read_selection(axes_inds)
+        if len(drop_axes) > 0:
+            ret_data = ret_data[tuple(0 if m in drop_axes else np.s_[:] for m in range(self.ndim))]
+        return ret_data
+
+    def sel(self, dep_params = None, **param_values):
+        '''
+        Slices the array by parameter values. Every parameter given as a keyword argument is either a single value (the nearest
+        value is selected and the axis is dropped), a list/array of values (the nearest values are selected) or a slice with the
+        values as bounds (e.g. slice(1e9, 2e9) selects all values within the range). The dependent parameters can be selected via
+        dep_params as either a name or a list of names.
+        '''
+        key = [np.s_[:] for x in self.shape]
+        for cur_param, cur_val in param_values.items():
+            assert cur_param in self.param_names, f"The parameter {cur_param} does not exist in this dataset."
+            ind = self.param_names.index(cur_param)
+            cur_vals = np.asarray(self.param_vals[ind])
+            if isinstance(cur_val, slice):
+                assert cur_val.step is None, "Slicing by parameter values does not support steps."
+                lo = -np.inf if cur_val.start is None else cur_val.start
+                hi = np.inf if cur_val.stop is None else cur_val.stop
+                key[ind] = np.nonzero((cur_vals >= min(lo,hi)) & (cur_vals <= max(lo,hi)))[0]
+            elif np.isscalar(cur_val):
+                key[ind] = int(np.argmin(np.abs(cur_vals - cur_val)))
+            else:
+                key[ind] = np.array([np.argmin(np.abs(cur_vals - x)) for x in np.ravel(cur_val)], dtype=np.int64)
+        if dep_params != None:
+            if isinstance(dep_params, str):
+                assert dep_params in self.dep_params, f"The dependent parameter {dep_params} does not exist in this dataset."
+                key[-1] = self.dep_params.index(dep_params)
+            else:
+                for x in dep_params:
+                    assert x in self.dep_params, f"The dependent parameter {x} does not exist in this dataset."
+                key[-1] = np.array([self.dep_params.index(x) for x in dep_params], dtype=np.int64)
+        return self[tuple(key)]
+
+    def _normalise_key(self, key):
+        #Converts a numpy-style key into a list of index arrays (one per axis) and a list of axes to drop (i.e. indexed by integers)
+        if not isinstance(key, tuple):
+            key = (key,)
+        ell_inds = [m for m, x in enumerate(key) if x is Ellipsis]
+        assert len(ell_inds) <= 1, "Only one Ellipsis can be used when indexing."
+        if len(ell_inds) == 1:
+            key = key[:ell_inds[0]] + (np.s_[:],)*(self.ndim - len(key) + 1) + key[ell_inds[0]+1:]
+        assert len(key) <= self.ndim, f"Too many indices ({len(key)}) for the array with {self.ndim} dimensions."
+        key = key + (np.s_[:],)*(self.ndim - len(key))
+        axes_inds = []
+        drop_axes = []
+        for m, cur_key in enumerate(key):
+            cur_size = self.shape[m]
+            if isinstance(cur_key, slice):
+                cur_inds = np.arange(cur_size)[cur_key]
+            elif isinstance(cur_key, (int, np.integer)):
+                assert -cur_size <= cur_key < cur_size, f"Index {cur_key} is out of bounds for axis {m} with size {cur_size}."
+                cur_inds = np.array([cur_key % cur_size])
+                drop_axes.append(m)
+            else:
+                cur_inds = np.asarray(cur_key)
+                if cur_inds.dtype == bool:
+                    assert cur_inds.size == cur_size, f"Boolean index does not match the size of axis {m}."
+                    cur_inds = np.nonzero(cur_inds)[0]
+                else:
+                    cur_inds = np.ravel(cur_inds).astype(np.int64)
+                    assert np.all((cur_inds >= -cur_size) & (cur_inds < cur_size)), f"Index array is out of bounds for axis {m} with size {cur_size}."
+                    cur_inds = cur_inds % cur_size
+            axes_inds.append(cur_inds)
+        return axes_inds, drop_axes
+
+    def _read_selection(self, axes_inds):
+        param_sizes = self.shape[:-1]
+        num_params = len(param_sizes)
+        ret_shape = tuple(x.size for x in axes_inds)
+        if 0 in ret_shape:
+            return np.zeros(ret_shape, dtype=self.dtype)
+
+        #Find the inner-most partially selected axis - the axes after it are fully selected and thus, contiguous in the file
+        part_axis = num_params - 1
+        while part_axis >= 0 and axes_inds[part_axis].size == param_sizes[part_axis] and np.array_equal(axes_inds[part_axis], np.arange(param_sizes[part_axis])):
+            part_axis -= 1
+        inner_size = int(np.prod(param_sizes[part_axis+1:], dtype=np.int64))
+        if part_axis < 0:
+            ret_data = self._dset[:].reshape(self.shape)
+            return ret_data[..., axes_inds[-1]]
+
+        #Read the unique sorted indices on the outer axes and the partial axis (then reorder/duplicate them afterwards)
+        uniq_inds = []
+        inv_inds = []
+        for m in range(part_axis+1):
+            cur_uniq, cur_inv = np.unique(axes_inds[m], return_inverse=True)
+            uniq_inds.append(cur_uniq)
+            inv_inds.append(cur_inv)
+        #Split the partial axis into runs that are each read as a single slice
+        part_inds = uniq_inds[part_axis]
+        run_breaks = np.nonzero(np.diff(part_inds) > self.MAX_READ_GAP)[0] + 1
+        runs = np.split(part_inds, run_breaks)
+
+        row_strides = [int(np.prod(param_sizes[m+1:], dtype=np.int64)) for m in range(num_params)]
+        num_cols = self.shape[-1]
+        ret_data = np.empty(tuple(x.size for x in uniq_inds) + tuple(param_sizes[part_axis+1:]) + (num_cols,), dtype=self.dtype)
+        for outer_pos in itertools.product(*[range(x.size) for x in uniq_inds[:part_axis]]):
+            outer_row = sum(uniq_inds[m][x]*row_strides[m] for m, x in enumerate(outer_pos))
+            cur_pos = 0
+            for cur_run in runs:
+                row_start = outer_row + int(cur_run[0])*inner_size
+                row_end = outer_row + (int(cur_run[-1])+1)*inner_size
+                cur_block = self._dset[row_start:row_end].reshape((-1,) + tuple(param_sizes[part_axis+1:]) + (num_cols,))
+                ret_data[outer_pos + (np.s_[cur_pos:cur_pos+cur_run.size],)] = cur_block[cur_run - cur_run[0]]
+                cur_pos += cur_run.size
+
+        #Reorder (and duplicate) the entries as given in the original selection
+        for m in range(part_axis+1):
+            if uniq_inds[m].size != axes_inds[m].size or not np.array_equal(uniq_inds[m], axes_inds[m]):
+                ret_data = np.take(ret_data, inv_inds[m].ravel(), axis=m)
+        return ret_data[..., axes_inds[-1]]
+
 class FileIOReader:
     def __init__(self, filepath):
         self.file_path = filepath
@@ -263,6 +532,17 @@ class FileIOReader:
             assert False, "The reader has released the file - create a new FileIOReader instance to extract data."
             return np.array([])
     
+    def get_lazy_array(self, use_mmap = False):
+        '''
+        Returns an N-D view (FileIOLazyArray) of the data that is only read upon slicing - either via numpy-style indexing or by
+        parameter values via sel. If use_mmap is True, the dataset is memory-mapped instead (only possible for contiguous
+        uncompressed datasets - e.g. those written via write_file_direct with compression=None).
+        '''
+        if not self.hdf5_file is None:
+            return FileIOLazyArray(self.dset, self.param_names, self.param_vals, self.dep_params, self.file_path if use_mmap else None)
+        else:
+            assert False, "The reader has released the file - create a new FileIOReader instance to extract data."
+
     def get_xarray(self):
         data_arrays = []
         arr = self.get_numpy_array()
@@ -277,8 +557,8 @@ class FileIOReader:
         if not self.hdf5_file is None:
             assert not self.dsetTS is None, "There are no time-stamps in this data file. It was probably created before the time-stamp feature was implemented in SQDToolz."
             cur_shape = [len(x) for x in self.param_vals]
-            cur_data = self.dsetTS[:]
-            cur_data = np.array([np.datetime64(x) for x in cur_data])
+            #Strip the UTC designator (i.e. Z) to convert all time-stamps at once
+            cur_data = np.char.rstrip(self.dsetTS[:], b'Z').astype('datetime64[us]')
             return cur_data.reshape(tuple(x for x in cur_shape))
         else:
             assert False, "The reader has released the file - create a new FileIOReader instance to extract data."
@@ -308,6 +588,40 @@ class FileIODirectory:
             ax.add_collection(self.pc)
             ax.autoscale()
 
+    class dset_object:
+        def __init__(self, file_paths, dset_name, num_rows, row_shape, dtype):
+            #Flat (HDF5-like) dataset stacking the given dataset across all files (in the given order) - only the requested rows are read
+            self._file_paths = file_paths
+            self._dset_name = dset_name
+            self._num_rows = num_rows
+            self.shape = (len(file_paths)*num_rows,) + tuple(row_shape)
+            self.dtype = np.dtype(dtype)
+            self.chunks = None
+            self.compression = None
+
+        def __len__(self):
+            return self.shape[0]
+
+        def __getitem__(self, key):
+            assert isinstance(key, slice) and key.step in [None, 1], "The directory dataset only supports contiguous slices of rows."
+            row_start, row_end, _ = key.indices(self.shape[0])
+            row_end = max(row_start, row_end)
+            ret_data = np.empty((row_end - row_start,) + self.shape[1:], dtype=self.dtype)
+            cur_row = row_start
+            while cur_row < row_end:
+                file_ind = cur_row // self._num_rows
+                file_row = cur_row - file_ind*self._num_rows
+                num_rows = min(self._num_rows - file_row, row_end - cur_row)
+                with h5py.File(self._file_paths[file_ind], 'r', libver='latest', swmr=True) as hf:
+                    ret_data[cur_row-row_start:cur_row-row_start+num_rows] = hf[self._dset_name][file_row:file_row+num_rows]
+                cur_row += num_rows
+            return ret_data
+
+    #Name of the index file (stored in the parent folder) that caches the metadata of every folder across reloads
+    INDEX_FILE_NAME = 'fileio_directory_index.json'
+    #Maximum number of threads used to read the metadata of the folders that are not (or no longer validly) in the index file
+    NUM_LOAD_THREADS = 8
+
     def __init__(self, filepath):
         cur_dir_path = os.path.dirname(filepath)
         dir_name = os.path.basename(cur_dir_path)
@@ -320,79 +634,83 @@ class FileIODirectory:
 
         #Collect all relevant similar files...
         cur_dir_files = [x[0] for x in os.walk(self._main_dir)][1:]
+        cur_dir_files = [x for x in cur_dir_files if os.path.basename(x).endswith(self._cur_dir_suffix)]
+
+        #Only read the metadata of folders that are new or have changed since the index file was last written
+        index_dict = self._read_index().get(self._cur_file_name, {}).get(self._cur_dir_suffix, {})
+        new_index_dict = {}
+        to_load = []
+        for cur_folder in cur_dir_files:
+            cur_key = os.path.relpath(cur_folder, self._main_dir)
+            cur_stamp = self._get_folder_stamp(cur_folder)
+            if cur_stamp is None:
+                continue
+            if cur_key in index_dict and index_dict[cur_key]['Stamp'] == cur_stamp:
+                new_index_dict[cur_key] = index_dict[cur_key]
+            else:
+                to_load += [(cur_key, cur_folder, cur_stamp)]
+        if len(to_load) > 0:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=min(self.NUM_LOAD_THREADS, len(to_load))) as executor:
+                new_entries = list(executor.map(lambda x: self._read_folder_metadata(x[1], x[2]), to_load))
+            for m, cur_entry in enumerate(new_entries):
+                new_index_dict[to_load[m][0]] = cur_entry
+        if new_index_dict != index_dict:
+            self._write_index(new_index_dict)
+
         cur_files = []
         self.folders = []
         self.folders_ignored = []
         no_file_index = False
         for cur_folder in cur_dir_files:
-            #Check that the suffix of the folder name matches...
-            if not os.path.basename(cur_folder).endswith(self._cur_dir_suffix):
-                continue
-
-            #Check that the relevant data and attribute files exist...
-            filepath = cur_folder +'/' + self._cur_file_name
-            if not os.path.isfile(cur_folder +'/' + self._cur_file_name):
-                self.folders_ignored += [cur_folder]
-                continue
-            if not os.path.isfile(cur_folder +'/' + 'experiment_parameters.txt'):
+            cur_key = os.path.relpath(cur_folder, self._main_dir)
+            if not cur_key in new_index_dict:
                 self.folders_ignored += [cur_folder]
                 continue
-            if not os.path.isfile(cur_folder +'/' + 'laboratory_parameters.txt'):
-                self.folders_ignored += [cur_folder]
-                continue
-
-            #Collect the information and add it to a list (note that the giant numpy array is not read in here...)...
-            cur_file = FileIOReader(filepath)
-            with open(cur_folder +'/' + 'experiment_parameters.txt') as json_file:
-                data = json.load(json_file)
-                var_names = data['Sweeps']
-                if not no_file_index and 'FileIndex' in data:
-                    cur_file_index = data['FileIndex']
-                else:
-                    cur_file_index = 0
-                    no_file_index = True
-            with open(cur_folder +'/' + 'laboratory_parameters.txt') as json_file:
-                data = json.load(json_file)
-                var_vals = [data[x]['Value'] for x in var_names]
-
-            cur_files += [(cur_file, var_names, var_vals, cur_file_index, cur_folder)]
+            cur_entry = new_index_dict[cur_key]
+            if cur_entry['FileIndex'] is None:
+                no_file_index = True
+            cur_files += [(cur_entry, cur_folder)]
+        if no_file_index:
+            cur_files = [({**x[0], 'FileIndex' : 0}, x[1]) for x in cur_files]
 
         #Correct for the arbitrary nature of the folder order given by: os.walk
         if no_file_index:
             print("Running FileIODirectory on files generated in legacy version of SQDToolz may cause the files to load to be in a mixed order.")
         else:
-            cur_files = sorted(cur_files, key=lambda x: x[3])
-        self.folders = [x[4] for x in cur_files]
+            cur_files = sorted(cur_files, key=lambda x: x[0]['FileIndex'])
+        self.folders = [x[1] for x in cur_files]
+        self._folder_vars = [x[0]['Variables'] for x in cur_files]
+        self._file_paths = [x[1] + '/' + self._cur_file_name for x in cur_files]
 
         self.non_uniform = False
 
         #Try to figure out the outer structure...
-        cur_param_names_outer = cur_files[0][1]
-        cur_param_names_inner = cur_files[0][0].param_names
-        cur_param_vals_inner = cur_files[0][0].param_vals
-        self.dep_params = cur_files[0][0].dep_params
+        cur_param_names_outer = cur_files[0][0]['Sweeps']
+        cur_param_names_inner = cur_files[0][0]['ParamNames']
+        cur_param_vals_inner = [np.array(x) for x in cur_files[0][0]['ParamVals']]
+        self.dep_params = cur_files[0][0]['DepParams']
         same_sweep_vars_outer_loop = True
         for cur_file in cur_files:
             #Check that the outer looping variables are the same
-            if cur_file[1] != cur_param_names_outer:
+            if cur_file[0]['Sweeps'] != cur_param_names_outer:
                 same_sweep_vars_outer_loop = False
             #Check inner sweeping variables are the same
             #TODO: Investigate whether the demand that the files must be of the same inner parameter order is too stringent.
-            assert cur_param_names_inner == cur_file[0].param_names, "The inner parameters are different across files. This is a vary non-uniform set of files and shall not be parsed."
-            if len(cur_param_vals_inner) == len(cur_file[0].param_vals):
+            assert cur_param_names_inner == cur_file[0]['ParamNames'], "The inner parameters are different across files. This is a vary non-uniform set of files and shall not be parsed."
+            if len(cur_param_vals_inner) == len(cur_file[0]['ParamVals']):
                 for cur_ind in range(len(cur_param_vals_inner)):
-                    if not np.array_equal(cur_param_vals_inner[cur_ind], cur_file[0].param_vals[cur_ind]):
+                    if not np.array_equal(cur_param_vals_inner[cur_ind], cur_file[0]['ParamVals'][cur_ind]):
                         self.non_uniform = True
                         break
             else:
                 self.non_uniform = True
-            assert self.dep_params == cur_file[0].dep_params, "The dependent parameters are different across files. This is a vary non-uniform set of files and shall not be parsed."
+            assert self.dep_params == cur_file[0]['DepParams'], "The dependent parameters are different across files. This is a vary non-uniform set of files and shall not be parsed."
         if len(cur_param_names_outer) == 0:
             same_sweep_vars_outer_loop = False
 
         #Settle the outer looping variables if there is some semblance of uniformity of the outer sweeping variables
         if same_sweep_vars_outer_loop:
-            sweep_grid = np.vstack([x[2] for x in cur_files])
+            sweep_grid = np.vstack([x[0]['SweepVals'] for x in cur_files])
             unique_vals = []
             num_cols = sweep_grid.shape[1]
             for m in range(num_cols):
@@ -410,71 +728,135 @@ class FileIODirectory:
             cur_param_names_outer = ['DirFileNo']
             self._cur_param_vals_outer = [np.arange(len(cur_files))]
 
+        #The data is only read from the files when requested (i.e. via get_numpy_array, get_lazy_array or get_time_stamps)
+        self._cur_data = None
+        self._cur_data_ts = None
+        self.param_names = cur_param_names_outer + cur_param_names_inner
         if not self.non_uniform:
             #The sampling is uniform and thus, one can amalgamate all datasets into one giant numpy array!
-            cur_arrays = []
-            for cur_file in cur_files:
-                cur_arrays += [cur_file[0].get_numpy_array()]
-            cur_data = np.concatenate(cur_arrays)
-
-            #Process time-stamps (assuming that if the first file supports it, then the remaining shall as well...)
-            if cur_file[0].dsetTS is not None:
-                cur_arrays_ts = [cur_file[0].get_time_stamps() for cur_file in cur_files]
-                self._ts_valid = True
-            else:
-                self._ts_valid = False
-            cur_arrays_ts = np.concatenate(cur_arrays_ts)
-
-            self.param_names = cur_param_names_outer + cur_param_names_inner
+            #Process time-stamps (only if all files support it...)
+            self._ts_valid = all(x[0]['TimeStamps'] for x in cur_files)
             self.param_vals = self._cur_param_vals_outer + cur_param_vals_inner
-            self._cur_data = cur_data.reshape(tuple( [x.size for x in self.param_vals] + [len(self.dep_params)] ))
-            self._cur_data_ts = cur_arrays_ts.reshape(tuple( [x.size for x in self.param_vals] ))
+            num_rows = int(np.prod([x.size for x in cur_param_vals_inner], dtype=np.int64))
+            self._dset = FileIODirectory.dset_object(self._file_paths, 'data', num_rows, (len(self.dep_params),), cur_files[0][0]['DataType'])
+            if self._ts_valid:
+                self._dsetTS = FileIODirectory.dset_object(self._file_paths, 'timeStamps', num_rows, (), cur_files[0][0]['TimeStampType'])
         else:
             #TIME STAMPS ARE CURRENTLY UNSUPPORTED FOR NON-UNIFORM INDEXING
             #TODO: Give support for time-stamps in non-uniform indexing...
             self._ts_valid = False
 
             #The dataset is non-uniform, so don't reshape the lists...
-            self.param_names = cur_param_names_outer + cur_param_names_inner
             self.param_vals = self._cur_param_vals_outer
 
-            self._cur_data = [{'param_vals':x[0].param_vals, 'data':x[0].get_numpy_array()} for x in cur_files]
-            #Setup the indexing to match the outer sweeping parameters...
-            self._cur_data = np.array(self._cur_data).reshape(tuple(x.size for x in self.param_vals))
-
             self.uniform_indices = [True]*len(cur_param_names_outer)
             uniform_inners = []
             for cur_inner_ind in range(len(cur_param_names_inner)):
                 param_uniform = True
                 for cur_file in cur_files:
-                    if not np.array_equal(cur_file[0].param_vals[cur_inner_ind], cur_files[0][0].param_vals[cur_inner_ind]):
+                    if not np.array_equal(cur_file[0]['ParamVals'][cur_inner_ind], cur_files[0][0]['ParamVals'][cur_inner_ind]):
                         param_uniform = False
                         break
                 uniform_inners += [param_uniform]
             self.uniform_indices += uniform_inners
-        
-        #Release the HDF5 reader files...
-        for cur_file in cur_files:
-            cur_file[0].release()
 
     @classmethod
     def fromReader(cls, obj_FileIOReader):
         return cls(obj_FileIOReader.file_path)
 
+    def _get_folder_stamp(self, cur_folder):
+        #Returns the modification times and sizes of the relevant files (None if the folder is missing any of them)
+        cur_stamp = []
+        for cur_file in [self._cur_file_name, 'experiment_parameters.txt', 'laboratory_parameters.txt']:
+            try:
+                cur_stat = os.stat(cur_folder + '/' + cur_file)
+            except OSError:
+                return None
+            cur_stamp += [[cur_stat.st_mtime_ns, cur_stat.st_size]]
+        return cur_stamp
+
+    def _read_folder_metadata(self, cur_folder, cur_stamp):
+        #Collect the information (note that the giant numpy array is not read in here...)...
+        cur_file = FileIOReader(cur_folder + '/' + self._cur_file_name)
+        try:
+            cur_entry = {
+                'Stamp' : cur_stamp,
+                'ParamNames' : cur_file.param_names,
+                'ParamVals' : [x.tolist() for x in cur_file.param_vals],
+                'DepParams' : cur_file.dep_params,
+                'DataType' : cur_file.dset.dtype.str,
+                'TimeStamps' : cur_file.dsetTS is not None,
+                'TimeStampType' : None if cur_file.dsetTS is None else cur_file.dsetTS.dtype.str
+            }
+        finally:
+            cur_file.release()
+        with open(cur_folder + '/' + 'experiment_parameters.txt') as json_file:
+            data = json.load(json_file)
+            cur_entry['Sweeps'] = data['Sweeps']
+            cur_entry['FileIndex'] = data.get('FileIndex', None)
+        with open(cur_folder + '/' + 'laboratory_parameters.txt') as json_file:
+            data = json.load(json_file)
+            cur_entry['SweepVals'] = [data[x]['Value'] for x in cur_entry['Sweeps']]
+            cur_entry['Variables'] = {x : data[x]['Value'] for x in data.keys()}
+        return cur_entry
+
+    def _read_index(self):
+        #Returns the index given as: data file name -> folder suffix -> folder (relative to the parent folder) -> metadata
+        try:
+            with open(self._main_dir + '/' + self.INDEX_FILE_NAME) as json_file:
+                index_dict = json.load(json_file)
+        except (OSError, ValueError):
+            return {}
+        if not isinstance(index_dict.get('Files', None), dict):
+            return {}
+        return index_dict['Files']
+
+    def _write_index(self, folders_dict):
+        #Only replace the folders indexed for the current data file name and folder suffix - the entries of other file names and
+        #suffixes in the same parent folder are merged in from the latest index file
+        index_dict = self._read_index()
+        index_dict.setdefault(self._cur_file_name, {})[self._cur_dir_suffix] = folders_dict
+        #Write to a temporary file first so that concurrent readers never see a partially written index file
+        index_path = self._main_dir + '/' + self.INDEX_FILE_NAME
+        try:
+            with open(index_path + '.tmp', 'w') as outfile:
+                json.dump({'Files' : index_dict}, outfile)
+            os.replace(index_path + '.tmp', index_path)
+        except OSError:
+            #The index file is only a cache (e.g. the data may be in a read-only folder)
+            pass
+
     def get_numpy_array(self):
+        if self._cur_data is None:
+            if not self.non_uniform:
+                self._cur_data = self._dset[:].reshape(tuple( [x.size for x in self.param_vals] + [len(self.dep_params)] ))
+            else:
+                cur_data = []
+                for cur_file_path in self._file_paths:
+                    cur_file = FileIOReader(cur_file_path)
+                    cur_data += [{'param_vals':cur_file.param_vals, 'data':cur_file.get_numpy_array()}]
+                    cur_file.release()
+                #Setup the indexing to match the outer sweeping parameters...
+                self._cur_data = np.array(cur_data).reshape(tuple(x.size for x in self.param_vals))
         return self._cur_data
 
+    def get_lazy_array(self):
+        '''
+        Returns an N-D view (FileIOLazyArray) of the amalgamated data in which only the files (and rows within them) required by a
+        given slice are read. Only supported for uniformly sampled datasets.
+        '''
+        assert not self.non_uniform, "Lazy arrays are not supported on non-uniformly sampled datasets."
+        return FileIOLazyArray(self._dset, self.param_names, self.param_vals, self.dep_params)
+
     def get_var_dict_arrays(self, return_slicing_params = False):
         ret_dict = {}
         array_shape = [x.size for x in self._cur_param_vals_outer]
         array_size = np.prod(array_shape)
-        for m, cur_folder in enumerate(self.folders):
-            with open(cur_folder +'/' + 'laboratory_parameters.txt') as json_file:
-                data = json.load(json_file)
-                for cur_var in data.keys():
-                    if not cur_var in ret_dict:
-                        ret_dict[cur_var] = np.empty((array_size,))
-                    ret_dict[cur_var][m] = data[cur_var]['Value']
+        for m, cur_vars in enumerate(self._folder_vars):
+            for cur_var in cur_vars.keys():
+                if not cur_var in ret_dict:
+                    ret_dict[cur_var] = np.empty((array_size,))
+                ret_dict[cur_var][m] = cur_vars[cur_var]
         for cur_var in ret_dict:
             ret_dict[cur_var] = ret_dict[cur_var].reshape(tuple(array_shape))
         if return_slicing_params:
@@ -484,6 +866,10 @@ class FileIODirectory:
 
     def get_time_stamps(self):
         assert self._ts_valid, "Time-stamps are not present or supported for this directory."
+        if self._cur_data_ts is None:
+            #Strip the UTC designator (i.e. Z) to convert all time-stamps at once
+            cur_data = np.char.rstrip(self._dsetTS[:], b'Z').astype('datetime64[us]')
+            self._cur_data_ts = cur_data.reshape(tuple( [x.size for x in self.param_vals] ))
         return self._cur_data_ts
 
     def get_rects_from_nonuniform_index(self, second_axis_param, slicing_indices_dict, non_uniform_on_x = True):
@@ -507,7 +893,7 @@ class FileIODirectory:
                 outer_slicer += [np.s_[:]]
             else:
                 outer_slicer += [x]
-        rec_data = self._cur_data[tuple(outer_slicer)]
+        rec_data = self.get_numpy_array()[tuple(outer_slicer)]
 
         x_vals = [x['param_vals'][axis1_index] for x in rec_data]
         y_vals = self.param_vals[axis2_index]
@@ -1,4 +1,4 @@
-from sqdtoolz.HAL.WaveformSegments import WFS_Gaussian, WFS_Constant
+from sqdtoolz.HAL.WaveformSegments import WFS_Gaussian, WFS_Constant, WFS_Group
 from sqdtoolz.HAL.WaveformGeneric import*
 import numpy as np
 import scipy.linalg
@@ -261,5 +261,81 @@ class TransmonGates(QubitGatesBase):
         else:
             return i_val, q_val
 
+    def run_circuits(self, gate_lists, expt_config, load_time, readout_time, circuits_per_batch=1):
+        '''
+        Runs the list of circuits (each given as a gate_list) and yields the data packet (as returned by run_circuit) for every circuit in
+        order. The circuits are run in batches of circuits_per_batch circuits (see run_circuits_direct).
+        '''
+        for m in range(0, len(gate_lists), circuits_per_batch):
+            for cur_vals in self.run_circuits_direct(gate_lists[m:m+circuits_per_batch], expt_config, load_time, readout_time, circuits_per_batch=circuits_per_batch):
+                yield {
+                    'data' : {
+                        'CH_I' : np.array([cur_vals[0]]),
+                        'CH_Q' : np.array([cur_vals[1]]),
+                    },
+                    'parameters' : []
+                }
+
+    def run_circuits_direct(self, gate_lists, expt_config, load_time, readout_time, normalise=False, circuits_per_batch=1):
+        '''
+        Runs the list of circuits (each given as a gate_list) and returns a list of the (i_val, q_val) tuples (as returned by run_circuit_direct)
+        for every circuit.
+
+        If circuits_per_batch is larger than 1, the circuits are run in batches in which every batch is programmed as a single AWG waveform with
+        one block per circuit (all blocks padded to the same length so that the gates end right before the readout) and acquired in a single
+        get_data call with one ACQ segment per circuit (i.e. NumSegments is temporarily set to the number of circuits in the batch). Thus, the
+        ACQ must be triggered on every readout pulse and the processing must not average over the 'segment' axis. Note that the drive frame
+        (i.e. virtual Z-rotations) carries over from one block to the next; this is equivalent to running the circuits individually as every
+        circuit starts in the ground state.
+        '''
+        assert isinstance(circuits_per_batch, int) and circuits_per_batch > 0, "circuits_per_batch must be a positive integer."
+        if circuits_per_batch == 1:
+            return [self.run_circuit_direct(x, expt_config, load_time, readout_time, normalise) for x in gate_lists]
+        ret_vals = []
+        for m in range(0, len(gate_lists), circuits_per_batch):
+            ret_vals += self._run_circuit_batch(gate_lists[m:m+circuits_per_batch], expt_config, load_time, readout_time, normalise)
+        return ret_vals
+
+    def _run_circuit_batch(self, gate_lists, expt_config, load_time, readout_time, normalise):
+        gate_segs = [self.generate_gates(x) for x in gate_lists]
+        #Every block is padded (at the start of the load time) to fit the longest circuit
+        max_gate_time = max([sum([x.Duration for x in cur_segs]) for cur_segs in gate_segs])
+        block_time = load_time + max_gate_time + 5e-9 + readout_time
+        circuits = []
+        for m, cur_segs in enumerate(gate_segs):
+            circuits.append(WFS_Group(f"circuit{m}", [WFS_Constant("init", None, -1, 0.0)] + cur_segs + [
+                WFS_Constant("pad", None, 5e-9, 0.0),
+                WFS_Constant("read", None, readout_time, 0.0)
+            ], time_len=block_time))
+        wfm = WaveformGeneric(['qubit'], ['readout'])
+        wfm.set_waveform('qubit', [WFS_Constant("SEQPAD", None, -1, 0.0)] + circuits)
+        wfm.set_digital_segments('readout', 'qubit', [[f"circuit{m}", 'read'] for m in range(len(circuits))])
+        self._temp_vars = expt_config.update_waveforms(wfm)
+
+        cur_acq = expt_config._hal_ACQ
+        assert cur_acq is not None, "The experiment configuration must have an ACQ to run batched circuits."
+        prev_num_segs = cur_acq.NumSegments
+        cur_acq.NumSegments = len(circuits)
+        try:
+            expt_config.prepare_instruments()
+            smpl_data = expt_config.get_data()['data']
+        finally:
+            cur_acq.NumSegments = prev_num_segs
+        ch_names = sorted([x for x in smpl_data['data']])
+        assert len(ch_names) == 2, "The acquisition and processing should only return two channels in the output for I and Q respectively."
+        assert 'segment' in smpl_data['parameters'], "The acquisition and processing must retain the 'segment' axis when running batched circuits."
+        seg_axis = smpl_data['parameters'].index('segment')
+
+        #Demultiplex the segments back onto the individual circuits
+        ret_vals = []
+        for m in range(len(circuits)):
+            i_val = np.take(smpl_data['data'][ch_names[0]], [m], axis=seg_axis)
+            q_val = np.take(smpl_data['data'][ch_names[1]], [m], axis=seg_axis)
+            if normalise and self.norm_calib != None:
+                ret_vals.append(self.norm_calib.normalise_data(np.array([[i_val[0], q_val[0]]]))[0])
+            else:
+                ret_vals.append((i_val, q_val))
+        return ret_vals
+
 # QubitGatesBase.compute_inverse_rotation_Pauli_Matrices( QubitGatesBase.get_rotation_from_Pauli_Matrix('X') )
 # a=0
\ No newline at end of file